@@ -6,7 +6,7 @@ A Flask-based dashboard for exploring ClickHouse analytics
 
 import os
 from flask import Flask, render_template, jsonify, request
-from clickhouse_driver import Client
+from clickhouse_common import ClickHouseConfig, NativePool
 import pandas as pd
 import plotly.graph_objs as go
 import plotly.utils
@@ -22,15 +22,12 @@ CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER', 'demo_user')
 CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD', 'demo_password')
 CLICKHOUSE_DB = os.getenv('CLICKHOUSE_DB', 'demo_db')
 
-# Initialize ClickHouse client
+# Pooled native connections shared by all requests; each query checks one out
+clickhouse_pool = NativePool(ClickHouseConfig(CLICKHOUSE_HOST, CLICKHOUSE_PORT, CLICKHOUSE_USER, CLICKHOUSE_PASSWORD,
+                                              CLICKHOUSE_DB, service='dashboard'), workload='dashboard')
+
 def get_clickhouse_client():
-    return Client(
-        host=CLICKHOUSE_HOST,
-        port=CLICKHOUSE_PORT,
-        user=CLICKHOUSE_USER,
-        password=CLICKHOUSE_PASSWORD,
-        database=CLICKHOUSE_DB
-    )
+    return clickhouse_pool
 
 @app.route('/')
 def dashboard():
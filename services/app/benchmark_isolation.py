@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Workload isolation benchmark
+Measures dashboard API latency alone and while heavy chat-style queries run as the chat user,
+and checks that dashboard p99 stays within a bound of the idle p99. --compare-shared repeats the
+loaded phase with the heavy queries sent as the dashboard user, to show the cost without isolation.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from clickhouse_common import ClickHouseConfig, NativePool
+
+import app as dashboard
+
+# The chat service's user; the dashboard's own comes from CLICKHOUSE_USER like the app
+CHAT_CLICKHOUSE_USER = os.getenv('CHAT_CLICKHOUSE_USER', 'chat_user')
+CHAT_CLICKHOUSE_PASSWORD = os.getenv('CHAT_CLICKHOUSE_PASSWORD', 'chat_password')
+
+ENDPOINTS = ['/api/stats', '/api/daily-events', '/api/event-types', '/api/top-countries',
+             '/api/revenue-by-month', '/api/top-products', '/api/user-segments']
+# CPU-bound scan of every event, many times over: the kind of query a careless question produces
+HEAVY_SQL = "SELECT sum(sipHash64(event_id, n)) FROM events ARRAY JOIN range(200) AS n"
+# What the chat service adds to every generated query (sql_guard.execution_settings)
+HEAVY_SETTINGS = {'readonly': 2, 'max_execution_time': 15, 'max_threads': 4}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies: List[float], errors: int) -> Dict:
+    return {'requests': len(latencies), 'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1)}
+
+
+def run_dashboard(duration: float, workers: int) -> Dict:
+    """Request every dashboard endpoint in turn from `workers` threads for `duration` seconds"""
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker(offset: int):
+        client = dashboard.app.test_client()
+        index = offset
+        while time.time() < deadline:
+            start = time.time()
+            response = client.get(ENDPOINTS[index % len(ENDPOINTS)])
+            elapsed = time.time() - start
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            index += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0])
+
+
+def start_heavy_load(pool: NativePool, sql: str, concurrency: int, stop: threading.Event) -> Dict:
+    """Run the heavy query back to back from `concurrency` threads until stop is set"""
+    outcome = {'completed': 0, 'failed': 0, 'errors': {}, 'threads': []}
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                pool.execute(sql, settings=HEAVY_SETTINGS, workload='interactive')
+                with lock:
+                    outcome['completed'] += 1
+            except Exception as e:
+                with lock:
+                    outcome['failed'] += 1
+                    name = str(e).split('.')[0][:80]
+                    outcome['errors'][name] = outcome['errors'].get(name, 0) + 1
+
+    for _ in range(concurrency):
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        outcome['threads'].append(thread)
+    return outcome
+
+
+def loaded_phase(name: str, pool: NativePool, args) -> Dict:
+    print(f"🔥 {name}: {args.chat_concurrency} heavy queries as {pool.config.user} "
+          f"while the dashboard is measured for {args.duration:g}s")
+    stop = threading.Event()
+    outcome = start_heavy_load(pool, args.heavy_sql, args.chat_concurrency, stop)
+    time.sleep(args.ramp)  # let the heavy queries take hold of the CPUs
+    result = run_dashboard(args.duration, args.workers)
+    stop.set()
+    for thread in outcome.pop('threads'):
+        thread.join(timeout=30)
+    result['heavy_queries'] = outcome
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard latency with and without heavy chat queries")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each phase measures the dashboard")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent dashboard clients")
+    parser.add_argument("--chat-concurrency", type=int, default=4, help="Heavy queries running at once")
+    parser.add_argument("--ramp", type=float, default=2, help="Seconds between starting the heavy queries and measuring")
+    parser.add_argument("--heavy-sql", default=HEAVY_SQL)
+    parser.add_argument("--max-p99-ratio", type=float, default=1.5,
+                        help="Fail when dashboard p99 under chat load exceeds the idle p99 by this factor")
+    parser.add_argument("--compare-shared", action="store_true",
+                        help="Also run the heavy queries as the dashboard user (no isolation)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    chat_pool = NativePool(ClickHouseConfig(dashboard.CLICKHOUSE_HOST, dashboard.CLICKHOUSE_PORT, CHAT_CLICKHOUSE_USER,
+                                            CHAT_CLICKHOUSE_PASSWORD, dashboard.CLICKHOUSE_DB, service='chat',
+                                            retries=0), workload='interactive')
+
+    print(f"🚀 Warming up the dashboard endpoints as {dashboard.CLICKHOUSE_USER}")
+    run_dashboard(2, 1)
+    print(f"📊 Idle: dashboard alone for {args.duration:g}s")
+    phases = {'idle': run_dashboard(args.duration, args.workers)}
+    phases['isolated'] = loaded_phase('Isolated', chat_pool, args)
+    if args.compare_shared:
+        shared_pool = NativePool(dashboard.clickhouse_pool.config._replace(retries=0), workload='interactive')
+        phases['shared'] = loaded_phase('Shared', shared_pool, args)
+
+    idle_p99 = phases['idle']['p99_ms'] or 1.0
+    print(f"\n{'Phase':<10} {'Requests':>9} {'Errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'p99 x':>7} "
+          f"{'Heavy ok/failed':>16}")
+    for name, result in phases.items():
+        heavy = result.get('heavy_queries')
+        heavy_text = f"{heavy['completed']}/{heavy['failed']}" if heavy else '-'
+        print(f"{name:<10} {result['requests']:>9} {result['errors']:>7} {result['p50_ms']:>9.1f} "
+              f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['p99_ms'] / idle_p99:>7.2f} {heavy_text:>16}")
+        for error, count in (heavy or {}).get('errors', {}).items():
+            print(f"    ↳ {count} x {error}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'phases': phases}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    ratio = phases['isolated']['p99_ms'] / idle_p99
+    if ratio > args.max_p99_ratio:
+        print(f"❌ Dashboard p99 grew {ratio:.2f}x under chat load (limit {args.max_p99_ratio:g}x)")
+        sys.exit(1)
+    print(f"✅ Dashboard p99 stayed within {args.max_p99_ratio:g}x of idle under chat load ({ratio:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
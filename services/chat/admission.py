@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Admission control for the chat service
+Per-client token buckets, a bounded queue that hands free slots to waiting clients in turn
+(so one client's burst cannot starve the others) and a global cap on concurrent ClickHouse queries
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+from chat_metrics import ChatMetrics
+
+CHAT_RATE_LIMIT = float(os.getenv('CHAT_RATE_LIMIT', '30'))  # questions per minute per client
+CHAT_RATE_BURST = int(os.getenv('CHAT_RATE_BURST', '10'))  # questions a client may ask back to back
+CHAT_MAX_ACTIVE = int(os.getenv('CHAT_MAX_ACTIVE', '8'))  # questions answered at the same time
+CHAT_MAX_QUEUE = int(os.getenv('CHAT_MAX_QUEUE', '32'))  # questions waiting for a slot
+CHAT_QUEUE_TIMEOUT = float(os.getenv('CHAT_QUEUE_TIMEOUT', '20'))  # seconds a question may wait
+CHAT_MAX_CLICKHOUSE_QUERIES = int(os.getenv('CHAT_MAX_CLICKHOUSE_QUERIES', '4'))  # in flight, all requests
+CHAT_CLICKHOUSE_WAIT = float(os.getenv('CHAT_CLICKHOUSE_WAIT', '10'))  # seconds to wait for a query slot
+BUCKET_IDLE_SECONDS = 600  # forget clients whose bucket has been full this long
+
+
+class Rejected(Exception):
+    """The request is turned away; status is the HTTP code to answer with"""
+
+    def __init__(self, message: str, status: int, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimiter:
+    """Token bucket per client: CHAT_RATE_BURST tokens, refilled at CHAT_RATE_LIMIT per minute"""
+
+    def __init__(self, per_minute: float = CHAT_RATE_LIMIT, burst: int = CHAT_RATE_BURST):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, Tuple[float, float]] = {}  # client -> (tokens, updated)
+
+    def take(self, client: str):
+        """Spend one token or raise Rejected (429) with the time until the next token"""
+        with self.lock:
+            now = time.time()
+            tokens, updated = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[client] = (tokens, now)
+                raise Rejected("Too many questions; please slow down", 429, (1 - tokens) / self.rate)
+            self.buckets[client] = (tokens - 1, now)
+            if len(self.buckets) > 1000:
+                self.prune(now)
+
+    def prune(self, now: float):
+        idle = self.burst / self.rate + BUCKET_IDLE_SECONDS
+        for client in [c for c, (_, updated) in self.buckets.items() if now - updated > idle]:
+            del self.buckets[client]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'per_minute': self.rate * 60, 'burst': self.burst, 'clients': len(self.buckets)}
+
+
+class Ticket:
+    """A granted slot; release() is safe to call more than once"""
+
+    def __init__(self, scheduler: 'FairScheduler', client: str):
+        self.scheduler = scheduler
+        self.client = client
+        self.event = threading.Event()
+        self.granted = False
+        self.released = False
+        self.started = time.time()
+        self.started_running = None
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+class FairScheduler:
+    """At most max_active requests run; up to max_queue wait, and a freed slot goes to the next
+    client in rotation rather than to the oldest request"""
+
+    def __init__(self, metrics: ChatMetrics, max_active: int = CHAT_MAX_ACTIVE, max_queue: int = CHAT_MAX_QUEUE,
+                 timeout: float = CHAT_QUEUE_TIMEOUT):
+        self.metrics = metrics
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting: 'OrderedDict[str, deque]' = OrderedDict()  # client -> its waiting tickets
+        self.queued = 0
+        self.service_time = 1.0  # moving average of how long a slot is held, for Retry-After
+
+    def retry_after(self) -> float:
+        return self.service_time * (self.queued + 1) / self.max_active
+
+    def acquire(self, client: str) -> Ticket:
+        """A slot for the client, after waiting in the queue if needed; raises Rejected (503)"""
+        ticket = Ticket(self, client)
+        with self.lock:
+            if self.active < self.max_active and not self.queued:
+                self.grant(ticket)
+            elif self.queued >= self.max_queue:
+                self.metrics.count('rejected_queue_full')
+                raise Rejected("The chat service is busy; please try again shortly", 503, self.retry_after())
+            else:
+                self.waiting.setdefault(client, deque()).append(ticket)
+                self.queued += 1
+        if not ticket.event.wait(self.timeout):
+            with self.lock:
+                if not ticket.granted:
+                    self.waiting[client].remove(ticket)
+                    if not self.waiting[client]:
+                        del self.waiting[client]
+                    self.queued -= 1
+                    self.metrics.count('rejected_queue_timeout')
+                    raise Rejected("Timed out waiting for a free slot; please try again shortly", 503,
+                                   self.retry_after())
+        self.metrics.observe('queue_wait', time.time() - ticket.started)
+        return ticket
+
+    def grant(self, ticket: Ticket):
+        """Called with the lock held"""
+        self.active += 1
+        ticket.granted = True
+        ticket.started_running = time.time()
+        ticket.event.set()
+
+    def release(self, ticket: Ticket):
+        with self.lock:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            self.active -= 1
+            held = time.time() - ticket.started_running
+            self.service_time = 0.9 * self.service_time + 0.1 * held
+            if self.waiting and self.active < self.max_active:
+                # Round robin over clients: take the first client's oldest ticket, then move it to the back
+                client, tickets = next(iter(self.waiting.items()))
+                next_ticket = tickets.popleft()
+                if tickets:
+                    self.waiting.move_to_end(client)
+                else:
+                    del self.waiting[client]
+                self.queued -= 1
+                self.grant(next_ticket)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'active': self.active, 'max_active': self.max_active, 'queued': self.queued,
+                    'max_queue': self.max_queue, 'clients_waiting': len(self.waiting),
+                    'service_time_s': round(self.service_time, 2)}
+
+
+class QuerySlots:
+    """Global cap on ClickHouse queries running for the chat service"""
+
+    def __init__(self, metrics: ChatMetrics, limit: int = CHAT_MAX_CLICKHOUSE_QUERIES,
+                 wait: float = CHAT_CLICKHOUSE_WAIT):
+        self.metrics = metrics
+        self.limit = limit
+        self.wait = wait
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def __enter__(self):
+        start = time.time()
+        if not self.semaphore.acquire(timeout=self.wait):
+            self.metrics.count('rejected_clickhouse_busy')
+            raise Rejected("ClickHouse is busy with other questions; please try again shortly", 503, self.wait)
+        self.metrics.observe('clickhouse_wait', time.time() - start)
+        with self.lock:
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.in_flight -= 1
+        self.semaphore.release()
+        return False
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'in_flight': self.in_flight, 'max': self.limit}
+
+
+def client_key(remote_addr: Optional[str], forwarded_for: Optional[str], trust_proxy: bool) -> str:
+    """Who to rate limit: the first X-Forwarded-For hop behind a trusted proxy, else the peer address"""
+    if trust_proxy and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'unknown'
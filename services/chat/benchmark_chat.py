@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Latency breakdown benchmark for the chat service
+Runs a golden question corpus through the service against a local ClickHouse with the stub LLM,
+reports per-stage timings, answer accuracy against the expected SQL and rows read per question,
+and flags regressions against the previous run
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from chat_metrics import percentile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Stage order of the pipeline; 'response' is Flask and JSON serialization around the answer
+STAGES = ('schema', 'template', 'sql_cache', 'prompt', 'llm', 'parse', 'send', 'result_cache', 'rewrite', 'guard',
+          'clickhouse', 'store', 'response')
+MIN_REGRESSION_MS = 5.0  # ignore slowdowns smaller than this, whatever the ratio
+
+
+def normalize_rows(rows: List, ordered: bool) -> List:
+    """Rows as comparable text: driver values and JSON-decoded values match, floats are rounded"""
+    rows = json.loads(json.dumps([list(row) for row in rows], default=str))
+    rows = [[f"{value:.6g}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    return rows if ordered else sorted(rows)
+
+
+def expected_rows(client, case: Dict, settings: Dict) -> List:
+    if 'expected_rows' in case:
+        return case['expected_rows']
+    return client.execute(case['expected_sql'], settings=settings)
+
+
+def rows_read(client, query_ids: List[str]) -> Dict[str, int]:
+    """read_rows per query id from system.query_log (empty when the log is not readable)"""
+    if not query_ids:
+        return {}
+    try:
+        client.execute("SYSTEM FLUSH LOGS")
+        return dict(client.execute(
+            "SELECT query_id, read_rows FROM system.query_log "
+            "WHERE type = 'QueryFinish' AND query_id IN %(ids)s", {'ids': tuple(query_ids)}))
+    except Exception as e:
+        print(f"⚠️  Cannot read system.query_log ({e}); reporting estimated rows instead")
+        return {}
+
+
+def summarize(values: List[float]) -> Dict:
+    return {'p50_ms': round(percentile(values, 0.5), 1), 'p95_ms': round(percentile(values, 0.95), 1),
+            'mean_ms': round(sum(values) / len(values), 1)}
+
+
+def run_case(app, client, case: Dict, runs: int, settings: Dict) -> Dict:
+    """Ask one question `runs` times; accuracy and rows read come from the first run"""
+    stage_times: Dict[str, List[float]] = {}
+    totals = []
+    first = None
+    for _ in range(runs):
+        start = time.time()
+        response = app.post('/api/chat', json={'question': case['question']})
+        wall = (time.time() - start) * 1000
+        data = response.get_json()
+        if data.get('cursor'):
+            app.delete(f"/api/chat/cursor/{data['cursor']}")
+        stages = dict(data.get('stages', {}))
+        stages['response'] = max(0.0, wall - data.get('elapsed_ms', wall))
+        for name, ms in stages.items():
+            stage_times.setdefault(name, []).append(ms)
+        totals.append(wall)
+        first = first or data
+
+    result = {'question': case['question'], 'path': first.get('path'), 'template': first.get('template'),
+              'query': first.get('query'), 'query_id': first.get('query_id'),
+              'estimated_rows': (first.get('estimate') or {}).get('rows'),
+              'rewrite': (first.get('rewrite') or {}).get('table'),
+              'total': summarize(totals), 'stages': {name: summarize(v) for name, v in stage_times.items()}}
+    if case.get('no_template') and first.get('path') == 'template':
+        # The question asks for something the matched template cannot express
+        result.update(accurate=False, note=f"answered by template {first.get('template')}, expected the LLM")
+    elif first.get('error') or first.get('query_error') or 'results' not in first:
+        result.update(accurate=False, note=first.get('error') or first.get('query_error') or 'no query')
+    elif first.get('cursor'):
+        result.update(accurate=False, note='result did not fit in one page')
+    else:
+        ordered = 'order by' in case.get('expected_sql', '').lower()
+        expected = normalize_rows(expected_rows(client, case, settings), ordered)
+        result['accurate'] = normalize_rows(first['results'], ordered) == expected
+        if not result['accurate']:
+            result['note'] = f"{len(first['results'])} rows, expected {len(expected)}"
+    return result
+
+
+def find_regressions(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Slower stages, lower accuracy, questions that stopped matching and questions reading more rows"""
+    regressions = []
+    for name, stats in report['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if before and stats['p50_ms'] > before['p50_ms'] * (1 + threshold) \
+                and stats['p50_ms'] - before['p50_ms'] > MIN_REGRESSION_MS:
+            regressions.append(f"stage {name}: p50 {before['p50_ms']}ms -> {stats['p50_ms']}ms")
+    if report['accuracy'] < baseline.get('accuracy', 0):
+        regressions.append(f"accuracy {baseline['accuracy']:.0%} -> {report['accuracy']:.0%}")
+    previous = {question['question']: question for question in baseline.get('questions', [])}
+    for question in report['questions']:
+        before = previous.get(question['question'])
+        if not before:
+            continue
+        if before.get('accurate') and not question['accurate']:
+            regressions.append(f"no longer accurate: {question['question']}")
+        if before.get('rows_read') and question.get('rows_read') \
+                and question['rows_read'] > before['rows_read'] * (1 + threshold):
+            regressions.append(f"rows read {before['rows_read']:,} -> {question['rows_read']:,}: "
+                               f"{question['question']}")
+    return regressions
+
+
+def load_baseline(path: str) -> Optional[Dict]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat service stage by stage on a golden corpus")
+    parser.add_argument("--corpus", default=os.path.join(SCRIPT_DIR, "benchmark_corpus.json"))
+    parser.add_argument("--runs", type=int, default=3, help="Times each question is asked")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Stub LLM delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=5, help="Stub LLM delay between tokens")
+    parser.add_argument("--no-templates", action="store_true", help="Send every question to the LLM")
+    parser.add_argument("--cache", action="store_true", help="Keep the question and result caches on")
+    parser.add_argument("--output", default="chat_benchmark.json", help="Where to write this run's report")
+    parser.add_argument("--baseline", help="Report to compare with (default: the previous --output)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    # The service reads its configuration at import time
+    os.environ['LLM_PROVIDER'] = 'stub'
+    os.environ['STUB_LLM_LATENCY_MS'] = str(args.llm_latency_ms)
+    os.environ['STUB_LLM_TOKEN_MS'] = str(args.token_ms)
+    os.environ['CHAT_CACHE_DIR'] = ''
+    # Every question comes from one test client: admission control would turn most of them into 429s
+    os.environ['CHAT_RATE_LIMIT'] = os.environ['CHAT_RATE_BURST'] = os.environ['CHAT_MAX_QUEUE'] = str(10 ** 6)
+    os.environ.setdefault('CLICKHOUSE_HOST', 'localhost')
+    if args.no_templates:
+        os.environ['CHAT_TEMPLATES'] = 'false'
+    if not args.cache:
+        os.environ['CHAT_SQL_CACHE_SIZE'] = '0'
+        os.environ['CHAT_RESULT_CACHE_SIZE'] = '0'
+    import chat_service
+    import sql_guard
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+    baseline = load_baseline(args.baseline or args.output)
+    app = chat_service.app.test_client()
+    client = chat_service.get_clickhouse_client()
+    settings = sql_guard.execution_settings()
+
+    print(f"🚀 {len(corpus)} questions x {args.runs} runs, stub LLM {args.llm_latency_ms:g}ms "
+          f"+ {args.token_ms:g}ms/token, templates {'off' if args.no_templates else 'on'}, "
+          f"caches {'on' if args.cache else 'off'}")
+    # Warm the schema catalog so the statistics scans do not run alongside the first questions
+    chat_service.get_schema_info()
+    chat_service.schema_catalog.wait()
+    questions = [run_case(app, client, case, args.runs, settings) for case in corpus]
+
+    read = rows_read(client, [question['query_id'] for question in questions if question.get('query_id')])
+    for question in questions:
+        question['rows_read'] = read.get(question.pop('query_id', None), question['estimated_rows'])
+
+    stage_values: Dict[str, List[float]] = {}
+    for question in questions:
+        for name, stats in question['stages'].items():
+            stage_values.setdefault(name, []).append(stats['p50_ms'])
+    report = {
+        'config': vars(args),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'accuracy': sum(question['accurate'] for question in questions) / len(questions),
+        'total': summarize([question['total']['p50_ms'] for question in questions]),
+        'stages': {name: summarize(stage_values[name]) for name in STAGES if name in stage_values},
+        'questions': questions,
+    }
+
+    print(f"\n{'Question':<58} {'Path':<9} {'OK':<3} {'Rows read':>12} {'p50 ms':>9}")
+    for question in questions:
+        rows = f"{question['rows_read']:,}" if question['rows_read'] is not None else '-'
+        print(f"{question['question'][:57]:<58} {question['path'] or '-':<9} "
+              f"{'✅' if question['accurate'] else '❌':<3} {rows:>12} {question['total']['p50_ms']:>9.1f}")
+        if not question['accurate']:
+            print(f"    ↳ {question.get('note', '')}")
+    print("\n⏱️  Stage timings (per-question p50, then p50/p95 across questions)")
+    for name, stats in report['stages'].items():
+        print(f"  {name:<13} p50 {stats['p50_ms']:>8.1f}ms  p95 {stats['p95_ms']:>8.1f}ms")
+    print(f"  {'total':<13} p50 {report['total']['p50_ms']:>8.1f}ms  p95 {report['total']['p95_ms']:>8.1f}ms")
+    print(f"\n🎯 Accuracy: {report['accuracy']:.0%} of {len(questions)} questions match the expected results")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"💾 Report written to {args.output}")
+
+    if baseline is None:
+        print("ℹ️  No previous run to compare with")
+        return
+    regressions = find_regressions(report, baseline, args.threshold)
+    if not regressions:
+        print(f"✅ No regressions against the run of {baseline.get('finished_at', 'unknown time')}")
+        return
+    print(f"⚠️  {len(regressions)} regressions against the run of {baseline.get('finished_at', 'unknown time')}:")
+    for regression in regressions:
+        print(f"  - {regression}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
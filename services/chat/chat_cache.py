@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Two-level cache for the chat service
+Level 1 maps a normalized question to the SQL (and explanation) the model generated for it;
+level 2 keeps query results for a short TTL. Both are LRU-bounded; level 1 can be persisted to disk.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHAT_SQL_CACHE_SIZE = int(os.getenv('CHAT_SQL_CACHE_SIZE', '512'))
+CHAT_RESULT_CACHE_SIZE = int(os.getenv('CHAT_RESULT_CACHE_SIZE', '256'))
+CHAT_RESULT_CACHE_TTL = float(os.getenv('CHAT_RESULT_CACHE_TTL', '60'))  # seconds; the data keeps streaming in
+CHAT_CACHE_DIR = os.getenv('CHAT_CACHE_DIR', '')  # empty: memory only
+CHAT_CACHE_SAVE_INTERVAL = float(os.getenv('CHAT_CACHE_SAVE_INTERVAL', '10'))  # seconds between writes to disk
+
+NUMBER_WORDS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6', 'seven': '7', 'eight': '8',
+    'nine': '9', 'ten': '10', 'eleven': '11', 'twelve': '12', 'fifteen': '15', 'twenty': '20',
+    'thirty': '30', 'fifty': '50', 'hundred': '100',
+}
+NUMBER_PATTERN = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])')
+
+
+def normalize_question(question: str) -> Tuple[str, List[str]]:
+    """Fold case, whitespace, punctuation and numbers; returns the key template and the numbers in order.
+    "Top 5 countries?" and "top five   countries" both become ("top {0} countries", ["5"])."""
+    text = question.lower().replace(',', '')  # also "1,000" -> "1000"
+    text = re.sub(r"[^\w\s.%'-]", ' ', text)
+    words = [NUMBER_WORDS.get(word, word) for word in text.split()]
+    text = ' '.join(words).strip(' .')
+    numbers = []
+
+    def fold(match):
+        value = match.group(0)
+        if '.' in value:
+            value = value.rstrip('0').rstrip('.')
+        numbers.append(value.lstrip('0') or '0')
+        return '{' + str(len(numbers) - 1) + '}'
+
+    return NUMBER_PATTERN.sub(fold, text), numbers
+
+
+def normalize_sql(sql: str) -> str:
+    return ' '.join(sql.split()).rstrip(';')
+
+
+def number_pattern(numbers: List[str]):
+    return re.compile(r'(?<![\w.])(' + '|'.join(re.escape(number) for number in numbers) + r')(?![\w.])')
+
+
+def to_template(text: str, numbers: List[str], unique: bool = True) -> Optional[str]:
+    """Replace the question's numbers in the text by their placeholders. With `unique`, every number
+    must occur exactly once (so "top 5" can become "top 10"); otherwise returns None."""
+    if len(set(numbers)) != len(numbers):
+        return None
+    escaped = text.replace('{', '{{').replace('}', '}}')
+    if not numbers:
+        return escaped
+    pattern = number_pattern(numbers)
+    if unique and sorted(pattern.findall(escaped)) != sorted(numbers):
+        return None
+    return pattern.sub(lambda match: '{' + str(numbers.index(match.group(1))) + '}', escaped)
+
+
+def jsonable(value: Any) -> Any:
+    """Values as they are returned to the browser, so cached and fresh results look the same"""
+    return json.loads(json.dumps(value, default=str))
+
+
+class LRUCache:
+    """Thread-safe LRU map with optional per-entry expiry and JSON persistence. Changes are written
+    to disk by a background thread every save_interval seconds and at exit, never on the request path."""
+
+    def __init__(self, name: str, max_entries: int, ttl: Optional[float] = None, directory: str = CHAT_CACHE_DIR,
+                 save_interval: float = CHAT_CACHE_SAVE_INTERVAL):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = os.path.join(directory, f"{name}.json") if directory else None
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # one writer of the file at a time
+        self.entries: 'OrderedDict[str, Tuple[Optional[float], Any]]' = OrderedDict()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+        if self.path:
+            threading.Thread(target=self.save_loop, args=(save_interval,), daemon=True,
+                             name=f"{name}-cache-save").start()
+            atexit.register(self.save)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.lookup([key])[1]
+
+    def lookup(self, keys: List[str]) -> Tuple[Optional[int], Optional[Any]]:
+        """Index and value of the first live key, counted as a single hit or miss"""
+        with self.lock:
+            for index, key in enumerate(keys):
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] is not None and entry[0] < time.time():
+                    del self.entries[key]
+                    entry = None
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return index, entry[1]
+            self.misses += 1
+            return None, None
+
+    def put(self, key: str, value: Any):
+        with self.lock:
+            expires = time.time() + self.ttl if self.ttl else None
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cache file %s: %s", self.path, e)
+            return
+        now = time.time()
+        for key, expires, value in entries[-self.max_entries:]:
+            if expires is None or expires > now:
+                self.entries[key] = (expires, value)
+
+    def save(self):
+        """Write the cache atomically if it changed; lookups only wait for the snapshot, not the disk"""
+        if not self.path:
+            return
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                snapshot = [[key, expires, value] for key, (expires, value) in self.entries.items()]
+                self.dirty = False
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + ".tmp", 'w') as f:
+                    json.dump(snapshot, f)
+                os.replace(self.path + ".tmp", self.path)
+            except OSError as e:
+                logger.warning("Could not write cache file %s: %s", self.path, e)
+                with self.lock:
+                    self.dirty = True
+
+    def save_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.save()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                    'persisted': self.path is not None}
+
+
+class ChatCache:
+    """Question -> SQL cache in front of the model and SQL -> rows cache in front of ClickHouse"""
+
+    def __init__(self, directory: str = CHAT_CACHE_DIR):
+        self.sql = LRUCache('question_sql', CHAT_SQL_CACHE_SIZE, directory=directory)
+        # Results expire within a minute and carry whole row sets: not worth writing to disk
+        self.results = LRUCache('query_results', CHAT_RESULT_CACHE_SIZE, CHAT_RESULT_CACHE_TTL, directory='')
+
+    @staticmethod
+    def question_keys(question: str, schema_version: str) -> Tuple[str, str, List[str]]:
+        """Keys with numbers folded and with numbers kept; a schema change invalidates both"""
+        template, numbers = normalize_question(question)
+        return f"{schema_version}:{template}", f"{schema_version}:{template.format(*numbers)}", numbers
+
+    def get_sql(self, question: str, schema_version: str) -> Optional[Dict]:
+        """Cached {'sql', 'explanation'} for the question, with its numbers filled in"""
+        folded_key, exact_key, numbers = self.question_keys(question, schema_version)
+        index, entry = self.sql.lookup([folded_key, exact_key])
+        if index == 0:
+            return {'sql': entry['sql'].format(*numbers), 'explanation': entry['explanation'].format(*numbers)}
+        return entry
+
+    def put_sql(self, question: str, schema_version: str, sql: str, explanation: str):
+        folded_key, exact_key, numbers = self.question_keys(question, schema_version)
+        template = to_template(sql, numbers)
+        if template is None:
+            # A number is ambiguous in the SQL (or missing): only the same numbers may reuse it
+            self.sql.put(exact_key, {'sql': sql, 'explanation': explanation})
+            return
+        self.sql.put(folded_key, {'sql': template, 'explanation': to_template(explanation, numbers, unique=False)})
+
+    def get_results(self, sql: str) -> Optional[Dict]:
+        return self.results.get(normalize_sql(sql))
+
+    def put_results(self, sql: str, result: Dict) -> Dict:
+        """Store a complete result (columns, rows, row count)"""
+        result = jsonable(result)
+        self.results.put(normalize_sql(sql), result)
+        return result
+
+    def stats(self) -> Dict:
+        return {'sql': self.sql.stats(), 'results': self.results.stats()}
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+In-memory metrics for the chat service
+Counters plus latency summaries (mean and percentiles over the most recent observations)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', '1000'))  # observations kept per latency for percentiles
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ChatMetrics:
+    """Thread-safe counters and latency windows"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.window = window
+        self.counters: Dict[str, float] = {}
+        self.latencies: Dict[str, deque] = {}
+        self.latency_counts: Dict[str, int] = {}
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(name, deque(maxlen=self.window)).append(seconds)
+            self.latency_counts[name] = self.latency_counts.get(name, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            latency = {}
+            for name, values in self.latencies.items():
+                latency[name] = {
+                    'count': self.latency_counts[name],
+                    'mean_ms': round(sum(values) / len(values) * 1000, 1),
+                    'p50_ms': round(percentile(values, 0.5) * 1000, 1),
+                    'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                    'max_ms': round(max(values) * 1000, 1),
+                }
+            return {'counters': dict(self.counters), 'latency': latency}
+
+
+class StageTimer:
+    """Wall time of the consecutive stages of one request, in milliseconds"""
+
+    def __init__(self, metrics: Optional[ChatMetrics] = None):
+        self.metrics = metrics
+        self.stages: Dict[str, float] = {}
+        self.mark = time.time()
+
+    def lap(self, name: str):
+        """Time since the previous lap counts towards this stage"""
+        now = time.time()
+        self.stages[name] = round(self.stages.get(name, 0) + (now - self.mark) * 1000, 1)
+        if self.metrics:
+            self.metrics.observe(f'stage_{name}', now - self.mark)
+        self.mark = now
@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 """
 AI Chat Service for ClickHouse Analytics
-Uses Azure OpenAI to answer questions about the data
+Uses Azure OpenAI (or an offline stub) to answer questions about the data
 """
 
 import os
 import json
-from flask import Flask, request, jsonify, render_template_string
-from clickhouse_driver import Client
-from openai import AzureOpenAI
+import time
+from typing import Dict, Iterator, Optional, Tuple
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
+from clickhouse_common import ClickHouseConfig, NativePool, QueryStats, add_query_hook, make_query_id, workload_settings
+
+import sql_guard
+from admission import FairScheduler, QuerySlots, RateLimiter, Rejected, Ticket, client_key
+from chat_cache import ChatCache
+from chat_metrics import ChatMetrics, StageTimer
+from llm_providers import AzureProvider, LLMTimeout, StubProvider
+from query_templates import TemplateLibrary
+from rollup_rewriter import CHAT_ROLLUP_REWRITE, RollupRewriter
+from result_cursors import CursorStore, ResultCursor, page_response
+from schema_catalog import SchemaCatalog
 
 app = Flask(__name__)
 
@@ -25,130 +36,131 @@ AZURE_OPENAI_API_KEY = os.getenv('AZURE_OPENAI_API_KEY', '')
 AZURE_OPENAI_API_VERSION = os.getenv('AZURE_OPENAI_API_VERSION', '2024-02-15-preview')
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-4')
 
+# LLM backend: azure, or stub for a deterministic offline model
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'azure')
+
+# Rate limit by the X-Forwarded-For client address (only behind a proxy that sets it)
+CHAT_TRUST_PROXY = os.getenv('CHAT_TRUST_PROXY', 'false').lower() == 'true'
+
+# Answer frequent questions from pre-validated query templates instead of the LLM
+CHAT_TEMPLATES = os.getenv('CHAT_TEMPLATES', 'true').lower() == 'true'
+
+# Pooled native connections; execute() checks one out per query, result cursors hold one until closed
+clickhouse_pool = NativePool(ClickHouseConfig(CLICKHOUSE_HOST, CLICKHOUSE_PORT, CLICKHOUSE_USER, CLICKHOUSE_PASSWORD,
+                                              CLICKHOUSE_DB, service='chat'), workload='interactive')
+
 def get_clickhouse_client():
     """Get ClickHouse client"""
-    return Client(
-        host=CLICKHOUSE_HOST,
-        port=CLICKHOUSE_PORT,
-        user=CLICKHOUSE_USER,
-        password=CLICKHOUSE_PASSWORD,
-        database=CLICKHOUSE_DB
-    )
+    return clickhouse_pool
+
+def get_llm_provider():
+    """Get the LLM backend selected by LLM_PROVIDER"""
+    if LLM_PROVIDER == 'stub':
+        return StubProvider(metrics)
+    if LLM_PROVIDER == 'azure':
+        return AzureProvider(metrics, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY,
+                             AZURE_OPENAI_API_VERSION, AZURE_OPENAI_DEPLOYMENT_NAME)
+    raise ValueError(f"Unknown LLM_PROVIDER {LLM_PROVIDER!r} (expected azure or stub)")
+
+metrics = ChatMetrics()
+schema_catalog = SchemaCatalog(get_clickhouse_client)
+chat_cache = ChatCache()
+result_cursors = CursorStore()
+llm_provider = get_llm_provider()
+query_templates = TemplateLibrary()
+rollup_rewriter = RollupRewriter()
+rate_limiter = RateLimiter()
+scheduler = FairScheduler(metrics)
+query_slots = QuerySlots(metrics)
+
+def record_query(stats: QueryStats):
+    """Count ClickHouse retries and failures reported by the shared transport"""
+    if stats.attempts > 1:
+        metrics.count('clickhouse_retries', stats.attempts - 1)
+    if stats.error:
+        metrics.count('clickhouse_errors')
+
+add_query_hook(record_query)
 
 def get_schema_info():
     """Get database schema information for the AI"""
-    client = get_clickhouse_client()
-    
-    schema_info = """
-ClickHouse Database Schema:
-
-1. users table:
-   - user_id (UInt64): Unique user identifier
-   - username (String): User's username
-   - email (String): User's email address
-   - age (UInt8): User's age
-   - country (String): User's country (US, UK, DE, FR, CA, AU, JP, BR, IN, RU)
-   - registration_date (Date): When user registered
-   - registration_timestamp (DateTime): Exact registration time
-   - is_premium (UInt8): 1 if premium user, 0 if not
-   - total_spent (Decimal): Total amount spent by user
-
-2. events table:
-   - event_id (UInt64): Unique event identifier
-   - user_id (UInt64): User who performed the event
-   - event_type (String): Type of event (page_view, click, search, login, logout, purchase, add_to_cart, remove_from_cart, signup, download)
-   - event_timestamp (DateTime): When event occurred
-   - event_date (Date): Date of event (materialized from timestamp)
-   - page_url (String): URL of the page
-   - session_id (String): Session identifier
-   - device_type (String): Device used (desktop, mobile, tablet)
-   - browser (String): Browser used (Chrome, Firefox, Safari, Edge, Opera)
-   - country (String): Country where event occurred
-   - duration_seconds (UInt32): How long the event lasted
-   - revenue (Decimal): Revenue generated from this event
-
-3. products table:
-   - product_id (UInt64): Unique product identifier
-   - product_name (String): Name of the product
-   - category (String): Product category (Electronics, Clothing, Books, Home & Garden, Sports, Beauty, Toys, Automotive, Health, Food)
-   - price (Decimal): Product price
-   - created_date (Date): When product was created
-   - is_active (UInt8): 1 if active, 0 if inactive
-
-4. orders table:
-   - order_id (UInt64): Unique order identifier
-   - user_id (UInt64): User who made the order
-   - product_id (UInt64): Product that was ordered
-   - quantity (UInt32): Quantity ordered
-   - order_date (Date): Date of order
-   - order_timestamp (DateTime): Exact time of order
-   - total_amount (Decimal): Total order amount
-   - status (String): Order status (completed, pending, cancelled, refunded)
-   - payment_method (String): Payment method used
-
-5. Views available:
-   - user_analytics: Aggregated user statistics
-   - daily_user_activity: Daily user activity summary (materialized view)
-
-Sample data ranges:
-- ~15,000 users from various countries
-- ~1,500 products across 10 categories
-- ~100+ orders with realistic transaction data
-- ~200+ events tracking user interactions
-- Data spans recent months with live streaming updates
-"""
-    
-    return schema_info
+    return schema_catalog.schema_text()
 
-def get_azure_openai_client():
-    """Get Azure OpenAI client"""
-    if not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_API_KEY:
-        raise ValueError("Azure OpenAI configuration is missing. Please set AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY environment variables.")
-    
-    return AzureOpenAI(
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        api_key=AZURE_OPENAI_API_KEY,
-        api_version=AZURE_OPENAI_API_VERSION
-    )
-
-def call_azure_openai(prompt: str) -> str:
-    """Call Azure OpenAI API to get response"""
+def call_llm(prompt: str) -> Iterator[str]:
+    """Stream the LLM response; failures are returned as the response text"""
     try:
-        client = get_azure_openai_client()
-        
-        response = client.chat.completions.create(
-            model=AZURE_OPENAI_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You are an expert ClickHouse SQL analyst. Help users analyze their e-commerce data by writing efficient SQL queries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=1000
-        )
-        
-        return response.choices[0].message.content
-        
+        yield from llm_provider.stream(prompt)
     except ValueError as e:
-        return f"Configuration error: {str(e)}"
+        yield f"Configuration error: {str(e)}"
+    except LLMTimeout as e:
+        yield f"Error calling the LLM: {str(e)}"
     except Exception as e:
-        return f"Error calling Azure OpenAI: {str(e)}"
+        yield f"Error calling {llm_provider.name} LLM: {str(e)}"
 
-def execute_clickhouse_query(query: str):
+def parse_ai_response(ai_response: str) -> Tuple[Optional[str], str]:
+    """Split the AI response into its SQL query (if any) and the explanation"""
+    sql_query = None
+    explanation = ai_response
+    
+    if '```sql' in ai_response:
+        parts = ai_response.split('```sql')
+        if len(parts) > 1:
+            sql_part = parts[1].split('```')[0].strip()
+            sql_query = sql_part
+            
+            # Extract explanation: the text around the SQL block
+            remaining = parts[0] + parts[1].split('```', 1)[1] if '```' in parts[1] else parts[0]
+            explanation = remaining.strip()
+    
+    return sql_query, explanation
+
+def execute_clickhouse_query(query: str, timer: Optional[StageTimer] = None):
     """Execute ClickHouse query safely"""
+    timer = timer or StageTimer()
     try:
         client = get_clickhouse_client()
         
-        # Basic safety checks
-        query_lower = query.lower().strip()
-        if any(dangerous in query_lower for dangerous in ['drop', 'delete', 'insert', 'update', 'create', 'alter']):
-            return {"error": "Only SELECT queries are allowed for safety"}
-        
-        if not query_lower.startswith('select'):
-            return {"error": "Query must start with SELECT"}
-        
-        result = client.execute(query)
-        return {"success": True, "data": result, "query": query}
+        # At most CHAT_MAX_CLICKHOUSE_QUERIES chat queries reach the server at once
+        with query_slots:
+            timer.lap('clickhouse_wait')
+            
+            # Aggregates over raw events that a rollup can answer read the rollup instead
+            rewrite = rollup_rewriter.rewrite(client, query) if CHAT_ROLLUP_REWRITE else None
+            if rewrite:
+                metrics.count('rollup_rewrites')
+                metrics.count('rollup_rows_saved', max(0, rewrite['rows_before'] - rewrite['rows_after']))
+                query = rewrite['sql']
+            timer.lap('rewrite')
+            
+            # Single read-only SELECT, within the read budget, run with resource limits and a LIMIT
+            sql, cost = sql_guard.prepare(client, query)
+            timer.lap('guard')
+            
+            # Stream the rows and send only the first page; the rest stays on the server behind a cursor,
+            # which keeps its pooled connection until it is closed
+            query_id = make_query_id(clickhouse_pool.config.service, clickhouse_pool.workload)
+            connection = clickhouse_pool.acquire()
+            try:
+                cursor = ResultCursor(connection, sql, workload_settings('interactive', sql_guard.execution_settings()),
+                                      cost['result_rows'], sql_guard.CHAT_MAX_RESULT_ROWS, query_id=query_id,
+                                      release=clickhouse_pool.release)
+            except Exception:
+                clickhouse_pool.release(connection, reset=True)
+                raise
+            try:
+                page = cursor.fetch()
+            except Exception:
+                cursor.close()
+                raise
+        cursor_id = None if page['done'] else result_cursors.add(cursor)
+        timer.lap('clickhouse')
+        return {"success": True, "query": sql, "query_id": query_id, "estimate": cost, "rewrite": rewrite,
+                **page_response(cursor, page, cursor_id)}
         
+    except sql_guard.SQLRejected as e:
+        return {"error": f"Query rejected: {str(e)}"}
+    except Rejected as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Query execution failed: {str(e)}"}
 
@@ -172,6 +184,8 @@ IMPORTANT RULES:
 - Optimize for performance with appropriate aggregations
 - Use meaningful column aliases
 - Include LIMIT clauses for large result sets
+- Do not use SETTINGS, FORMAT or INTO OUTFILE clauses, or table functions such as url(), file() or remote()
+- Always filter large tables (events, orders) by a date range when the question allows it
 - Use date functions like toDate(), toStartOfMonth(), etc. for time-based analysis
 - For "recent" data, use time ranges like "WHERE event_timestamp >= now() - INTERVAL 30 DAY"
 
@@ -276,21 +290,125 @@ def chat_interface():
             messageDiv.appendChild(messageContent);
             messagesDiv.appendChild(messageDiv);
             messagesDiv.scrollTop = messagesDiv.scrollHeight;
+            return messageContent;
         }
 
-        function addLoading() {
-            addMessage('<i class="fas fa-spinner fa-spin"></i> Thinking and querying data...', false);
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
         }
 
-        function removeLoading() {
-            const messages = document.getElementById('chat-messages');
-            const lastMessage = messages.lastElementChild;
-            if (lastMessage && lastMessage.innerHTML.includes('fa-spinner')) {
-                messages.removeChild(lastMessage);
+        function renderAnswer(data) {
+            let responseHtml = `<strong>📊 Analysis:</strong><br>${data.explanation}`;
+            
+            if (data.query) {
+                responseHtml += `<div class="query-result"><strong>SQL Query:</strong><br><code>${data.query}</code></div>`;
+            }
+            
+            if (data.query_error) {
+                responseHtml += `<div class="query-result text-danger">❌ ${data.query_error}</div>`;
             }
+            
+            if (data.cache) {
+                const path = data.path === 'template' ? `template ${data.template}` : data.path;
+                let note = `⚡ ${path} · SQL: ${data.cache.sql} · results: ${data.cache.results} · ${data.elapsed_ms} ms`;
+                note += ` · template hit rate ${Math.round(data.template_hit_rate * 100)}%`;
+                if (data.first_token_ms !== undefined) {
+                    note += ` · first token ${data.first_token_ms} ms`;
+                }
+                if (data.estimate) {
+                    note += ` · ~${data.estimate.rows.toLocaleString()} rows read`;
+                }
+                if (data.rewrite) {
+                    note += ` · read from ${data.rewrite.table} (~${data.rewrite.rows_before.toLocaleString()} → ~${data.rewrite.rows_after.toLocaleString()} rows)`;
+                }
+                if (data.truncated) {
+                    note += ' · result truncated';
+                }
+                responseHtml += `<div><small class="text-muted">${note}</small></div>`;
+            }
+            
+            if (data.results) {
+                responseHtml += `<div class="query-result"><strong>Results:</strong><br>`;
+                if (data.results.length === 0) {
+                    responseHtml += 'No data found.';
+                } else {
+                    responseHtml += '<div style="max-height: 300px; overflow: auto;"><table class="table table-sm table-striped mt-2">';
+                    if (data.columns) {
+                        responseHtml += '<thead><tr>';
+                        data.columns.forEach(column => {
+                            responseHtml += `<th title="${column.type}">${column.name}</th>`;
+                        });
+                        responseHtml += '</tr></thead>';
+                    }
+                    responseHtml += `<tbody>${renderRows(data.results)}</tbody></table></div>`;
+                    responseHtml += `<small class="text-muted row-count">${rowCountNote(data.results.length, data)}</small>`;
+                    if (data.cursor) {
+                        responseHtml += ` <button class="btn btn-sm btn-outline-secondary" onclick="loadMore(this, '${data.cursor}', ${data.results.length})">Load more</button>`;
+                    }
+                }
+                responseHtml += '</div>';
+            } else if (data.query && !data.query_error && !data.cache) {
+                responseHtml += '<div class="loading"><i class="fas fa-spinner fa-spin"></i> Running query...</div>';
+            }
+            
+            return responseHtml;
+        }
+
+        function renderRows(rows) {
+            let html = '';
+            rows.forEach(row => {
+                html += '<tr>';
+                row.forEach(cell => {
+                    html += `<td>${cell}</td>`;
+                });
+                html += '</tr>';
+            });
+            return html;
+        }
+
+        function rowCountNote(shown, page) {
+            const total = page.total_rows || {};
+            let note = `Showing ${shown.toLocaleString()}`;
+            if (total.exact) {
+                note += ` of ${total.rows.toLocaleString()} rows`;
+            } else if (total.rows) {
+                note += ` of up to ${total.rows.toLocaleString()} rows`;
+            } else {
+                note += ' rows';
+            }
+            if (page.truncated) {
+                note += ' (result cut off at the size limit)';
+            }
+            return note;
         }
 
-        async function sendMessage() {
+        async function loadMore(button, cursor, shown) {
+            button.disabled = true;
+            const block = button.closest('.query-result');
+            try {
+                const response = await fetch(`/api/chat/cursor/${cursor}`);
+                const page = await response.json();
+                if (page.error) {
+                    button.outerHTML = `<small class="text-danger">❌ ${page.error}</small>`;
+                    return;
+                }
+                shown += page.results.length;
+                block.querySelector('tbody').insertAdjacentHTML('beforeend', renderRows(page.results));
+                block.querySelector('.row-count').textContent = rowCountNote(shown, page);
+                if (page.cursor) {
+                    button.disabled = false;
+                    button.onclick = () => loadMore(button, page.cursor, shown);
+                } else {
+                    button.remove();
+                }
+            } catch (error) {
+                button.outerHTML = `<small class="text-danger">❌ Connection error: ${error.message}</small>`;
+            }
+        }
+
+        function sendMessage() {
             const input = document.getElementById('user-input');
             const question = input.value.trim();
             
@@ -298,56 +416,54 @@ def chat_interface():
             
             addMessage(question, true);
             input.value = '';
-            addLoading();
+            const content = addMessage('<i class="fas fa-spinner fa-spin"></i> Thinking and querying data...', false);
+            const messagesDiv = document.getElementById('chat-messages');
             
-            try {
-                const response = await fetch('/api/chat', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ question: question })
-                });
-                
-                const data = await response.json();
-                removeLoading();
-                
-                if (data.error) {
-                    addMessage(`❌ Error: ${data.error}`, false);
-                } else {
-                    let responseHtml = `<strong>📊 Analysis:</strong><br>${data.explanation}`;
-                    
-                    if (data.query) {
-                        responseHtml += `<div class="query-result"><strong>SQL Query:</strong><br><code>${data.query}</code></div>`;
-                    }
-                    
-                    if (data.results) {
-                        responseHtml += `<div class="query-result"><strong>Results:</strong><br>`;
-                        if (data.results.length === 0) {
-                            responseHtml += 'No data found.';
-                        } else {
-                            responseHtml += '<table class="table table-sm table-striped mt-2"><tbody>';
-                            data.results.slice(0, 10).forEach(row => {
-                                responseHtml += '<tr>';
-                                row.forEach(cell => {
-                                    responseHtml += `<td>${cell}</td>`;
-                                });
-                                responseHtml += '</tr>';
-                            });
-                            responseHtml += '</tbody></table>';
-                            if (data.results.length > 10) {
-                                responseHtml += `<small class="text-muted">Showing first 10 of ${data.results.length} results</small>`;
-                            }
-                        }
-                        responseHtml += '</div>';
-                    }
-                    
-                    addMessage(responseHtml, false);
+            // Tokens are shown as the model writes them, then replaced by the formatted answer
+            const started = performance.now();
+            const source = new EventSource('/api/chat/stream?question=' + encodeURIComponent(question));
+            let answer = {};
+            let text = '';
+            // A 429/503 from admission control never opens the stream
+            let opened = false;
+            source.onopen = () => { opened = true; };
+            const update = (html) => {
+                content.innerHTML = html;
+                messagesDiv.scrollTop = messagesDiv.scrollHeight;
+            };
+            
+            source.addEventListener('status', (event) => {
+                update(`<i class="fas fa-spinner fa-spin"></i> ${JSON.parse(event.data).message}`);
+            });
+            source.addEventListener('token', (event) => {
+                if (!text) {
+                    answer.first_token_ms = Math.round(performance.now() - started);
                 }
-            } catch (error) {
-                removeLoading();
-                addMessage(`❌ Connection error: ${error.message}`, false);
-            }
+                text += JSON.parse(event.data).text;
+                update(`<strong>📊 Analysis:</strong><pre class="mb-0" style="white-space: pre-wrap">${escapeHtml(text)}</pre>`);
+            });
+            ['sql', 'results'].forEach(name => source.addEventListener(name, (event) => {
+                Object.assign(answer, JSON.parse(event.data));
+                update(renderAnswer(answer));
+            }));
+            source.addEventListener('done', (event) => {
+                source.close();
+                Object.assign(answer, JSON.parse(event.data));
+                update(renderAnswer(answer));
+            });
+            source.addEventListener('failure', (event) => {
+                source.close();
+                update(`❌ Error: ${JSON.parse(event.data).error}`);
+            });
+            source.onerror = () => {
+                // Without this the browser would reconnect and ask the question again
+                source.close();
+                if (!answer.cache) {
+                    update(!opened
+                        ? '❌ The service is busy or you are asking too fast: please try again in a few seconds'
+                        : '❌ Connection error: the answer stream was interrupted');
+                }
+            };
         }
 
         function handleKeyPress(event) {
@@ -365,6 +481,108 @@ def chat_interface():
 </html>
     """)
 
+# Result fields cached per SQL and sent with the first page
+RESULT_FIELDS = ('columns', 'results', 'page_bytes', 'total_rows', 'cursor', 'truncated', 'rewrite')
+
+def template_hit_rate() -> float:
+    """Share of chat requests answered from a query template"""
+    counters = metrics.snapshot()['counters']
+    return round(counters.get('path_template', 0) / max(1, counters.get('chat_requests', 0)), 3)
+
+def chat_events(question: str) -> Iterator[Tuple[str, Dict]]:
+    """Answer a question as a sequence of (event, data) steps: status, tokens, sql, results, done"""
+    start = time.time()
+    timer = StageTimer(metrics)
+    metrics.count('chat_requests')
+    yield 'status', {'message': 'Reading schema...'}
+    
+    # Get schema information
+    schema_info = get_schema_info()
+    schema_version = schema_catalog.version()
+    timer.lap('schema')
+    
+    # Frequent questions map to a template; otherwise reuse the SQL generated for the same question
+    match = None
+    if CHAT_TEMPLATES:
+        query_templates.learn_values(schema_catalog)
+        match = query_templates.match(question)
+        timer.lap('template')
+    cached = None
+    if not match:
+        cached = chat_cache.get_sql(question, schema_version)
+        timer.lap('sql_cache')
+    path = 'template' if match else ('cache' if cached else 'llm')
+    metrics.count(f'path_{path}')
+    cache_status = {'sql': 'skipped' if match else ('hit' if cached else 'miss'), 'results': 'skipped'}
+    if match:
+        sql_query, explanation = match.sql, match.explanation
+    elif cached:
+        sql_query, explanation = cached['sql'], cached['explanation']
+    else:
+        # Create AI prompt and stream the AI response
+        prompt = create_ai_prompt(question, schema_info)
+        timer.lap('prompt')
+        pieces = []
+        for text in call_llm(prompt):
+            if not pieces:
+                metrics.observe('chat_first_token', time.time() - start)
+            pieces.append(text)
+            yield 'token', {'text': text}
+        timer.lap('llm')
+        sql_query, explanation = parse_ai_response(''.join(pieces))
+        timer.lap('parse')
+    yield 'sql', {'query': sql_query, 'explanation': explanation}
+    
+    # Execute query if we have one
+    if sql_query:
+        timer.lap('send')
+        cached_result = chat_cache.get_results(sql_query)
+        cache_status['results'] = 'hit' if cached_result is not None else 'miss'
+        timer.lap('result_cache')
+        if cached_result is None:
+            query_start = time.time()
+            query_result = execute_clickhouse_query(sql_query, timer)
+            metrics.observe('clickhouse_query', time.time() - query_start)
+            if 'error' in query_result:
+                metrics.count('query_errors')
+                yield 'results', {'query_error': query_result['error']}
+            else:
+                if path == 'llm':
+                    # Only SQL that ran is worth reusing
+                    chat_cache.put_sql(question, schema_version, sql_query, explanation)
+                result = {key: query_result[key] for key in RESULT_FIELDS}
+                if result['cursor'] is None:
+                    # Complete results only: an open cursor belongs to this request
+                    chat_cache.put_results(sql_query, result)
+                timer.lap('store')
+                yield 'results', dict(result, query=query_result['query'], query_id=query_result['query_id'],
+                                      estimate=query_result['estimate'])
+        else:
+            yield 'results', cached_result
+    
+    elapsed = time.time() - start
+    metrics.observe('chat_total', elapsed)
+    yield 'done', {'cache': cache_status, 'path': path, 'template': match.template.name if match else None,
+                   'template_hit_rate': template_hit_rate(), 'stages': timer.stages,
+                   'elapsed_ms': round(elapsed * 1000, 1)}
+
+def admit() -> Ticket:
+    """Rate limit the client and wait for a free slot; raises Rejected"""
+    client = client_key(request.remote_addr, request.headers.get('X-Forwarded-For'), CHAT_TRUST_PROXY)
+    try:
+        rate_limiter.take(client)
+    except Rejected:
+        metrics.count('rejected_rate_limited')
+        raise
+    return scheduler.acquire(client)
+
+def rejected_response(e: Rejected):
+    """Fast 429/503 telling the client when to come back"""
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat requests"""
@@ -375,46 +593,108 @@ def chat():
         if not question:
             return jsonify({'error': 'Question cannot be empty'})
         
-        # Get schema information
-        schema_info = get_schema_info()
-        
-        # Create AI prompt
-        prompt = create_ai_prompt(question, schema_info)
-        
-        # Get AI response
-        ai_response = call_azure_openai(prompt)
-        
-        # Extract SQL query from response
-        sql_query = None
-        explanation = ai_response
-        
-        if '```sql' in ai_response:
-            parts = ai_response.split('```sql')
-            if len(parts) > 1:
-                sql_part = parts[1].split('```')[0].strip()
-                sql_query = sql_part
-                
-                # Extract explanation
-                remaining = ai_response.split('```sql')[0] + ai_response.split('```')[1] if '```' in parts[1] else ai_response.split('```sql')[0]
-                explanation = remaining.strip()
-        
-        response_data = {
-            'explanation': explanation,
-            'query': sql_query
-        }
-        
-        # Execute query if we have one
-        if sql_query:
-            query_result = execute_clickhouse_query(sql_query)
-            if 'error' in query_result:
-                response_data['query_error'] = query_result['error']
-            else:
-                response_data['results'] = query_result['data']
-        
+        ticket = admit()
+    except Rejected as e:
+        return rejected_response(e)
+    except Exception as e:
+        return jsonify({'error': f'Internal error: {str(e)}'})
+    
+    try:
+        response_data = {}
+        for event, payload in chat_events(question):
+            if event in ('sql', 'results', 'done'):
+                response_data.update(payload)
         return jsonify(response_data)
         
     except Exception as e:
         return jsonify({'error': f'Internal error: {str(e)}'})
+    finally:
+        ticket.release()
+
+def sse(event: str, data: Dict) -> str:
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/api/chat/stream')
+def chat_stream():
+    """Handle chat requests as server-sent events: LLM tokens as they arrive, then the results"""
+    question = request.args.get('question', '').strip()
+    if not question:
+        return Response(sse('failure', {'error': 'Question cannot be empty'}), mimetype='text/event-stream')
+    
+    # Turned away before the stream starts, so the browser gets the status code and Retry-After
+    try:
+        ticket = admit()
+    except Rejected as e:
+        return rejected_response(e)
+    
+    def generate():
+        try:
+            for event, payload in chat_events(question):
+                yield sse(event, payload)
+        except Exception as e:
+            yield sse('failure', {'error': f'Internal error: {str(e)}'})
+        finally:
+            ticket.release()
+    
+    # No buffering anywhere on the way, so the first event reaches the browser immediately
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also frees the slot when the browser goes away before the stream starts
+    response.call_on_close(ticket.release)
+    return response
+
+@app.route('/api/chat/cursor/<cursor_id>', methods=['GET', 'DELETE'])
+def chat_cursor(cursor_id):
+    """Next page of a result that did not fit in one response (DELETE closes it early)"""
+    cursor = result_cursors.get(cursor_id)
+    if cursor is None:
+        return jsonify({'error': 'Cursor expired or unknown; run the question again'}), 404
+    if request.method == 'DELETE':
+        result_cursors.remove(cursor_id)
+        cursor.close()
+        return jsonify({'closed': True})
+    try:
+        with query_slots:
+            page = cursor.fetch()
+    except Rejected as e:
+        return rejected_response(e)
+    except Exception as e:
+        result_cursors.remove(cursor_id)
+        cursor.close()  # gives the connection back and stops the query on the server
+        return jsonify({'error': f'Fetching more rows failed: {str(e)}'}), 500
+    if page['done']:
+        result_cursors.remove(cursor_id)
+    return jsonify(page_response(cursor, page, cursor_id))
+
+@app.route('/api/schema')
+def schema():
+    """Schema text given to the AI and the state of its cache"""
+    try:
+        get_schema_info()
+        return jsonify(schema_catalog.status())
+    except Exception as e:
+        return jsonify({'error': f'Schema introspection failed: {str(e)}'}), 500
+
+@app.route('/api/cache')
+def cache_stats():
+    """Hit rates and sizes of the question and result caches"""
+    return jsonify(chat_cache.stats())
+
+@app.route('/api/metrics')
+def metrics_endpoint():
+    """LLM calls, tokens and latencies, chat request latencies and cache hit rates"""
+    snapshot = metrics.snapshot()
+    snapshot['llm_provider'] = llm_provider.name
+    snapshot['templates'] = {'enabled': CHAT_TEMPLATES, 'names': query_templates.names(),
+                             'hit_rate': template_hit_rate()}
+    snapshot['cache'] = chat_cache.stats()
+    snapshot['cursors'] = result_cursors.stats()
+    snapshot['clickhouse_pool'] = clickhouse_pool.stats()
+    snapshot['rollups'] = rollup_rewriter.status()
+    snapshot['admission'] = {'rate_limit': rate_limiter.stats(), 'queue': scheduler.stats(),
+                             'clickhouse': query_slots.stats()}
+    return jsonify(snapshot)
 
 @app.route('/health')
 def health():
@@ -428,22 +708,23 @@ def health():
         ch_status = "unhealthy"
     
     try:
-        # Test Azure OpenAI configuration
-        if AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY:
-            get_azure_openai_client()
-            ai_status = "configured"
-        else:
-            ai_status = "not_configured"
+        # Test LLM configuration
+        ai_status = "configured" if llm_provider.configured() else "not_configured"
     except:
         ai_status = "error"
     
     return jsonify({
         'clickhouse': ch_status,
-        'azure_openai': ai_status,
+        'llm_provider': llm_provider.name,
+        'llm': ai_status,
         'status': 'healthy' if ch_status == 'healthy' and ai_status == 'configured' else 'partial'
     })
 
 if __name__ == '__main__':
     import logging
+    import signal
+    import sys
     logging.basicConfig(level=logging.INFO)
+    # docker stop sends SIGTERM: exit normally so the question cache is written out at exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host='0.0.0.0', port=5001, debug=True)
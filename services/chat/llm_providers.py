@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+LLM backends for the chat service
+Every provider streams the completion as text pieces: Azure OpenAI, or a deterministic local stub
+for offline use and benchmarks
+"""
+
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Tuple
+
+from chat_metrics import ChatMetrics
+
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))  # seconds for a whole completion
+STUB_LLM_LATENCY_MS = float(os.getenv('STUB_LLM_LATENCY_MS', '300'))  # before the first token
+STUB_LLM_TOKEN_MS = float(os.getenv('STUB_LLM_TOKEN_MS', '5'))  # between tokens
+
+SYSTEM_PROMPT = ("You are an expert ClickHouse SQL analyst. Help users analyze their e-commerce data by "
+                 "writing efficient SQL queries.")
+
+
+class LLMTimeout(Exception):
+    """The completion did not finish within LLM_TIMEOUT"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) when the backend reports no usage"""
+    return max(1, len(text) // 4)
+
+
+class LLMProvider(ABC):
+    """Base class: subclasses implement pieces(); stream() adds the deadline and metrics"""
+
+    name = 'base'
+
+    def __init__(self, metrics: ChatMetrics, timeout: float = LLM_TIMEOUT):
+        self.metrics = metrics
+        self.timeout = timeout
+
+    @abstractmethod
+    def pieces(self, prompt: str, timeout: float) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Yield (text, usage) pairs; usage is the backend's token count if it sends one"""
+        ...
+
+    def configured(self) -> bool:
+        return True
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Completion text as it is generated"""
+        start = time.time()
+        deadline = start + self.timeout
+        first = None
+        completion: List[str] = []
+        usage = None
+        self.metrics.count('llm_calls')
+        try:
+            for text, piece_usage in self.pieces(prompt, self.timeout):
+                if time.time() > deadline:
+                    raise LLMTimeout(f"LLM did not finish within {self.timeout:g}s")
+                usage = piece_usage or usage
+                if not text:
+                    continue
+                if first is None:
+                    first = time.time()
+                    self.metrics.observe('llm_first_token', first - start)
+                completion.append(text)
+                yield text
+        except LLMTimeout:
+            self.metrics.count('llm_timeouts')
+            raise
+        except Exception:
+            self.metrics.count('llm_errors')
+            raise
+        self.metrics.observe('llm_total', time.time() - start)
+        text = ''.join(completion)
+        self.metrics.count('llm_prompt_tokens', usage['prompt_tokens'] if usage else estimate_tokens(prompt))
+        self.metrics.count('llm_completion_tokens',
+                           usage['completion_tokens'] if usage else estimate_tokens(text))
+
+    def complete(self, prompt: str) -> str:
+        return ''.join(self.stream(prompt))
+
+
+class AzureProvider(LLMProvider):
+    """Azure OpenAI chat completions, streamed"""
+
+    name = 'azure'
+
+    def __init__(self, metrics: ChatMetrics, endpoint: str, api_key: str, api_version: str, deployment: str,
+                 timeout: float = LLM_TIMEOUT):
+        super().__init__(metrics, timeout)
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.api_version = api_version
+        self.deployment = deployment
+        self.client = None
+
+    def configured(self) -> bool:
+        return bool(self.endpoint and self.api_key)
+
+    def get_client(self):
+        if not self.configured():
+            raise ValueError("Azure OpenAI configuration is missing. Please set AZURE_OPENAI_ENDPOINT and "
+                             "AZURE_OPENAI_API_KEY environment variables.")
+        if self.client is None:
+            from openai import AzureOpenAI
+            self.client = AzureOpenAI(azure_endpoint=self.endpoint, api_key=self.api_key,
+                                      api_version=self.api_version)
+        return self.client
+
+    def pieces(self, prompt: str, timeout: float) -> Iterator[Tuple[str, Optional[dict]]]:
+        response = self.get_client().chat.completions.create(
+            model=self.deployment,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            max_tokens=1000,
+            stream=True,
+            timeout=timeout
+        )
+        for chunk in response:
+            usage = getattr(chunk, 'usage', None)
+            usage = {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens} \
+                if usage else None
+            # The first chunk of an Azure stream carries only content filter results
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            yield text or '', usage
+
+
+# Stub answers: (keywords that must all appear in the question, SQL, explanation)
+STUB_ANSWERS = [
+    (('countr', 'revenue'),
+     "SELECT country, sum(revenue) AS total_revenue\nFROM events\nGROUP BY country\n"
+     "ORDER BY total_revenue DESC\nLIMIT {limit}",
+     "Sums event revenue per country and keeps the top {limit}."),
+    (('premium',),
+     "SELECT if(is_premium, 'premium', 'regular') AS segment, count() AS users\nFROM users\nGROUP BY segment",
+     "Counts premium and regular users."),
+    (('product',),
+     "SELECT p.product_name, count() AS orders, sum(o.total_amount) AS revenue\nFROM orders AS o\n"
+     "INNER JOIN products AS p ON o.product_id = p.product_id\nGROUP BY p.product_name\n"
+     "ORDER BY orders DESC\nLIMIT {limit}",
+     "Ranks products by number of orders and shows their revenue."),
+    (('activ',),
+     "SELECT event_date, uniqExact(user_id) AS active_users, count() AS events\nFROM events\n"
+     "WHERE event_date >= today() - {days}\nGROUP BY event_date\nORDER BY event_date",
+     "Daily active users and events for the last {days} days."),
+    (('order',),
+     "SELECT status, count() AS orders, sum(total_amount) AS amount\nFROM orders\n"
+     "WHERE order_date >= today() - {days}\nGROUP BY status\nORDER BY orders DESC",
+     "Orders and amounts by status over the last {days} days."),
+]
+STUB_FALLBACK = ("SELECT event_type, count() AS events\nFROM events\nWHERE event_date >= today() - {days}\n"
+                 "GROUP BY event_type\nORDER BY events DESC\nLIMIT {limit}",
+                 "Most frequent event types over the last {days} days.")
+
+
+class StubProvider(LLMProvider):
+    """Deterministic offline model: picks a canned query by keywords and streams it with fixed latency"""
+
+    name = 'stub'
+
+    def __init__(self, metrics: ChatMetrics, latency_ms: float = STUB_LLM_LATENCY_MS,
+                 token_ms: float = STUB_LLM_TOKEN_MS, timeout: float = LLM_TIMEOUT):
+        super().__init__(metrics, timeout)
+        self.latency = latency_ms / 1000
+        self.token_delay = token_ms / 1000
+
+    @staticmethod
+    def answer(question: str) -> str:
+        text = question.lower()
+        numbers = [int(n) for n in re.findall(r'\d+', text)]
+        limit = numbers[0] if numbers else 10
+        days = 7 if 'week' in text else (30 if 'month' in text else (numbers[0] if numbers else 30))
+        sql, explanation = next(((sql, explanation) for keywords, sql, explanation in STUB_ANSWERS
+                                 if all(keyword in text for keyword in keywords)), STUB_FALLBACK)
+        values = {'limit': limit, 'days': days}
+        return (f"```sql\n{sql.format(**values)}\n```\n\nExplanation: {explanation.format(**values)}\n\n"
+                f"Expected insights: (stub provider - canned answer)")
+
+    def pieces(self, prompt: str, timeout: float) -> Iterator[Tuple[str, Optional[dict]]]:
+        match = re.search(r'^USER QUESTION: (.*)$', prompt, re.MULTILINE)
+        answer = self.answer(match.group(1) if match else prompt)
+        time.sleep(self.latency)
+        for piece in re.findall(r'\s*\S+', answer):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield piece, None
+
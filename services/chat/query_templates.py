@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Template fast path for the chat service
+Frequent questions are matched to parameterized, pre-validated SQL templates by keywords, with
+countries, product categories, time ranges and "top N" extracted from the question, so they are
+answered without calling the LLM
+"""
+
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import sql_guard
+from chat_cache import NUMBER_WORDS
+
+COUNTRY_NAMES = {
+    'united states': 'US', 'usa': 'US', 'america': 'US', 'united kingdom': 'UK', 'britain': 'UK',
+    'england': 'UK', 'germany': 'DE', 'france': 'FR', 'canada': 'CA', 'australia': 'AU', 'japan': 'JP',
+    'brazil': 'BR', 'india': 'IN', 'russia': 'RU',
+}
+COUNTRY_CODES = ('US', 'UK', 'DE', 'FR', 'CA', 'AU', 'JP', 'BR', 'IN', 'RU')
+CATEGORIES = ('Electronics', 'Clothing', 'Books', 'Home & Garden', 'Sports', 'Beauty', 'Toys', 'Automotive',
+              'Health', 'Food')
+# Whole words asking for an ordering, aggregate or dimension no template expresses ("lowest revenue",
+# "average revenue per country", "orders by payment method"): such questions go to the LLM
+MODIFIERS = ('lowest', 'least', 'bottom', 'fewest', 'worst', 'average', 'avg', 'mean', 'share', 'percent',
+             'percentage', 'distribution', 'trend', 'trends', 'per', 'payment', 'payments', 'device', 'devices', 'browser', 'browsers')
+TIME_UNITS = {'day': 'DAY', 'days': 'DAY', 'week': 'WEEK', 'weeks': 'WEEK', 'month': 'MONTH', 'months': 'MONTH',
+              'year': 'YEAR', 'years': 'YEAR'}
+
+
+class TimeRange(NamedTuple):
+    condition: str  # with {column} for the table's date column
+    label: str
+
+
+class QueryTemplate(NamedTuple):
+    name: str
+    keywords: Tuple[Tuple[str, ...], ...]  # every group must match one of its keywords
+    sql: str                               # {where}, {limit} and entity placeholders
+    explanation: str
+    date_column: Optional[str] = None      # filtered by a time range in the question
+    country_column: Optional[str] = None
+    category_column: Optional[str] = None
+    default_range: Optional[TimeRange] = None
+    default_limit: int = 10
+    exclude: Tuple[str, ...] = ()          # words that mean the question asks for something else
+
+
+LAST_WEEK = TimeRange("{column} >= today() - INTERVAL 1 WEEK", "the last week")
+
+TEMPLATES = [
+    QueryTemplate(
+        'revenue_by_country', (('countr',), ('revenue', 'sales', 'earn')),
+        "SELECT country, sum(revenue) AS total_revenue, count() AS events\nFROM events\n{where}"
+        "GROUP BY country\nORDER BY total_revenue DESC\nLIMIT {limit}",
+        "Event revenue per country{range}, top {limit}.",
+        date_column='event_date', exclude=('categor', 'product')),
+    QueryTemplate(
+        'daily_activity', (('activ', 'dau'),),
+        "SELECT event_date, uniqExact(user_id) AS active_users, count() AS events, "
+        "sum(duration_seconds) AS time_spent\nFROM events\n{where}GROUP BY event_date\nORDER BY event_date",
+        "Daily active users, events and time spent{range}{country}.",
+        date_column='event_date', country_column='country', default_range=LAST_WEEK,
+        exclude=('most active', 'top', 'product')),
+    QueryTemplate(
+        'popular_products', (('product',), ('popular', 'top', 'best', 'most', 'sold', 'selling')),
+        "SELECT p.product_name, p.category, count() AS orders, sum(o.quantity) AS units, "
+        "sum(o.total_amount) AS revenue\nFROM orders AS o\nINNER JOIN products AS p ON o.product_id = p.product_id\n"
+        "{where}GROUP BY p.product_name, p.category\nORDER BY orders DESC\nLIMIT {limit}",
+        "Products ranked by number of orders{range}{category}, top {limit}.",
+        date_column='o.order_date', category_column='p.category', exclude=('countr', 'categor')),
+    QueryTemplate(
+        'revenue_by_category', (('categor',), ('revenue', 'sales', 'perform', 'best')),
+        "SELECT p.category, count() AS orders, sum(o.total_amount) AS revenue\nFROM orders AS o\n"
+        "INNER JOIN products AS p ON o.product_id = p.product_id\n{where}GROUP BY p.category\n"
+        "ORDER BY revenue DESC\nLIMIT {limit}",
+        "Order revenue per product category{range}.",
+        date_column='o.order_date'),
+    QueryTemplate(
+        'user_segments', (('premium', 'segment'),),
+        "SELECT if(is_premium, 'premium', 'regular') AS segment, count() AS users, "
+        "round(avg(total_spent), 2) AS avg_spent\nFROM users\n{where}GROUP BY segment\nORDER BY segment",
+        "Premium and regular users with their average spend{country}.",
+        country_column='country', exclude=('revenue', 'event')),
+    QueryTemplate(
+        'orders_by_status', (('order',), ('how many', 'count', 'number of', 'status')),
+        "SELECT status, count() AS orders, sum(total_amount) AS amount\nFROM orders\n{where}"
+        "GROUP BY status\nORDER BY orders DESC",
+        "Orders and amounts by status{range}.",
+        date_column='order_date', exclude=('product', 'categor', 'countr', 'user')),
+    QueryTemplate(
+        'event_types', (('event',), ('type', 'kind')),
+        "SELECT event_type, count() AS events, uniqExact(user_id) AS users\nFROM events\n{where}"
+        "GROUP BY event_type\nORDER BY events DESC",
+        "Events and distinct users per event type{range}{country}.",
+        date_column='event_date', country_column='country'),
+]
+
+
+def quote(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def fold_numbers(text: str) -> str:
+    return ' '.join(NUMBER_WORDS.get(word, word) for word in text.split())
+
+
+TIME_RANGE_PATTERN = r'\b(?:last|past|previous)\s+(\d+)?\s*(days?|weeks?|months?|years?)\b'
+LIMIT_PATTERNS = (r'\b(?:top|first|best|most \w+)\s+(\d+)\b', r'\b(\d+)\s+(?:most|top|best)\b')
+
+
+def extract_time_range(text: str) -> Optional[TimeRange]:
+    """Time range mentioned in a lower-cased question; ValueError for an empty one ("last 0 days")"""
+    match = re.search(TIME_RANGE_PATTERN, text)
+    if match:
+        count, unit = int(match.group(1) or 1), TIME_UNITS[match.group(2)]
+        if count == 0:
+            raise ValueError(f"empty time range '{match.group(0)}'")
+        if unit == 'MONTH' and match.group(1) is None and match.group(0).startswith('last'):
+            return TimeRange("{column} >= toStartOfMonth(today() - INTERVAL 1 MONTH) "
+                             "AND {column} < toStartOfMonth(today())", "last month")
+        plural = match.group(2) if count > 1 else match.group(2).rstrip('s')
+        return TimeRange(f"{{column}} >= today() - INTERVAL {count} {unit}",
+                         f"the last {count} {plural}" if count > 1 else f"the last {plural}")
+    for phrase, condition in (('today', "{column} = today()"), ('yesterday', "{column} = yesterday()"),
+                              ('this week', "{column} >= toMonday(today())"),
+                              ('this month', "{column} >= toStartOfMonth(today())"),
+                              ('this year', "{column} >= toStartOfYear(today())")):
+        if re.search(r'\b' + phrase + r'\b', text):
+            return TimeRange(condition, phrase)
+    return None
+
+
+def limit_match(text: str) -> Optional[re.Match]:
+    return next(filter(None, (re.search(pattern, text) for pattern in LIMIT_PATTERNS)), None)
+
+
+def extract_limit(text: str) -> Optional[int]:
+    match = limit_match(text)
+    return min(int(match.group(1)), sql_guard.CHAT_DEFAULT_LIMIT) if match else None
+
+
+def unused_numbers(text: str) -> List[str]:
+    """Numbers in a lower-cased, number-folded question that are neither the time range nor the limit"""
+    for match in (re.search(TIME_RANGE_PATTERN, text), limit_match(text)):
+        if match:
+            text = text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():]
+    return re.findall(r'\d+', text)
+
+
+class TemplateMatch(NamedTuple):
+    template: QueryTemplate
+    sql: str
+    explanation: str
+    entities: Dict
+
+
+class TemplateLibrary:
+    """Matches questions to templates; country and category values come from the live schema when known"""
+
+    def __init__(self, templates: List[QueryTemplate] = TEMPLATES):
+        self.templates = templates
+        self.countries = set(COUNTRY_CODES)
+        self.categories = list(CATEGORIES)
+        self.values_version = None
+        for template in templates:
+            # Pre-validate: every template must pass the same checks as generated SQL
+            sql_guard.validate(self.render(template, {}))
+
+    def learn_values(self, catalog):
+        """Take the country codes and categories seen in the data from the schema statistics"""
+        if catalog.version() == self.values_version:
+            return
+        self.values_version = catalog.version()
+        for table in catalog.tables:
+            for column in table['columns']:
+                values = [str(value) for value in column.get('top_values', [])]
+                if table['name'] == 'users' and column['name'] == 'country' and values:
+                    self.countries |= set(values)
+                if table['name'] == 'products' and column['name'] == 'category' and values:
+                    self.categories = sorted(set(self.categories) | set(values))
+
+    def extract_entities(self, question: str) -> Dict:
+        text = fold_numbers(question.lower().replace('&', 'and'))
+        entities = {}
+        for name, code in COUNTRY_NAMES.items():
+            if re.search(r'\b' + name + r'\b', text):
+                entities['country'] = code
+                break
+        else:
+            # Codes only as capitalized words ("in DE"), so "in" and "us" stay ordinary words
+            codes = [word for word in re.findall(r'\b[A-Z]{2}\b', question) if word in self.countries]
+            if codes:
+                entities['country'] = codes[0]
+        for category in self.categories:
+            if category.lower().replace('&', 'and') in text:
+                entities['category'] = category
+                break
+        time_range = extract_time_range(text)
+        if time_range:
+            entities['time_range'] = time_range
+        limit = extract_limit(text)
+        if limit:
+            entities['limit'] = limit
+        return entities
+
+    @staticmethod
+    def found(text: str, keyword: str) -> bool:
+        """Keyword at the start of a word: stems like 'categor' match 'categories', but 'activ' does not
+        match 'inactive'"""
+        return re.search(r'\b' + re.escape(keyword), text) is not None
+
+    @staticmethod
+    def score(template: QueryTemplate, keywords: int, entities: Dict) -> int:
+        """Keywords the question matched plus the entities the template can filter on"""
+        return keywords + sum(1 for entity, column in (('country', template.country_column),
+                                                      ('category', template.category_column),
+                                                      ('time_range', template.date_column))
+                              if entity in entities and column)
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        """Best-scoring template whose keyword groups all appear in the question, rendered with its entities"""
+        text = question.lower()
+        if re.search(r'\b(?:' + '|'.join(MODIFIERS) + r')\b', text):
+            return None
+        if unused_numbers(fold_numbers(text.replace('&', 'and'))):
+            return None  # "which 3 countries ...": a number the templates would silently ignore
+        try:
+            entities = self.extract_entities(question)
+        except ValueError:
+            return None  # e.g. "last 0 days": let the model make sense of it
+        scored = []
+        for template in self.templates:
+            if any(self.found(text, word) for word in template.exclude):
+                continue
+            matched = [[keyword for keyword in group if self.found(text, keyword)] for group in template.keywords]
+            if all(matched):
+                scored.append((self.score(template, sum(map(len, matched)), entities), template))
+        if not scored:
+            return None
+        # Ties keep the template listed first
+        template = max(scored, key=lambda item: item[0])[1]
+        if ('country' in entities and not template.country_column
+                or 'category' in entities and not template.category_column
+                or 'time_range' in entities and not template.date_column):
+            # The question filters on something this template cannot express; leave it to the LLM
+            return None
+        return TemplateMatch(template, self.render(template, entities), self.describe(template, entities), entities)
+
+    @staticmethod
+    def render(template: QueryTemplate, entities: Dict) -> str:
+        conditions = []
+        time_range = entities.get('time_range', template.default_range)
+        if time_range and template.date_column:
+            conditions.append(time_range.condition.format(column=template.date_column))
+        if 'country' in entities:
+            conditions.append(f"{template.country_column} = {quote(entities['country'])}")
+        if 'category' in entities:
+            conditions.append(f"{template.category_column} = {quote(entities['category'])}")
+        where = f"WHERE {' AND '.join(conditions)}\n" if conditions else ""
+        return template.sql.format(where=where, limit=entities.get('limit', template.default_limit))
+
+    @staticmethod
+    def describe(template: QueryTemplate, entities: Dict) -> str:
+        time_range = entities.get('time_range', template.default_range)
+        return template.explanation.format(
+            range=f" for {time_range.label}" if time_range else " (all time)",
+            limit=entities.get('limit', template.default_limit),
+            country=f" in {entities['country']}" if 'country' in entities else "",
+            category=f" in {entities['category']}" if 'category' in entities else "")
+
+    def names(self) -> Iterable[str]:
+        return [template.name for template in self.templates]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Streamed, size-bounded query results for the chat service
+Rows are pulled from the driver's streaming iterator one page at a time; a query with more rows
+than fit in a page stays open as a cursor the browser can fetch more from
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+CHAT_PAGE_ROWS = int(os.getenv('CHAT_PAGE_ROWS', '200'))
+CHAT_PAGE_BYTES = int(os.getenv('CHAT_PAGE_BYTES', str(256 * 1024)))  # JSON bytes per page
+CHAT_MAX_RESULT_BYTES = int(os.getenv('CHAT_MAX_RESULT_BYTES', str(16 * 2 ** 20)))  # per query, all pages
+CHAT_CURSOR_TTL = float(os.getenv('CHAT_CURSOR_TTL', '60'))  # seconds an idle cursor stays open
+# Open cursors. Each one is a query still running on the server, outside the QuerySlots cap, so
+# CHAT_MAX_CLICKHOUSE_QUERIES + CHAT_MAX_CURSORS must stay below the chat profile's
+# max_concurrent_queries_for_user (8), with room for the schema catalog's queries: 4 + 3
+CHAT_MAX_CURSORS = int(os.getenv('CHAT_MAX_CURSORS', '3'))
+STREAM_BLOCK_ROWS = 1000  # max_block_size: how many rows the server sends at once
+
+
+class ResultCursor:
+    """An executing query and the rows not sent yet"""
+
+    def __init__(self, client, sql: str, settings: Dict, total_rows_bound: Optional[int] = None,
+                 max_rows: Optional[int] = None, max_bytes: int = CHAT_MAX_RESULT_BYTES,
+                 query_id: Optional[str] = None, release: Optional[Callable] = None):
+        self.client = client
+        self.release = release  # gives the connection back to its pool once the cursor is closed
+        self.query_id = query_id
+        self.rows = client.execute_iter(sql, settings=dict(settings, max_block_size=STREAM_BLOCK_ROWS),
+                                        with_column_types=True, query_id=query_id)
+        self.columns = [{'name': name, 'type': column_type} for name, column_type in next(self.rows)]
+        self.total_rows_bound = total_rows_bound
+        self.max_rows = max_rows  # the server's max_result_rows, to tell a cut result from a complete one
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()  # fetch() closes the cursor itself when the result ends
+        self.closed = False
+        self.pending = None  # row read ahead to know whether there are more
+        self.sent_rows = 0
+        self.sent_bytes = 0
+        self.done = False
+        self.exhausted = False  # the driver returned the last row: the query is over on the server
+        self.truncated = False  # cut by the byte budget or the server's row limit, not the end of the result
+        self.touched = time.time()
+
+    def next_row(self) -> Optional[str]:
+        """Next row as JSON text, or None at the end of the result"""
+        if self.pending is not None:
+            row, self.pending = self.pending, None
+            return row
+        row = next(self.rows, None)
+        if row is None:
+            self.exhausted = True
+            return None
+        return json.dumps(list(row), default=str)
+
+    def fetch(self, max_rows: int = CHAT_PAGE_ROWS, max_bytes: int = CHAT_PAGE_BYTES) -> Dict:
+        """Up to max_rows rows / max_bytes of JSON (at least one row), and whether more remain"""
+        with self.lock:
+            self.touched = time.time()
+            page, size = [], 0
+            while not self.done and len(page) < max_rows and (not page or size < max_bytes):
+                row = self.next_row()
+                if row is None:
+                    self.finish()
+                elif self.sent_bytes + size + len(row) > self.max_bytes:
+                    self.truncated = True
+                    self.finish()
+                else:
+                    page.append(row)
+                    size += len(row)
+            if not self.done:
+                self.pending = self.next_row()
+                if self.pending is None:
+                    self.finish()
+            self.sent_rows += len(page)
+            self.sent_bytes += size
+            if self.done and self.max_rows and self.sent_rows >= self.max_rows:
+                self.truncated = True
+            return {'rows': [json.loads(row) for row in page], 'bytes': size, 'done': self.done}
+
+    def total_rows(self) -> Dict:
+        """Exact row count once the result is exhausted, else an upper bound"""
+        if self.done and not self.truncated:
+            return {'rows': self.sent_rows, 'exact': True}
+        bound = self.total_rows_bound
+        return {'rows': max(bound, self.sent_rows + 1) if bound is not None else None, 'exact': False}
+
+    def finish(self):
+        self.done = True
+        self.close()
+
+    def close(self):
+        """Stop reading and give the connection back. A query still streaming (closed early, cut by the
+        byte budget or failed) is cancelled by disconnecting; a connection whose result was read to the
+        end is reused as is. Waits for a fetch() in progress, since the driver's client must not be used
+        from two threads at once."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if not self.exhausted:
+                self.client.disconnect()
+            release, self.release = self.release, None
+        if release:
+            release(self.client)
+
+
+class CursorStore:
+    """Open cursors by id, closed after CHAT_CURSOR_TTL idle seconds or when too many are open"""
+
+    def __init__(self, ttl: float = CHAT_CURSOR_TTL, max_cursors: int = CHAT_MAX_CURSORS):
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self.lock = threading.Lock()
+        self.cursors: 'OrderedDict[str, ResultCursor]' = OrderedDict()
+
+    def add(self, cursor: ResultCursor) -> str:
+        cursor_id = uuid.uuid4().hex
+        with self.lock:
+            stale = self.expire()
+            self.cursors[cursor_id] = cursor
+            while len(self.cursors) > self.max_cursors:
+                stale.append(self.cursors.popitem(last=False)[1])
+        self.close_all(stale)
+        return cursor_id
+
+    def get(self, cursor_id: str) -> Optional[ResultCursor]:
+        with self.lock:
+            stale = self.expire()
+            cursor = self.cursors.get(cursor_id)
+            if cursor is not None:
+                self.cursors.move_to_end(cursor_id)
+        self.close_all(stale)
+        return cursor
+
+    def remove(self, cursor_id: str):
+        with self.lock:
+            self.cursors.pop(cursor_id, None)
+
+    def expire(self) -> List[ResultCursor]:
+        """Take idle cursors out of the store; called with the lock held, the caller closes them"""
+        now = time.time()
+        return [self.cursors.pop(cursor_id) for cursor_id in
+                [key for key, cursor in self.cursors.items() if now - cursor.touched > self.ttl]]
+
+    @staticmethod
+    def close_all(cursors: List[ResultCursor]):
+        """Close outside the store lock: a cursor waits for its own fetch() in progress"""
+        for cursor in cursors:
+            cursor.close()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'open': len(self.cursors), 'max': self.max_cursors, 'ttl': self.ttl}
+
+
+def page_response(cursor: ResultCursor, page: Dict, cursor_id: Optional[str]) -> Dict:
+    """Fields of a result page as sent to the browser"""
+    return {
+        'columns': cursor.columns,
+        'results': page['rows'],
+        'page_bytes': page['bytes'],
+        'total_rows': cursor.total_rows(),
+        'cursor': None if page['done'] else cursor_id,
+        'truncated': cursor.truncated,
+    }
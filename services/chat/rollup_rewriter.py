@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Rewrites chat queries onto pre-aggregated tables
+An aggregate over raw events that only groups and filters by the rollup's key columns, and only
+uses measures the rollup keeps (event counts, sums of duration and revenue), gives the same result
+when read from daily_user_activity, which has one row per (event_date, user_id) instead of one per event
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import sql_guard
+
+logger = logging.getLogger(__name__)
+
+CHAT_ROLLUP_REWRITE = os.getenv('CHAT_ROLLUP_REWRITE', 'true').lower() == 'true'
+ROLLUP_CHECK_INTERVAL = float(os.getenv('ROLLUP_CHECK_INTERVAL', '60'))  # seconds between completeness checks
+
+
+class Rollup(NamedTuple):
+    source: str
+    table: str
+    keys: Tuple[str, ...]     # columns the rollup groups by: filters and GROUP BY may only use these
+    date_key: str             # key column completeness is checked by
+    row_count: str            # rollup column holding count() of source rows
+    sums: Dict[str, str]      # source column -> rollup column holding its sum
+
+
+ROLLUPS = [
+    Rollup('events', 'daily_user_activity', ('event_date', 'user_id'), 'event_date', 'total_events',
+           {'duration_seconds': 'total_duration', 'revenue': 'total_revenue'}),
+]
+
+# Aggregates that give the same answer over the rollup's key columns (one rollup row per key
+# instead of many events does not change a distinct count or a minimum)
+KEY_AGGREGATES = {'uniq', 'uniqexact', 'min', 'max', 'any'}
+# Row-wise functions allowed around key columns, in filters and on top of aggregates
+SCALAR_FUNCTIONS = {
+    'today', 'yesterday', 'now', 'todate', 'todatetime', 'tostartofweek', 'tomonday', 'tostartofmonth',
+    'tostartofquarter', 'tostartofyear', 'toyyyymm', 'toyyyymmdd', 'toyear', 'tomonth', 'todayofweek',
+    'todayofmonth', 'formatdatetime', 'adddays', 'subtractdays', 'addweeks', 'subtractweeks', 'addmonths',
+    'subtractmonths', 'datediff', 'round', 'floor', 'ceil', 'if', 'multiif', 'intdiv', 'tostring',
+    'tofloat64', 'coalesce', 'plus', 'minus', 'multiply', 'divide', 'greatest', 'least',
+}
+KEYWORDS = {
+    'select', 'from', 'where', 'group', 'by', 'having', 'order', 'limit', 'offset', 'asc', 'desc', 'as', 'and',
+    'or', 'not', 'between', 'in', 'interval', 'day', 'week', 'month', 'quarter', 'year', 'like', 'ilike', 'is',
+    'null', 'true', 'false', 'case', 'when', 'then', 'else', 'end', 'nulls', 'first', 'last', 'rows', 'only',
+}
+# Anything that changes which rows are aggregated, or reads more than one table
+UNSUPPORTED = {'join', 'union', 'intersect', 'except', 'array', 'sample', 'final', 'with', 'over',
+               'prewhere', 'using', 'totals', 'rollup', 'cube'}
+CLAUSES = {'where', 'group', 'order', 'having', 'limit', 'prewhere', 'settings', 'format'}
+
+
+def unquote(token: sql_guard.Token) -> str:
+    return token.text[1:-1] if token.kind == 'quoted' else token.text
+
+
+def closing(tokens: List[sql_guard.Token], index: int) -> int:
+    """Index of the parenthesis closing the one at index"""
+    depth = tokens[index].depth
+    for position in range(index + 1, len(tokens)):
+        if tokens[position].text == ')' and tokens[position].depth == depth:
+            return position
+    raise sql_guard.SQLRejected("Unbalanced parentheses")
+
+
+def rewrite_sql(sql: str, rollup: Rollup) -> Optional[str]:
+    """The query reading rollup.table instead of rollup.source, or None when that would change the result"""
+    tokens = sql_guard.tokenize(sql)
+    while tokens and tokens[-1].text == ';':
+        tokens.pop()
+    words = [token.text.lower() for token in tokens if token.kind == 'word']
+    if words.count('select') != 1 or words.count('from') != 1 or UNSUPPORTED & set(words):
+        return None
+
+    # FROM [database.]source [[AS] alias]
+    start = next(index for index, token in enumerate(tokens) if token.text.lower() == 'from')
+    table_index = start + 1
+    if table_index + 2 < len(tokens) and tokens[table_index + 1].text == '.':
+        table_index += 2
+    if table_index >= len(tokens) or unquote(tokens[table_index]) != rollup.source or tokens[table_index].depth:
+        return None
+    skip = set(range(start, table_index + 1))
+    alias = None
+    after = table_index + 1
+    if after < len(tokens) and tokens[after].text.lower() == 'as':
+        skip.add(after)
+        after += 1
+    if after < len(tokens) and tokens[after].kind in ('word', 'quoted') and tokens[after].text.lower() not in CLAUSES:
+        alias = unquote(tokens[after])
+        skip.add(after)
+    names = {rollup.source} | ({alias} if alias else set())
+    aliases = {unquote(tokens[index + 1]) for index, token in enumerate(tokens[:-1]) if token.text.lower() == 'as'}
+    # Aliases without AS: `count() c,` or `toMonday(event_date) week FROM`
+    aliases |= {unquote(token) for index, token in enumerate(tokens[1:-1], 1)
+                if token.kind in ('word', 'quoted') and token.text.lower() not in KEYWORDS
+                and (tokens[index - 1].text == ')' or tokens[index - 1].kind in ('word', 'quoted', 'number')
+                     and tokens[index - 1].text.lower() not in KEYWORDS)
+                and tokens[index + 1].text.lower() in (',', 'from')}
+
+    def column(position: int) -> Tuple[Optional[str], int]:
+        """Source column named at position (optionally table-qualified) and the index after it"""
+        if (position + 2 < len(tokens) and unquote(tokens[position]) in names and tokens[position + 1].text == '.'):
+            position += 2
+        if position < len(tokens) and tokens[position].kind in ('word', 'quoted'):
+            return unquote(tokens[position]), position + 1
+        return None, position
+
+    replacements: List[Tuple[int, int, str]] = []  # (first token, last token, replacement text)
+    aggregates = 0
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if index in skip or token.kind not in ('word', 'quoted'):
+            index += 1
+            continue
+        word = token.text.lower()
+        if token.kind == 'word' and index + 1 < len(tokens) and tokens[index + 1].text == '(':
+            end = closing(tokens, index + 1)
+            args = tokens[index + 2:end]
+            name, after_name = column(index + 2)
+            single = after_name == end  # exactly one column argument
+            if word == 'count' and (not args or [a.text for a in args] in (['*'], ['1'])
+                                    or single and name in rollup.keys + ('event_id',)):
+                replacements.append((index, end, f"sum({rollup.row_count})"))
+            elif word == 'sum' and single and name in rollup.sums:
+                replacements.append((index, end, f"sum({rollup.sums[name]})"))
+            elif word == 'avg' and single and name == 'duration_seconds':
+                replacements.append((index, end, f"(sum({rollup.sums[name]}) / sum({rollup.row_count}))"))
+            elif word in KEY_AGGREGATES and single and name in rollup.keys:
+                pass
+            elif word == 'count' and args and args[0].text.lower() == 'distinct' and column(index + 3) in (
+                    (key, end) for key in rollup.keys):
+                pass
+            elif word in SCALAR_FUNCTIONS:
+                index += 2
+                continue
+            else:
+                return None
+            aggregates += 1
+            index = end + 1
+            continue
+        if word in KEYWORDS and token.kind == 'word':
+            index += 1
+            continue
+        name, after_name = column(index)
+        if name in rollup.keys or name in aliases:
+            index = after_name
+            continue
+        return None
+    if not aggregates:
+        # Plain rows of the source table have no equivalent in the rollup
+        return None
+    if aliases & ({rollup.row_count} | set(rollup.sums.values())):
+        # `sum(total_duration) AS total_duration` would refer to itself
+        return None
+
+    # Keep the result column names of select items that had no alias: `count()`, not `sum(total_events)`
+    def begin(index: int) -> int:
+        return tokens[index].end - len(tokens[index].text)
+
+    edits = [(begin(first), tokens[last].end, text) for first, last, text in replacements]
+    first_item = next(index for index, token in enumerate(tokens) if token.text.lower() == 'select') + 1
+    depth = tokens[first_item].depth
+    bounds = [first_item - 1] + [index for index in range(first_item, start)
+                                 if tokens[index].text == ',' and tokens[index].depth == depth] + [start]
+    for before, after in zip(bounds, bounds[1:]):
+        item = range(before + 1, after)
+        named = any(tokens[index].text.lower() == 'as' for index in item) or unquote(tokens[after - 1]) in aliases
+        if not named and any(first in item for first, _, _ in replacements):
+            original = sql[begin(before + 1):tokens[after - 1].end].replace('`', '')
+            edits.append((tokens[after - 1].end, tokens[after - 1].end, f" AS `{original}`"))
+    edits.append((begin(table_index), tokens[table_index].end, rollup.table))
+
+    parts, position = [], 0
+    for first, last, text in sorted(edits):
+        parts.append(sql[position:first])
+        parts.append(text)
+        position = last
+    parts.append(sql[position:tokens[-1].end])
+    return ''.join(parts).strip()
+
+
+def split_filter(sql: str) -> Tuple[str, str]:
+    """The FROM part (table and alias) and the WHERE condition ('1' without one) of a query rewrite_sql accepted"""
+    tokens = sql_guard.tokenize(sql)
+    while tokens and tokens[-1].text == ';':
+        tokens.pop()
+    top = [index for index, token in enumerate(tokens)
+           if not token.depth and token.kind == 'word' and token.text.lower() in CLAUSES | {'from'}]
+    start = next(index for index in top if tokens[index].text.lower() == 'from')
+    bounds = [index for index in top if index > start] + [len(tokens), len(tokens)]
+    source = sql[tokens[start].end - len(tokens[start].text):tokens[bounds[0] - 1].end]
+    condition = '1'
+    if bounds[0] < len(tokens) and tokens[bounds[0]].text.lower() == 'where':
+        condition = sql[tokens[bounds[0]].end:tokens[bounds[1] - 1].end]
+    return source.strip(), condition.strip()
+
+
+class RollupRewriter:
+    """Routes queries to a rollup when it holds every source row the query reads"""
+
+    def __init__(self, rollups: List[Rollup] = ROLLUPS, check_interval: float = ROLLUP_CHECK_INTERVAL):
+        self.rollups = rollups
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.stale: Dict[str, Optional[List[str]]] = {}
+        self.checked_at: Dict[str, float] = {}
+
+    def stale_dates(self, client, rollup: Rollup) -> Optional[List[str]]:
+        """Dates on which the rollup and its source disagree, or None when the check failed. A materialized
+        view misses rows inserted before it was created, and the streamer's cleanup deletes old events
+        but leaves their rollup rows in place"""
+        with self.lock:
+            if time.time() - self.checked_at.get(rollup.table, 0) < self.check_interval:
+                return self.stale[rollup.table]
+            key = rollup.date_key
+            try:
+                stale = [str(row[0]) for row in client.execute(
+                    f"SELECT {key} FROM ("
+                    f"SELECT {key}, toInt64(count()) AS n FROM {rollup.source} GROUP BY {key} UNION ALL "
+                    f"SELECT {key}, -toInt64(sum({rollup.row_count})) AS n FROM {rollup.table} GROUP BY {key}"
+                    f") GROUP BY {key} HAVING sum(n) != 0 ORDER BY {key}",
+                    settings={'readonly': 2})]
+                if stale:
+                    logger.warning("Rollup %s differs from %s on %d dates (%s .. %s); "
+                                   "not rewriting queries that read them",
+                                   rollup.table, rollup.source, len(stale), stale[0], stale[-1])
+            except Exception as e:
+                logger.warning("Cannot check rollup %s: %s", rollup.table, e)
+                stale = None
+            self.stale[rollup.table] = stale
+            self.checked_at[rollup.table] = time.time()
+            return stale
+
+    def covers(self, client, rollup: Rollup, sql: str, rewritten: str) -> bool:
+        """Whether neither query reads a row from a date on which the rollup and its source disagree.
+        Both filters only use key columns, so counting their rows on those dates is cheap"""
+        stale = self.stale_dates(client, rollup)
+        if not stale:
+            return stale is not None
+        dates = ', '.join(f"'{date}'" for date in stale)
+        counts = []
+        for query in (sql, rewritten):
+            source, condition = split_filter(query)
+            counts.append(f"(SELECT count() {source} WHERE ({condition}) AND {rollup.date_key} IN ({dates}))")
+        try:
+            touched = client.execute(f"SELECT {' + '.join(counts)}", settings={'readonly': 2})[0][0]
+        except Exception as e:
+            logger.warning("Cannot check the dates read by a query against rollup %s: %s", rollup.table, e)
+            return False
+        return not touched
+
+    def rewrite(self, client, sql: str) -> Optional[Dict]:
+        """The rewritten SQL with rows read before and after (EXPLAIN ESTIMATE), or None"""
+        for rollup in self.rollups:
+            try:
+                rewritten = rewrite_sql(sql, rollup)
+            except sql_guard.SQLRejected:
+                return None
+            if rewritten is None or not self.covers(client, rollup, sql, rewritten):
+                continue
+            before = sql_guard.estimate(client, sql)
+            after = sql_guard.estimate(client, rewritten)
+            logger.info("Rewrote query onto %s: ~%s -> ~%s rows read\n%s\n=>\n%s",
+                        rollup.table, before['rows'], after['rows'], sql, rewritten)
+            return {'sql': rewritten, 'original': sql, 'table': rollup.table,
+                    'rows_before': before['rows'], 'rows_after': after['rows']}
+        return None
+
+    def status(self) -> Dict:
+        with self.lock:
+            return {rollup.table: {'source': rollup.source,
+                                   'complete': None if self.stale.get(rollup.table) is None
+                                   else not self.stale[rollup.table],
+                                   'stale_dates': self.stale.get(rollup.table)}
+                    for rollup in self.rollups}
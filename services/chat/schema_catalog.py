@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Live schema description for the chat service
+Builds the schema text given to the model from system.tables and system.columns, with row counts,
+column cardinalities, value ranges and top values. Statistics are cached and only recomputed, in the
+background, when a table's metadata_modification_time changes.
+"""
+
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from clickhouse_common import LOCAL_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CHECK_INTERVAL = float(os.getenv('SCHEMA_CHECK_INTERVAL', '10'))  # seconds between metadata checks
+SCHEMA_CATEGORICAL_MAX = int(os.getenv('SCHEMA_CATEGORICAL_MAX', '50'))  # distinct values to list top values
+SCHEMA_TOP_VALUES = int(os.getenv('SCHEMA_TOP_VALUES', '10'))
+SCHEMA_STATS_TIMEOUT = int(os.getenv('SCHEMA_STATS_TIMEOUT', '20'))  # seconds per statistics query
+SHADOW_SUFFIX = '__shadow'  # copies made by migrate_schema.py while a table is migrated
+
+# Statistics may be approximate: a slow scan stops at the timeout and returns what it has read
+STATS_SETTINGS = {'max_execution_time': SCHEMA_STATS_TIMEOUT, 'timeout_overflow_mode': 'break'}
+RANGE_TYPES = ('Int', 'UInt', 'Float', 'Decimal', 'Date')
+CATEGORICAL_TYPES = ('String', 'FixedString', 'Enum')
+STATS_ENGINES = ('MergeTree', 'SummingMergeTree', 'ReplacingMergeTree', 'AggregatingMergeTree',
+                 'CollapsingMergeTree', 'Log', 'TinyLog', 'StripeLog', 'Memory',
+                 # Cluster deployment: tables copied to every node, and the sharded tables' Distributed front
+                 'ReplicatedMergeTree', 'Distributed')
+
+
+def base_type(column_type: str) -> str:
+    """Column type without Nullable/LowCardinality wrappers"""
+    for wrapper in ('LowCardinality(', 'Nullable('):
+        while column_type.startswith(wrapper):
+            column_type = column_type[len(wrapper):-1]
+    return column_type
+
+
+def quote_identifier(name: str) -> str:
+    return '`' + name.replace('`', '\\`') + '`'
+
+
+class SchemaCatalog:
+    """Cached schema and statistics of one database"""
+
+    def __init__(self, client_factory: Callable, check_interval: float = SCHEMA_CHECK_INTERVAL):
+        self.client_factory = client_factory
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.fingerprint: Optional[Tuple] = None
+        self.tables: List[Dict] = []
+        self.row_counts: Dict[str, Optional[int]] = {}
+        self.text = ''
+        self.checked_at = 0.0
+        self.checking = False  # a background check is running
+        self.thread: Optional[threading.Thread] = None
+        self.refreshed_at = 0.0
+        self.refresh_seconds = 0.0
+        self.refreshes = 0
+
+    def schema_text(self) -> str:
+        """Schema description. Table metadata is checked at most once per check interval in a background
+        thread, which also rebuilds the statistics of a changed schema; requests get the previous text
+        meanwhile. The first call describes the tables without statistics, reading only system tables."""
+        with self.lock:
+            if not self.text:
+                client = self.client_factory()
+                rows = self.read_tables(client)
+                self.row_counts = {name: total_rows for name, _, total_rows, *_ in rows}
+                self.tables = [self.describe_table(client, *row[:2], *row[3:6], statistics=False) for row in rows]
+                self.text = self.render()
+            if time.time() - self.checked_at >= self.check_interval and not self.checking:
+                self.checking = True
+                self.checked_at = time.time()
+                self.thread = threading.Thread(target=self.refresh, name='schema-check', daemon=True)
+                self.thread.start()
+            return self.text
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until the background check in progress, if any, has finished"""
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def refresh(self):
+        try:
+            self.check(self.client_factory())
+        except Exception as e:
+            logger.warning("Schema check failed, using the cached schema: %s", e)
+        finally:
+            with self.lock:
+                self.checking = False
+                self.checked_at = time.time()
+
+    @staticmethod
+    def read_tables(client) -> List[tuple]:
+        return client.execute(
+            "SELECT name, engine, total_rows, sorting_key, partition_key, comment, "
+            "toString(metadata_modification_time) FROM system.tables "
+            "WHERE database = currentDatabase() AND NOT startsWith(name, '.inner') "
+            "AND NOT endsWith(name, %(local_suffix)s) AND NOT endsWith(name, %(shadow_suffix)s) ORDER BY name",
+            {'local_suffix': LOCAL_SUFFIX, 'shadow_suffix': SHADOW_SUFFIX})
+
+    def check(self, client):
+        """Re-read cheap table metadata; rebuild column statistics only if the metadata changed.
+        Runs outside the lock: the statistics scans can take SCHEMA_STATS_TIMEOUT seconds per query"""
+        rows = self.read_tables(client)
+        fingerprint = tuple((name, modified) for name, *_, modified in rows)
+        tables = None
+        if fingerprint != self.fingerprint:
+            start = time.time()
+            tables = [self.describe_table(client, *row[:2], *row[3:6]) for row in rows]
+            refresh_seconds = time.time() - start
+            logger.info("Schema statistics rebuilt for %d tables in %.2fs", len(tables), refresh_seconds)
+        with self.lock:
+            self.row_counts = {name: total_rows for name, _, total_rows, *_ in rows}
+            if tables is not None:
+                self.tables = tables
+                self.fingerprint = fingerprint
+                self.refreshed_at = time.time()
+                self.refresh_seconds = refresh_seconds
+                self.refreshes += 1
+            self.text = self.render()
+
+    def describe_table(self, client, name: str, engine: str, sorting_key: str, partition_key: str,
+                       comment: str, statistics: bool = True) -> Dict:
+        columns = [
+            {'name': column, 'type': column_type, 'default_kind': default_kind,
+             'default_expression': default_expression, 'comment': column_comment}
+            for column, column_type, default_kind, default_expression, column_comment in client.execute(
+                "SELECT name, type, default_kind, default_expression, comment FROM system.columns "
+                "WHERE database = currentDatabase() AND table = %(table)s ORDER BY position",
+                {'table': name})
+        ]
+        table = {'name': name, 'engine': engine, 'sorting_key': sorting_key, 'partition_key': partition_key,
+                 'comment': comment, 'columns': columns}
+        if statistics and engine in STATS_ENGINES and columns:
+            try:
+                self.add_statistics(client, name, columns)
+            except Exception as e:
+                logger.warning("Could not read statistics for %s: %s", name, e)
+        return table
+
+    def add_statistics(self, client, table: str, columns: List[Dict]):
+        """Distinct counts and min/max for every column in one scan, then top values of categorical columns"""
+        expressions = []
+        for column in columns:
+            identifier = quote_identifier(column['name'])
+            expressions.append(f"uniq({identifier})")
+            if base_type(column['type']).startswith(RANGE_TYPES):
+                expressions += [f"min({identifier})", f"max({identifier})"]
+        values = list(client.execute(f"SELECT {', '.join(expressions)} FROM {quote_identifier(table)}",
+                                     settings=STATS_SETTINGS)[0])
+        for column in columns:
+            column['distinct'] = values.pop(0)
+            if base_type(column['type']).startswith(RANGE_TYPES):
+                low, high = values.pop(0), values.pop(0)
+                if column['distinct']:
+                    column['min'], column['max'] = low, high
+
+        categorical = [column for column in columns
+                       if base_type(column['type']).startswith(CATEGORICAL_TYPES)
+                       and 0 < column['distinct'] <= SCHEMA_CATEGORICAL_MAX]
+        if not categorical:
+            return
+        expressions = [f"topK({SCHEMA_TOP_VALUES})({quote_identifier(column['name'])})" for column in categorical]
+        values = client.execute(f"SELECT {', '.join(expressions)} FROM {quote_identifier(table)}",
+                                settings=STATS_SETTINGS)[0]
+        for column, top in zip(categorical, values):
+            column['top_values'] = list(top)
+
+    def render(self) -> str:
+        lines = ["ClickHouse Database Schema (live, from system.tables and system.columns):", ""]
+        for number, table in enumerate(self.tables, 1):
+            kind = 'view' if table['engine'] in ('View', 'MaterializedView') else 'table'
+            details = [table['engine']]
+            rows = self.row_counts.get(table['name'])
+            if rows is not None:
+                details.append(f"{rows:,} rows")
+            if table['partition_key']:
+                details.append(f"PARTITION BY {table['partition_key']}")
+            if table['sorting_key']:
+                details.append(f"ORDER BY {table['sorting_key']}")
+            lines.append(f"{number}. {table['name']} {kind} ({'; '.join(details)})"
+                         + (f": {table['comment']}" if table['comment'] else ""))
+            for column in table['columns']:
+                lines.append(f"   - {column['name']} ({column['type']})" + self.render_column(column))
+            lines.append("")
+        return "\n".join(lines)
+
+    @staticmethod
+    def render_column(column: Dict) -> str:
+        notes = []
+        if column['comment']:
+            notes.append(column['comment'])
+        if column['default_kind'] in ('MATERIALIZED', 'ALIAS'):
+            notes.append(f"{column['default_kind'].lower()} from {column['default_expression']}")
+        if 'distinct' in column:
+            notes.append(f"~{column['distinct']:,} distinct")
+        if column.get('min') is not None:
+            notes.append(f"range {column['min']} to {column['max']}")
+        if column.get('top_values'):
+            notes.append("top values: " + ", ".join(str(value) for value in column['top_values']))
+        return ": " + "; ".join(notes) if notes else ""
+
+    def version(self) -> str:
+        """Short hash of the table metadata; changes on CREATE/DROP/ALTER, not on inserts"""
+        return f"{zlib.crc32(repr(self.fingerprint).encode()):08x}"
+
+    def status(self) -> Dict:
+        """Cache state for the /api/schema endpoint"""
+        return {
+            'tables': len(self.tables),
+            'version': self.version(),
+            'refreshes': self.refreshes,
+            'refreshed_at': self.refreshed_at,
+            'refresh_seconds': round(self.refresh_seconds, 3),
+            'checked_at': self.checked_at,
+            'schema': self.text,
+        }
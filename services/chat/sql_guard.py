@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Guardrails for model-generated SQL
+Tokenizes the query instead of matching substrings, accepts a single SELECT/WITH statement,
+checks its EXPLAIN ESTIMATE against a read budget and provides the resource limits to run it with
+"""
+
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from clickhouse_common import CLICKHOUSE_CLUSTER, LOCAL_SUFFIX
+
+CHAT_MAX_ESTIMATED_ROWS = int(os.getenv('CHAT_MAX_ESTIMATED_ROWS', '200000000'))
+CHAT_MAX_ESTIMATED_BYTES = int(os.getenv('CHAT_MAX_ESTIMATED_BYTES', str(8 * 2 ** 30)))
+CHAT_MAX_EXECUTION_TIME = int(os.getenv('CHAT_MAX_EXECUTION_TIME', '15'))  # seconds
+CHAT_MAX_ROWS_TO_READ = int(os.getenv('CHAT_MAX_ROWS_TO_READ', '500000000'))
+CHAT_MAX_MEMORY_USAGE = int(os.getenv('CHAT_MAX_MEMORY_USAGE', str(2 * 2 ** 30)))
+CHAT_MAX_RESULT_ROWS = int(os.getenv('CHAT_MAX_RESULT_ROWS', '10000'))
+CHAT_MAX_THREADS = int(os.getenv('CHAT_MAX_THREADS', '4'))
+CHAT_DEFAULT_LIMIT = int(os.getenv('CHAT_DEFAULT_LIMIT', '1000'))
+
+# Functions that reach outside the database, or only burn server time
+BLOCKED_FUNCTIONS = {
+    'url', 'file', 's3', 's3cluster', 'gcs', 'hdfs', 'hdfscluster', 'azureblobstorage', 'remote',
+    'remotesecure', 'cluster', 'clusterallreplicas', 'mysql', 'postgresql', 'mongodb', 'redis', 'sqlite',
+    'jdbc', 'odbc', 'executable', 'input', 'generaterandom', 'sleep', 'sleepeachrow',
+}
+# Clauses the model must not use: writing files, overriding the limits below, changing the output format
+BLOCKED_KEYWORDS = {'into', 'outfile', 'settings', 'format'}
+SET_OPERATORS = {'union', 'intersect', 'except'}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*')
+  | (?P<quoted>`(?:[^`\\]|\\.)*`|"(?:[^"\\]|\\.)*")
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|0x[0-9a-fA-F]+)
+  | (?P<word>[^\W\d][\w$]*)
+  | (?P<symbol>::|<=|>=|!=|<>|\|\||->|[(),;.*+\-/%<>=?:\[\]{}^])
+""", re.VERBOSE | re.DOTALL)
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    depth: int  # parenthesis depth the token is at
+    end: int    # offset just past the token in the SQL text
+
+
+class SQLRejected(ValueError):
+    """The query is not allowed to run"""
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split SQL into tokens, dropping whitespace and comments"""
+    tokens, position, depth = [], 0, 0
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if match is None:
+            raise SQLRejected(f"Cannot parse SQL near: {sql[position:position + 20]!r}")
+        kind, text = match.lastgroup, match.group()
+        position = match.end()
+        if kind in ('space', 'comment'):
+            continue
+        if text in ('(', '['):
+            tokens.append(Token(kind, text, depth, position))
+            depth += 1
+            continue
+        if text in (')', ']'):
+            depth -= 1
+            if depth < 0:
+                raise SQLRejected("Unbalanced parentheses")
+        tokens.append(Token(kind, text, depth, position))
+    if depth != 0:
+        raise SQLRejected("Unbalanced parentheses")
+    return tokens
+
+
+def validate(sql: str) -> Tuple[str, List[Token]]:
+    """Check that the SQL is one read-only SELECT; returns it without trailing semicolons"""
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].text == ';':
+        tokens.pop()
+    if not tokens:
+        raise SQLRejected("Empty query")
+    if any(token.text == ';' for token in tokens):
+        raise SQLRejected("Only a single statement is allowed")
+    first = tokens[0].text.lower()
+    if first not in ('select', 'with') and not (first == '(' and len(tokens) > 1
+                                                  and tokens[1].text.lower() in ('select', 'with')):
+        raise SQLRejected("Only SELECT queries are allowed")
+    for index, token in enumerate(tokens):
+        if token.kind != 'word':
+            continue
+        word = token.text.lower()
+        if word in BLOCKED_KEYWORDS and not is_name(tokens, index):
+            raise SQLRejected(f"{token.text.upper()} is not allowed in chat queries")
+        if word in BLOCKED_FUNCTIONS and index + 1 < len(tokens) and tokens[index + 1].text == '(':
+            raise SQLRejected(f"Function {token.text}() is not allowed in chat queries")
+    # Cut the text after the last real token: trailing semicolons and comments
+    return sql[:tokens[-1].end].strip(), tokens
+
+
+def is_name(tokens: List[Token], index: int) -> bool:
+    """A keyword used as a name: `t.format`, `AS format`, `format,` or the function `format(...)`"""
+    before = tokens[index - 1].text.lower() if index else ''
+    after = tokens[index + 1].text if index + 1 < len(tokens) else ''
+    return before in ('.', 'as') or after in (',', ')', '.', '(')
+
+
+def limit_by(tokens: List[Token], index: int) -> bool:
+    """Whether the LIMIT at index is a `LIMIT n [, m | OFFSET m] BY columns` clause, which caps rows
+    per group rather than the result"""
+    following = [token.text.lower() for token in tokens[index + 1:index + 5]]
+    return following[1:2] == ['by'] or following[1:2] in ([','], ['offset']) and following[3:4] == ['by']
+
+
+def with_limit(sql: str, tokens: List[Token], limit: int = CHAT_DEFAULT_LIMIT) -> str:
+    """Add a LIMIT when the outermost query has none (a LIMIT BY does not count)"""
+    top = [token.text.lower() for token in tokens if token.depth == 0 and token.kind == 'word']
+    if any(token.depth == 0 and token.text.lower() == 'limit' and not limit_by(tokens, index)
+           for index, token in enumerate(tokens)):
+        return sql
+    if SET_OPERATORS & set(top):
+        # A trailing LIMIT would only apply to the last SELECT of a UNION
+        return f"SELECT * FROM ({sql}) LIMIT {limit}"
+    return f"{sql}\nLIMIT {limit}"
+
+
+def outer_limit(tokens: List[Token]) -> Optional[int]:
+    """Row count of the outermost LIMIT (`LIMIT n`, `LIMIT offset, n` or `LIMIT n OFFSET m`)"""
+    for index, token in enumerate(tokens):
+        if token.depth == 0 and token.text.lower() == 'limit' and not limit_by(tokens, index):
+            values = tokens[index + 1:index + 4]
+            if len(values) == 3 and values[1].text == ',' and values[2].kind == 'number':
+                return int(values[2].text)
+            if values and values[0].kind == 'number':
+                return int(values[0].text)
+            return None
+    return None
+
+
+def execution_settings() -> Dict:
+    """Per-query limits, so a single question cannot take over the server"""
+    return {
+        'readonly': 2,
+        'max_execution_time': CHAT_MAX_EXECUTION_TIME,
+        'max_rows_to_read': CHAT_MAX_ROWS_TO_READ,
+        'max_memory_usage': CHAT_MAX_MEMORY_USAGE,
+        'max_result_rows': CHAT_MAX_RESULT_ROWS,
+        'result_overflow_mode': 'break',
+        'max_threads': CHAT_MAX_THREADS,
+    }
+
+
+def estimate(client, sql: str) -> Dict:
+    """Rows the query will read according to EXPLAIN ESTIMATE, and the bytes that implies
+    (compressed bytes per row of each table - an upper bound, as it counts every column)"""
+    rows, size = 0, 0
+    for database, table, _, table_rows, _ in client.execute(f"EXPLAIN ESTIMATE {sql}",
+                                                            settings={'readonly': 2}):
+        if table.endswith(LOCAL_SUFFIX):
+            # A Distributed table, estimated on this node's shard only; the others hold about as much
+            table_rows *= shard_count(client)
+        stats = client.execute(
+            "SELECT total_rows, total_bytes FROM system.tables WHERE database = %(database)s AND name = %(table)s",
+            {'database': database, 'table': table})
+        total_rows, total_bytes = stats[0] if stats else (0, 0)
+        rows += table_rows
+        if total_rows:
+            size += int(table_rows * (total_bytes or 0) / total_rows)
+    return {'rows': rows, 'bytes': size}
+
+
+def shard_count(client) -> int:
+    rows = client.execute("SELECT uniqExact(shard_num) FROM system.clusters WHERE cluster = %(cluster)s",
+                          {'cluster': CLICKHOUSE_CLUSTER})
+    return max(1, rows[0][0]) if rows else 1
+
+
+def check_budget(cost: Dict, max_rows: int = CHAT_MAX_ESTIMATED_ROWS, max_bytes: int = CHAT_MAX_ESTIMATED_BYTES):
+    if cost['rows'] > max_rows:
+        raise SQLRejected(f"Query would read about {cost['rows']:,} rows (budget {max_rows:,}); "
+                          f"add a date range or a more selective filter")
+    if cost['bytes'] > max_bytes:
+        raise SQLRejected(f"Query would read about {cost['bytes'] / 2 ** 20:,.0f} MiB "
+                          f"(budget {max_bytes / 2 ** 20:,.0f} MiB); add a date range or select fewer columns")
+
+
+def result_rows_bound(tokens: List[Token], cost: Dict) -> int:
+    """Upper bound on the result size: the LIMIT, the server's max_result_rows and the rows read"""
+    bounds = [CHAT_MAX_RESULT_ROWS, outer_limit(tokens) or CHAT_DEFAULT_LIMIT]
+    if cost['rows']:
+        bounds.append(cost['rows'])
+    return min(bounds)
+
+
+def prepare(client, sql: str) -> Tuple[str, Dict]:
+    """Validated, LIMIT-ed SQL and its estimated cost; raises SQLRejected"""
+    sql, tokens = validate(sql)
+    sql = with_limit(sql, tokens)
+    cost = estimate(client, sql)
+    check_budget(cost)
+    cost['result_rows'] = result_rows_bound(tokenize(sql), cost)
+    return sql, cost
@@ -0,0 +1,116 @@
+-- Cluster schema: run once on the first node, ON CLUSTER creates every table on both nodes
+-- events and orders are split across the shards by user_id: each node keeps its rows in a
+-- <table>_local table, and the Distributed table under the original name reads and writes all shards.
+-- users and products are small and joined with the sharded tables, so every node keeps a full copy.
+-- Column types and codecs are those of the single-node schema (services/clickhouse/init-scripts).
+
+-- Create database
+CREATE DATABASE IF NOT EXISTS demo_db ON CLUSTER demo_cluster;
+
+-- Create users table (full copy on every node)
+CREATE TABLE IF NOT EXISTS demo_db.users ON CLUSTER demo_cluster (
+    user_id UInt64 CODEC(DoubleDelta, ZSTD(1)),
+    username String CODEC(ZSTD(1)),
+    email String CODEC(ZSTD(1)),
+    age UInt8 CODEC(T64, ZSTD(1)),
+    country LowCardinality(String),
+    registration_date Date CODEC(ZSTD(1)),
+    registration_timestamp DateTime CODEC(ZSTD(1)),
+    is_premium UInt8 CODEC(T64, ZSTD(1)),
+    total_spent Decimal(10,2) CODEC(ZSTD(1))
+) ENGINE = ReplicatedMergeTree('/clickhouse/tables/all/demo_db/users', '{replica}')
+ORDER BY user_id;
+
+-- Create events table for user activity tracking (one shard's rows)
+CREATE TABLE IF NOT EXISTS demo_db.events_local ON CLUSTER demo_cluster (
+    event_id UInt64 CODEC(T64, ZSTD(1)),
+    user_id UInt64 CODEC(Delta, ZSTD(1)),
+    event_type LowCardinality(String),
+    event_timestamp DateTime CODEC(Delta, ZSTD(1)),
+    event_date Date MATERIALIZED toDate(event_timestamp),
+    page_url String CODEC(ZSTD(1)),
+    session_id String CODEC(ZSTD(1)),
+    device_type LowCardinality(String),
+    browser LowCardinality(String),
+    country LowCardinality(String),
+    duration_seconds UInt32 CODEC(T64, ZSTD(1)),
+    revenue Decimal(10,2) DEFAULT 0 CODEC(ZSTD(1))
+) ENGINE = ReplicatedMergeTree('/clickhouse/tables/{shard}/demo_db/events_local', '{replica}')
+PARTITION BY event_date
+ORDER BY (event_date, user_id, event_timestamp);
+
+-- All shards' events; the sharding key must match clickhouse_common.sharding (plain user_id)
+CREATE TABLE IF NOT EXISTS demo_db.events ON CLUSTER demo_cluster AS demo_db.events_local
+ENGINE = Distributed(demo_cluster, demo_db, events_local, user_id);
+
+-- Create products table (full copy on every node)
+CREATE TABLE IF NOT EXISTS demo_db.products ON CLUSTER demo_cluster (
+    product_id UInt64 CODEC(DoubleDelta, ZSTD(1)),
+    product_name String CODEC(ZSTD(1)),
+    category LowCardinality(String),
+    price Decimal(10,2) CODEC(ZSTD(1)),
+    created_date Date CODEC(ZSTD(1)),
+    is_active UInt8 CODEC(T64, ZSTD(1))
+) ENGINE = ReplicatedMergeTree('/clickhouse/tables/all/demo_db/products', '{replica}')
+ORDER BY product_id;
+
+-- Create orders table (one shard's rows)
+CREATE TABLE IF NOT EXISTS demo_db.orders_local ON CLUSTER demo_cluster (
+    order_id UInt64 CODEC(T64, ZSTD(1)),
+    user_id UInt64 CODEC(Delta, ZSTD(1)),
+    product_id UInt64 CODEC(T64, ZSTD(1)),
+    quantity UInt32 CODEC(T64, ZSTD(1)),
+    order_date Date,
+    order_timestamp DateTime CODEC(Delta, ZSTD(1)),
+    total_amount Decimal(10,2) CODEC(ZSTD(1)),
+    status LowCardinality(String),
+    payment_method LowCardinality(String)
+) ENGINE = ReplicatedMergeTree('/clickhouse/tables/{shard}/demo_db/orders_local', '{replica}')
+PARTITION BY order_date
+ORDER BY (order_date, user_id, order_timestamp);
+
+CREATE TABLE IF NOT EXISTS demo_db.orders ON CLUSTER demo_cluster AS demo_db.orders_local
+ENGINE = Distributed(demo_cluster, demo_db, orders_local, user_id);
+
+-- Daily user activity summary, per shard: a user's events all live on one shard, so the
+-- shard-local sums are already complete for each (event_date, user_id)
+CREATE MATERIALIZED VIEW IF NOT EXISTS demo_db.daily_user_activity_local ON CLUSTER demo_cluster
+ENGINE = ReplicatedSummingMergeTree('/clickhouse/tables/{shard}/demo_db/daily_user_activity_local', '{replica}')
+ORDER BY (event_date, user_id)
+AS SELECT
+    event_date,
+    user_id,
+    count() as total_events,
+    sum(duration_seconds) as total_duration,
+    sum(revenue) as total_revenue,
+    uniq(session_id) as unique_sessions
+FROM demo_db.events_local
+GROUP BY event_date, user_id;
+
+CREATE TABLE IF NOT EXISTS demo_db.daily_user_activity ON CLUSTER demo_cluster (
+    event_date Date,
+    user_id UInt64,
+    total_events UInt64,
+    total_duration UInt64,
+    total_revenue Decimal(38,2),
+    unique_sessions UInt64
+) ENGINE = Distributed(demo_cluster, demo_db, daily_user_activity_local, user_id);
+
+-- Create view for user analytics (users is local, events reads every shard)
+CREATE VIEW IF NOT EXISTS demo_db.user_analytics ON CLUSTER demo_cluster AS
+SELECT 
+    u.user_id,
+    u.username,
+    u.country,
+    u.age,
+    u.is_premium,
+    u.total_spent,
+    u.registration_date,
+    count(e.event_id) as total_events,
+    count(DISTINCT e.session_id) as unique_sessions,
+    sum(e.duration_seconds) as total_time_spent,
+    count(DISTINCT e.event_date) as active_days,
+    avg(e.duration_seconds) as avg_session_duration
+FROM demo_db.users u
+LEFT JOIN demo_db.events e ON u.user_id = e.user_id
+GROUP BY u.user_id, u.username, u.country, u.age, u.is_premium, u.total_spent, u.registration_date;
@@ -1,3 +1,15 @@
+-- Column storage:
+--   LowCardinality(String)  short categorical strings (event_type, country, status, ...): dictionary encoded,
+--                           so filters and GROUP BY work on small integer keys
+--   DoubleDelta             dense sequential sort keys (users.user_id, products.product_id): a constant step
+--                           stores as almost nothing
+--   Delta                   columns sorted within a part (user_id after the date, timestamps): small differences
+--                           to the previous row
+--   T64                     small integers in wide types (ages, durations, quantities) and IDs that fall in a
+--                           narrow range per part (event_id, order_id): drops the unused high bits of each block
+--   ZSTD(1)                 after each of the above, and for free text and unsorted values
+-- Existing tables are moved to this layout with services/init-data/migrate_schema.py.
+
 -- Create database
 CREATE DATABASE IF NOT EXISTS demo_db;
 
@@ -6,61 +18,65 @@ USE demo_db;
 
 -- Create users table
 CREATE TABLE IF NOT EXISTS users (
-    user_id UInt64,
-    username String,
-    email String,
-    age UInt8,
-    country String,
-    registration_date Date,
-    registration_timestamp DateTime,
-    is_premium UInt8,
-    total_spent Decimal(10,2)
+    user_id UInt64 CODEC(DoubleDelta, ZSTD(1)),
+    username String CODEC(ZSTD(1)),
+    email String CODEC(ZSTD(1)),
+    age UInt8 CODEC(T64, ZSTD(1)),
+    country LowCardinality(String),
+    registration_date Date CODEC(ZSTD(1)),
+    registration_timestamp DateTime CODEC(ZSTD(1)),
+    is_premium UInt8 CODEC(T64, ZSTD(1)),
+    total_spent Decimal(10,2) CODEC(ZSTD(1))
 ) ENGINE = MergeTree()
-ORDER BY user_id;
+ORDER BY user_id
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Create events table for user activity tracking
 CREATE TABLE IF NOT EXISTS events (
-    event_id UInt64,
-    user_id UInt64,
-    event_type String,
-    event_timestamp DateTime,
+    event_id UInt64 CODEC(T64, ZSTD(1)),
+    user_id UInt64 CODEC(Delta, ZSTD(1)),
+    event_type LowCardinality(String),
+    event_timestamp DateTime CODEC(Delta, ZSTD(1)),
     event_date Date MATERIALIZED toDate(event_timestamp),
-    page_url String,
-    session_id String,
-    device_type String,
-    browser String,
-    country String,
-    duration_seconds UInt32,
-    revenue Decimal(10,2) DEFAULT 0
+    page_url String CODEC(ZSTD(1)),
+    session_id String CODEC(ZSTD(1)),
+    device_type LowCardinality(String),
+    browser LowCardinality(String),
+    country LowCardinality(String),
+    duration_seconds UInt32 CODEC(T64, ZSTD(1)),
+    revenue Decimal(10,2) DEFAULT 0 CODEC(ZSTD(1))
 ) ENGINE = MergeTree()
 PARTITION BY event_date
-ORDER BY (event_date, user_id, event_timestamp);
+ORDER BY (event_date, user_id, event_timestamp)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Create products table
 CREATE TABLE IF NOT EXISTS products (
-    product_id UInt64,
-    product_name String,
-    category String,
-    price Decimal(10,2),
-    created_date Date,
-    is_active UInt8
+    product_id UInt64 CODEC(DoubleDelta, ZSTD(1)),
+    product_name String CODEC(ZSTD(1)),
+    category LowCardinality(String),
+    price Decimal(10,2) CODEC(ZSTD(1)),
+    created_date Date CODEC(ZSTD(1)),
+    is_active UInt8 CODEC(T64, ZSTD(1))
 ) ENGINE = MergeTree()
-ORDER BY product_id;
+ORDER BY product_id
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Create orders table
 CREATE TABLE IF NOT EXISTS orders (
-    order_id UInt64,
-    user_id UInt64,
-    product_id UInt64,
-    quantity UInt32,
+    order_id UInt64 CODEC(T64, ZSTD(1)),
+    user_id UInt64 CODEC(Delta, ZSTD(1)),
+    product_id UInt64 CODEC(T64, ZSTD(1)),
+    quantity UInt32 CODEC(T64, ZSTD(1)),
     order_date Date,
-    order_timestamp DateTime,
-    total_amount Decimal(10,2),
-    status String,
-    payment_method String
+    order_timestamp DateTime CODEC(Delta, ZSTD(1)),
+    total_amount Decimal(10,2) CODEC(ZSTD(1)),
+    status LowCardinality(String),
+    payment_method LowCardinality(String)
 ) ENGINE = MergeTree()
 PARTITION BY order_date
-ORDER BY (order_date, user_id, order_timestamp);
+ORDER BY (order_date, user_id, order_timestamp)
+SETTINGS non_replicated_deduplication_window = 1000;
 
 -- Create materialized view for daily user activity summary
 CREATE MATERIALIZED VIEW IF NOT EXISTS daily_user_activity
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the cluster deployment (docker-compose.cluster.yml)
+Loads the same generated events into a plain MergeTree table on the first node and into a table
+sharded over every node, then compares ingest throughput and the latency of dashboard-style queries
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import generate_data as gd
+from clickhouse_common import CLICKHOUSE_CLUSTER, SHARDED_TABLES, split_columns
+from insert_formats import encode_insert
+
+SINGLE_TABLE = "bench_scale_single"
+LOCAL_TABLE = "bench_scale_local"
+DISTRIBUTED_TABLE = "bench_scale"
+TABLE_LAYOUT = "ENGINE = MergeTree() PARTITION BY event_date ORDER BY (event_date, user_id, event_timestamp)"
+# Every run inserts identical blocks; keep block deduplication from dropping them
+INSERT_SETTINGS = {'insert_deduplicate': 0}
+
+# Shapes of the dashboard panels: aggregates over everything, per day, per user (the sharding key)
+# and a point lookup of one user, which only the owning shard has to answer
+QUERIES = {
+    'event_types': "SELECT event_type, count(), sum(revenue) FROM {table} GROUP BY event_type ORDER BY count() DESC",
+    'daily_activity': "SELECT event_date, count(), uniq(user_id), uniq(session_id) FROM {table} "
+                      "GROUP BY event_date ORDER BY event_date",
+    'top_users': "SELECT user_id, count() AS events, sum(duration_seconds) FROM {table} "
+                 "GROUP BY user_id ORDER BY events DESC LIMIT 10",
+    'one_user': "SELECT count(), sum(revenue) FROM {table} WHERE user_id = 42",
+}
+
+
+def create_tables(client: gd.ClickHouseClient):
+    database = client.database
+    client.execute(f"CREATE TABLE IF NOT EXISTS {SINGLE_TABLE} AS events_local {TABLE_LAYOUT}")
+    client.execute(f"CREATE TABLE IF NOT EXISTS {LOCAL_TABLE} ON CLUSTER {CLICKHOUSE_CLUSTER} "
+                   f"AS {database}.events_local {TABLE_LAYOUT}")
+    client.execute(f"CREATE TABLE IF NOT EXISTS {DISTRIBUTED_TABLE} ON CLUSTER {CLICKHOUSE_CLUSTER} "
+                   f"AS {database}.{LOCAL_TABLE} "
+                   f"ENGINE = Distributed({CLICKHOUSE_CLUSTER}, {database}, {LOCAL_TABLE}, user_id)")
+
+
+def drop_tables(client: gd.ClickHouseClient):
+    client.execute(f"DROP TABLE IF EXISTS {SINGLE_TABLE}")
+    for table in (DISTRIBUTED_TABLE, LOCAL_TABLE):
+        client.execute(f"DROP TABLE IF EXISTS {table} ON CLUSTER {CLICKHOUSE_CLUSTER}")
+
+
+def post_all(client: gd.ClickHouseClient, transport, requests: List) -> int:
+    """Send pre-encoded INSERTs one after another over one connection; returns the rows sent"""
+    for query, body, headers, _ in requests:
+        client.post_insert(query, body, headers, INSERT_SETTINGS, transport)
+    return sum(rows for *_, rows in requests)
+
+
+def measure_ingest(client: gd.ClickHouseClient, chunks: List[Dict]) -> Dict:
+    """Rows/s into one node with one writer, and into every shard with one writer per shard.
+    Bodies are encoded up front so both runs measure the servers rather than the encoder."""
+    key = SHARDED_TABLES['events']
+    single = [encode_insert('events', columns, client.insert_format, client.compression, SINGLE_TABLE)
+              + (len(columns[key]),) for columns in chunks]
+    per_shard = [[] for _ in client.shards]
+    for columns in chunks:
+        for requests, part in zip(per_shard, split_columns(columns, key, len(client.shards))):
+            if len(part[key]):
+                requests.append(encode_insert('events', part, client.insert_format, client.compression,
+                                              LOCAL_TABLE) + (len(part[key]),))
+
+    start = time.time()
+    rows = post_all(client, client.transport, single)
+    single_seconds = time.time() - start
+    start = time.time()
+    with ThreadPoolExecutor(len(client.shards)) as pool:
+        futures = [pool.submit(post_all, client, transport, requests)
+                   for transport, requests in zip(client.shards, per_shard)]
+        sharded_rows = sum(future.result() for future in futures)
+    sharded_seconds = time.time() - start
+    return {'rows': rows, 'sharded_rows': sharded_rows,
+            'single_seconds': single_seconds, 'sharded_seconds': sharded_seconds,
+            'single_rows_per_second': rows / single_seconds,
+            'sharded_rows_per_second': sharded_rows / sharded_seconds}
+
+
+def query_latency(client: gd.ClickHouseClient, sql: str, runs: int) -> Dict:
+    """Median and worst latency over `runs` runs after one warm-up, with the dashboard's settings"""
+    client.transport.post(sql, workload='dashboard')
+    seconds = []
+    for _ in range(runs):
+        start = time.time()
+        client.transport.post(sql, workload='dashboard')
+        seconds.append(time.time() - start)
+    return {'median_ms': statistics.median(seconds) * 1000, 'max_ms': max(seconds) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest throughput and query latency on one node vs. all shards")
+    parser.add_argument("--users", type=int, default=100000, help="Users in the benchmark dataset")
+    parser.add_argument("--events-per-user", type=int, default=50)
+    parser.add_argument("--chunk-rows", type=int, default=gd.CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=gd.GENERATOR_SEED)
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs of every query")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark tables afterwards")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    client = gd.make_client()
+    if len(client.shards) < 2:
+        print("❌ Set CLICKHOUSE_SHARDS to the shards of the cluster (docker-compose.cluster.yml) to compare")
+        sys.exit(1)
+
+    plan = gd.DatasetPlan(args.seed, args.users, events_per_user=args.events_per_user, chunk_rows=args.chunk_rows)
+    pools = gd.build_faker_pools(args.seed)
+    chunks = [gd.generate_chunk(plan, chunk, pools) for chunk in plan.chunks['events']]
+    print(f"Generated {plan.row_count('events'):,} events in {len(chunks):,} chunks; "
+          f"{len(client.shards)} shards, {client.insert_format}/{client.compression} inserts")
+
+    drop_tables(client)
+    create_tables(client)
+    try:
+        print("📥 Loading one node, then every shard...")
+        ingest = measure_ingest(client, chunks)
+        queries = {}
+        for name, sql in QUERIES.items():
+            print(f"⏱️  {name}...")
+            queries[name] = {'single': query_latency(client, sql.format(table=SINGLE_TABLE), args.runs),
+                             'sharded': query_latency(client, sql.format(table=DISTRIBUTED_TABLE), args.runs)}
+    finally:
+        if not args.keep:
+            drop_tables(client)
+
+    shards = len(client.shards)
+    print(f"\n=== Ingest ({ingest['rows']:,} rows) ===")
+    print(f"{'':<10} {'seconds':>9} {'rows/s':>13}")
+    print(f"{'1 node':<10} {ingest['single_seconds']:>9.2f} {ingest['single_rows_per_second']:>13,.0f}")
+    print(f"{f'{shards} shards':<10} {ingest['sharded_seconds']:>9.2f} {ingest['sharded_rows_per_second']:>13,.0f}")
+    print(f"Throughput: {ingest['sharded_rows_per_second'] / ingest['single_rows_per_second']:.2f}x")
+
+    print(f"\n=== Query latency (median of {args.runs} runs) ===")
+    print(f"{'query':<16} {'1 node ms':>10} {f'{shards} shards ms':>13} {'speedup':>8}")
+    for name, result in queries.items():
+        single, sharded = result['single']['median_ms'], result['sharded']['median_ms']
+        print(f"{name:<16} {single:>10.1f} {sharded:>13.1f} {single / sharded:>7.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'shards': shards, 'ingest': ingest, 'queries': queries}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
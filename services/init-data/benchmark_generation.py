@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Generation benchmark for the init-data loader
+Times the legacy row-by-row generators against the columnar NumPy generators
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+from faker import Faker
+
+import generate_data as gd
+
+TARGET_SPEEDUP = 10
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy and columnar data generation")
+    parser.add_argument("--users", type=int, default=10000, help="Users to generate (events scale with users)")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=25000)
+    parser.add_argument("--events-per-user", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=gd.GENERATOR_SEED)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    Faker.seed(args.seed)
+    legacy = {}
+    _, legacy['users'] = timed(gd.generate_users, args.users)
+    _, legacy['products'] = timed(gd.generate_products, args.products)
+    _, legacy['orders'] = timed(gd.generate_orders, args.users, args.products, args.orders)
+    events, legacy['events'] = timed(gd.generate_events, args.users, args.events_per_user)
+
+    rng = np.random.default_rng(args.seed)
+    columnar, rows = {}, {}
+    pools, columnar['faker pools'] = timed(gd.build_faker_pools, args.seed)
+    tables = {
+        'users': (gd.generate_users_columnar, (args.users, rng, pools)),
+        'products': (gd.generate_products_columnar, (args.products, rng, pools)),
+        'orders': (gd.generate_orders_columnar, (args.users, args.products, args.orders, rng)),
+        'events': (gd.generate_events_columnar, (args.users, args.events_per_user, rng)),
+    }
+    for table, (fn, fn_args) in tables.items():
+        columns, columnar[table] = timed(fn, *fn_args)
+        _, rows[table] = timed(gd.columns_to_rows, columns)
+
+    print(f"\n=== Generation benchmark ({args.users:,} users, ~{len(events):,} events, seed {args.seed}) ===")
+    print(f"{'table':<12} {'legacy':>10} {'columnar':>10} {'to rows':>10} {'speedup':>9}")
+    for table in tables:
+        speedup = legacy[table] / max(columnar[table], 1e-9)
+        print(f"{table:<12} {legacy[table]:>9.3f}s {columnar[table]:>9.3f}s {rows[table]:>9.3f}s {speedup:>8.1f}x")
+    legacy_total = sum(legacy.values())
+    columnar_total = sum(columnar.values())
+    speedup = legacy_total / columnar_total
+    print(f"{'total':<12} {legacy_total:>9.3f}s {columnar_total:>9.3f}s {sum(rows.values()):>9.3f}s {speedup:>8.1f}x")
+    print(f"(columnar total includes {columnar['faker pools']:.3f}s to build Faker pools)")
+    with_rows = legacy_total / (columnar_total + sum(rows.values()))
+    print(f"Including row materialization for the JSONEachRow insert path: {with_rows:.1f}x")
+    status = "PASS" if speedup >= TARGET_SPEEDUP else "FAIL"
+    print(f"{status}: columnar generation is {speedup:.1f}x faster (target {TARGET_SPEEDUP}x)")
+
+
+if __name__ == "__main__":
+    main()
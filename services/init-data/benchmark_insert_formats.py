@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Insert format benchmark for the init-data loader
+Loads the same generated chunks in every format/compression pair into scratch tables and compares
+client CPU, bytes on the wire and server-side insert time
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import generate_data as gd
+from insert_formats import COMPRESSIONS, FORMATS, lz4_frame, pa, zstandard
+
+SCRATCH_PREFIX = "bench_fmt_"
+
+
+def available(insert_format: str, compression: str) -> bool:
+    """Skip combinations whose optional packages are not installed"""
+    if insert_format == 'parquet' and pa is None:
+        return False
+    if compression == 'lz4' and lz4_frame is None:
+        return False
+    return compression != 'zstd' or zstandard is not None
+
+
+def server_seconds(client: gd.ClickHouseClient, query_ids: List[str]) -> float:
+    """Sum insert durations from system.query_log for servers without elapsed_ns in the summary header"""
+    client.execute("SYSTEM FLUSH LOGS")
+    ids = ", ".join(f"'{query_id}'" for query_id in query_ids)
+    response = client.execute(
+        f"SELECT sum(query_duration_ms) FROM system.query_log "
+        f"WHERE type = 'QueryFinish' AND query_id IN ({ids}) FORMAT TabSeparated")
+    return float(response.text.strip() or 0) / 1000
+
+
+def run_combination(client: gd.ClickHouseClient, chunks: List, insert_format: str, compression: str) -> Dict:
+    client.insert_format, client.compression = insert_format, compression
+    for table in gd.TABLES:
+        client.execute(f"TRUNCATE TABLE {SCRATCH_PREFIX}{table}")
+    stats = []
+    start = time.time()
+    for chunk, columns in chunks:
+        # Every combination inserts identical blocks; keep block deduplication from dropping them
+        stats.append(client.insert_columns(chunk.table, columns, verbose=False,
+                                           target=f"{SCRATCH_PREFIX}{chunk.table}",
+                                           settings={'insert_deduplicate': 0}))
+    wall = time.time() - start
+    if all(s['server_seconds'] is not None for s in stats):
+        server = sum(s['server_seconds'] for s in stats)
+    else:
+        server = server_seconds(client, [s['query_id'] for s in stats])
+    return {
+        'format': insert_format,
+        'compression': compression,
+        'rows': sum(s['rows'] for s in stats),
+        'bytes': sum(s['bytes'] for s in stats),
+        'encode_seconds': sum(s['encode_seconds'] for s in stats),
+        'server_seconds': server,
+        'wall_seconds': wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ClickHouse insert formats and compression codecs")
+    parser.add_argument("--users", type=int, default=10000, help="Users in the benchmark dataset")
+    parser.add_argument("--events-per-user", type=int, default=50)
+    parser.add_argument("--chunk-rows", type=int, default=gd.CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=gd.GENERATOR_SEED)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--compressions", default=",".join(COMPRESSIONS))
+    args = parser.parse_args()
+
+    # Generate once up front so every combination inserts identical chunks
+    plan = gd.DatasetPlan(args.seed, args.users, events_per_user=args.events_per_user, chunk_rows=args.chunk_rows)
+    pools = gd.build_faker_pools(args.seed)
+    chunks = [(chunk, gd.generate_chunk(plan, chunk, pools)) for table in gd.TABLES for chunk in plan.chunks[table]]
+    print(f"Generated {sum(chunk.rows for chunk, _ in chunks):,} rows in {len(chunks):,} chunks")
+
+    client = gd.make_client()
+    for table in gd.TABLES:
+        client.execute(f"CREATE TABLE IF NOT EXISTS {SCRATCH_PREFIX}{table} AS {table}")
+    results = []
+    try:
+        for insert_format in args.formats.split(','):
+            for compression in args.compressions.split(','):
+                if not available(insert_format, compression):
+                    print(f"  skipping {insert_format}/{compression}: optional package not installed")
+                    continue
+                print(f"  loading {insert_format}/{compression}...")
+                results.append(run_combination(client, chunks, insert_format, compression))
+    finally:
+        for table in gd.TABLES:
+            client.execute(f"DROP TABLE IF EXISTS {SCRATCH_PREFIX}{table}")
+
+    baseline = next((r for r in results if (r['format'], r['compression']) == ('jsoneachrow', 'none')), results[0])
+    print(f"\n=== Insert formats ({results[0]['rows']:,} rows per run) ===")
+    print(f"{'format':<12} {'codec':<6} {'wire MiB':>9} {'vs json':>8} {'client CPU':>11} "
+          f"{'server':>9} {'wall':>8} {'rows/s':>11}")
+    for r in results:
+        print(f"{r['format']:<12} {r['compression']:<6} {r['bytes'] / 2 ** 20:>9.1f} "
+              f"{r['bytes'] / baseline['bytes']:>7.0%} {r['encode_seconds']:>10.2f}s "
+              f"{r['server_seconds']:>8.2f}s {r['wall_seconds']:>7.2f}s {r['rows'] / r['wall_seconds']:>11,.0f}")
+    best = min(results, key=lambda r: r['wall_seconds'])
+    print(f"\nFastest end to end: {best['format']}/{best['compression']} "
+          f"({baseline['wall_seconds'] / best['wall_seconds']:.1f}x vs JSONEachRow)")
+
+
+if __name__ == "__main__":
+    main()
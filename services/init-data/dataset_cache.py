@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+On-disk Parquet snapshots of generated datasets
+The first load of a dataset writes every chunk to cache/<dataset>/<table>/chunk-NNNNNN.parquet;
+later loads send those files to ClickHouse as INSERT ... FORMAT Parquet without generating anything
+"""
+
+import io
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from generate_data import TABLES, ChunkSpec, DatasetPlan, today_np
+from insert_formats import pa, pq, to_arrow_table
+from load_checkpoint import plan_key
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+CACHE_CODEC = 'zstd'
+
+
+class DatasetCache:
+    """Parquet snapshot of one dataset, keyed like its checkpoint (scale or sizes, seed, chunk size)"""
+
+    def __init__(self, plan: DatasetPlan, directory: str = CACHE_DIR):
+        self.key = plan_key(plan)
+        self.root = os.path.join(directory, self.key)
+        self.now = str(plan.now)
+        info = self.read_info(self.key, directory)
+        # A snapshot is only usable for a plan with the same clock, since chunk boundaries depend on it
+        self.ready = info is not None and info['now'] == self.now
+        # Scale datasets have a fixed anchor date; other snapshots are moved up to today by whole days
+        self.shift_days = 0 if plan.scale is not None else int((today_np() - plan.today).astype(np.int64))
+
+    @staticmethod
+    def read_info(key: str, directory: str = CACHE_DIR) -> Optional[Dict]:
+        """Description of a complete snapshot, or None if there is none"""
+        path = os.path.join(directory, key, "dataset.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def chunk_path(self, chunk: ChunkSpec) -> str:
+        return os.path.join(self.root, chunk.table, f"chunk-{chunk.index:06d}.parquet")
+
+    def write(self, chunk: ChunkSpec, columns: Dict[str, np.ndarray], checksums: Dict[str, int]):
+        """Store one generated chunk, with its manifest checksums in the file metadata"""
+        path = self.chunk_path(chunk)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = to_arrow_table(chunk.table, columns)
+        table = table.replace_schema_metadata({'checksums': json.dumps(checksums)})
+        # Write then rename, so an interrupted load never leaves a truncated file behind
+        pq.write_table(table, path + ".tmp", compression=CACHE_CODEC)
+        os.replace(path + ".tmp", path)
+
+    def read(self, chunk: ChunkSpec) -> Tuple[bytes, Dict[str, int]]:
+        """Raw Parquet bytes of a chunk and its checksums"""
+        path = self.chunk_path(chunk)
+        checksums = json.loads(pq.read_schema(path).metadata[b'checksums'])
+        with open(path, 'rb') as f:
+            return f.read(), checksums
+
+    def read_batch(self, batch: List[ChunkSpec]) -> Tuple[bytes, List[Dict[str, int]]]:
+        """One Parquet body for several chunks; a single chunk is sent as its file"""
+        if len(batch) == 1:
+            body, checksums = self.read(batch[0])
+            return body, [checksums]
+        tables = [pq.read_table(self.chunk_path(chunk)) for chunk in batch]
+        checksums = [json.loads(table.schema.metadata[b'checksums']) for table in tables]
+        buffer = io.BytesIO()
+        pq.write_table(pa.concat_tables(tables).replace_schema_metadata(None), buffer, compression=CACHE_CODEC)
+        return buffer.getvalue(), checksums
+
+    def missing(self, plan: DatasetPlan) -> List[ChunkSpec]:
+        return [chunk for table in TABLES for chunk in plan.chunks[table]
+                if not os.path.exists(self.chunk_path(chunk))]
+
+    def finalize(self, plan: DatasetPlan) -> bool:
+        """Mark the snapshot complete once every chunk file exists"""
+        missing = self.missing(plan)
+        if missing:
+            print(f"⚠️  Snapshot {self.root} is missing {len(missing):,} chunks; it will be completed by a later load")
+            return False
+        size = sum(os.path.getsize(self.chunk_path(chunk)) for table in TABLES for chunk in plan.chunks[table])
+        info = {'key': self.key, 'now': self.now, 'rows': {table: plan.row_count(table) for table in TABLES},
+                'bytes': size}
+        with open(os.path.join(self.root, "dataset.json"), 'w') as f:
+            json.dump(info, f, indent=2)
+        self.ready = True
+        print(f"📦 Saved snapshot {self.root} ({size / 2 ** 20:,.1f} MiB of Parquet)")
+        return True
+
+    def discard(self):
+        path = os.path.join(self.root, "dataset.json")
+        if os.path.exists(path):
+            os.remove(path)
+        self.ready = False
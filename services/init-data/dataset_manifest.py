@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Dataset manifests for scale-factor loads
+Records expected row counts and additive checksums per table so runs at a given scale, seed and
+chunk size (every chunk draws from its own random stream) can be compared over time and verified against what ClickHouse actually holds
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+import generate_data as gd
+
+MANIFEST_DIR = os.getenv("MANIFEST_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifests"))
+
+# Checksums are sums, so per-chunk (and per-worker) values simply add up. Faker text is left
+# out because its output depends on the Faker version, not on the dataset definition.
+CHECKSUM_COLUMNS = {
+    'users': {'user_id': 'sum', 'age': 'sum', 'registration_date': 'days', 'total_spent': 'cents'},
+    'products': {'product_id': 'sum', 'created_date': 'days', 'price': 'cents'},
+    'orders': {'order_id': 'sum', 'user_id': 'sum', 'product_id': 'sum', 'quantity': 'sum',
+               'order_timestamp': 'seconds', 'total_amount': 'cents'},
+    'events': {'event_id': 'sum', 'user_id': 'sum', 'duration_seconds': 'sum',
+               'event_timestamp': 'seconds', 'revenue': 'cents'},
+}
+
+# The same checksums computed by ClickHouse
+SERVER_EXPRESSIONS = {
+    'sum': "sum({column})",
+    'days': "sum(toUInt64({column}))",  # Date converts to days since 1970-01-01
+    'seconds': "sum(toUInt64(toUnixTimestamp({column})))",
+    'cents': "toInt64(sum({column}) * 100)",
+}
+
+
+def chunk_checksums(table: str, columns: Dict[str, np.ndarray]) -> Dict[str, int]:
+    """Checksums of one generated chunk"""
+    sums = {'rows': len(next(iter(columns.values())))}
+    for column, kind in CHECKSUM_COLUMNS[table].items():
+        values = columns[column]
+        if kind == 'days':
+            values = (values.astype('datetime64[D]') - np.datetime64('1970-01-01', 'D')).astype(np.int64)
+        elif kind == 'seconds':
+            values = values.astype('datetime64[s]').astype(np.int64)
+        elif kind == 'cents':
+            values = np.round(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+        sums[column] = int(np.asarray(values).astype(np.int64).sum())
+    return sums
+
+
+def add_checksums(total: Dict[str, Dict[str, int]], table: str, sums: Dict[str, int]):
+    """Accumulate chunk checksums into per-table totals"""
+    table_total = total.setdefault(table, {})
+    for key, value in sums.items():
+        table_total[key] = table_total.get(key, 0) + value
+
+
+def merge_checksums(parts) -> Dict[str, Dict[str, int]]:
+    """Combine the per-table totals of several workers"""
+    total = {}
+    for part in parts:
+        for table, sums in part.items():
+            add_checksums(total, table, sums)
+    return total
+
+
+def scale_label(scale: float) -> str:
+    return f"{scale:g}"
+
+
+def manifest_path(scale: float, seed: int, chunk_rows: int) -> str:
+    return os.path.join(MANIFEST_DIR, f"sf{scale_label(scale)}-seed{seed}-chunk{chunk_rows}.json")
+
+
+def build_manifest(plan: gd.DatasetPlan, checksums: Dict[str, Dict[str, int]]) -> Dict:
+    return {
+        'scale': plan.scale,
+        'seed': plan.seed,
+        'anchor_date': str(plan.today),
+        'parameters': {
+            'chunk_rows': plan.chunk_rows,
+            'user_zipf_exponent': gd.USER_ZIPF_EXPONENT,
+            'product_zipf_exponent': gd.PRODUCT_ZIPF_EXPONENT,
+            'session_pareto_shape': gd.SESSION_PARETO_SHAPE,
+            'max_session_events': gd.MAX_SESSION_EVENTS,
+            'session_gap_seconds': gd.SESSION_GAP_SECONDS,
+            'annual_growth': gd.ANNUAL_GROWTH,
+            'numpy': np.__version__,
+        },
+        'tables': {table: checksums.get(table, {'rows': plan.row_count(table)}) for table in gd.TABLES},
+    }
+
+
+def load_manifest(scale: float, seed: int, chunk_rows: int) -> Optional[Dict]:
+    path = manifest_path(scale, seed, chunk_rows)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest: Dict) -> str:
+    path = manifest_path(manifest['scale'], manifest['seed'], manifest['parameters']['chunk_rows'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    return path
+
+
+def compare_tables(expected: Dict, actual: Dict) -> list:
+    """Differences between two {table: {checksum: value}} maps"""
+    problems = []
+    for table, sums in expected.items():
+        for key, value in sums.items():
+            got = actual.get(table, {}).get(key)
+            if got != value:
+                problems.append(f"{table}.{key}: expected {value}, got {got}")
+    return problems
+
+
+def record_manifest(plan: gd.DatasetPlan, checksums: Dict[str, Dict[str, int]]):
+    """Compare a generated dataset with its stored manifest, or store it if this scale/seed/chunk size is new"""
+    manifest = build_manifest(plan, checksums)
+    path = manifest_path(plan.scale, plan.seed, plan.chunk_rows)
+    stored = load_manifest(plan.scale, plan.seed, plan.chunk_rows)
+    if stored is None:
+        print(f"📝 Wrote manifest {write_manifest(manifest)}")
+        return
+    if stored['anchor_date'] != manifest['anchor_date']:
+        print(f"⚠️  Manifest is for anchor date {stored['anchor_date']}, this run used {manifest['anchor_date']}; "
+              f"row counts and checksums are not comparable")
+        return
+    problems = compare_tables(stored['tables'], manifest['tables'])
+    if problems:
+        print(f"❌ Generated data differs from {path}:")
+        for problem in problems:
+            print(f"   {problem}")
+    else:
+        print(f"✅ Generated data matches manifest {path}")
+
+
+def generate_checksums(plan: gd.DatasetPlan) -> Dict[str, Dict[str, int]]:
+    """Generate every chunk without inserting it, only to compute the manifest"""
+    pools = gd.build_faker_pools(plan.seed)
+    checksums = {}
+    for table in gd.TABLES:
+        for chunk in plan.chunks[table]:
+            add_checksums(checksums, table, chunk_checksums(table, gd.generate_chunk(plan, chunk, pools)))
+    return checksums
+
+
+def server_checksums(client: gd.ClickHouseClient, table: str) -> Dict[str, int]:
+    columns = CHECKSUM_COLUMNS[table]
+    expressions = ["count()"] + [SERVER_EXPRESSIONS[kind].format(column=column) for column, kind in columns.items()]
+    response = client.execute(f"SELECT {', '.join(expressions)} FROM {table} FORMAT TabSeparated")
+    values = [int(value) for value in response.text.strip().split('\t')]
+    return dict(zip(['rows'] + list(columns), values))
+
+
+def verify_manifest(client: gd.ClickHouseClient, scale: float, seed: int, chunk_rows: int) -> bool:
+    """Check the loaded tables against the stored manifest"""
+    manifest = load_manifest(scale, seed, chunk_rows)
+    if manifest is None:
+        print(f"❌ No manifest at {manifest_path(scale, seed, chunk_rows)}")
+        return False
+    actual = {table: server_checksums(client, table) for table in manifest['tables']}
+    problems = compare_tables(manifest['tables'], actual)
+    if problems:
+        print(f"❌ ClickHouse data does not match SF {scale_label(scale)} seed {seed} chunk {chunk_rows}:")
+        for problem in problems:
+            print(f"   {problem}")
+        return False
+    print(f"✅ ClickHouse data matches SF {scale_label(scale)} seed {seed} chunk {chunk_rows} "
+          f"({sum(t['rows'] for t in manifest['tables'].values()):,} rows)")
+    return True
@@ -4,15 +4,25 @@ Data generation script for ClickHouse demo
 Generates realistic test data for users, events, products, and orders
 """
 
+import argparse
+import binascii
+import queue
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
-from typing import List, Dict
+from typing import Callable, List, Dict, Iterable, Iterator, NamedTuple, Optional, Union
 from collections import defaultdict
+import numpy as np
 import requests
 import json
 from faker import Faker
 import uuid
+from clickhouse_common import (SHARDED_TABLES, ClickHouseConfig, HTTPTransport, local_table, make_query_id,
+                               parse_shards, split_columns, split_rows, summary)
+
+from insert_formats import (COMPRESSIONS, FORMATS, columns_to_rows, encode_insert, encode_insert_stream, pq,
+                            shifted_insert_query)
 
 fake = Faker()
 
@@ -24,24 +34,64 @@ CLICKHOUSE_USER = os.getenv("CLICKHOUSE_USER", "demo_user")
 CLICKHOUSE_PASSWORD = os.getenv("CLICKHOUSE_PASSWORD", "demo_password")
 CLICKHOUSE_DB = os.getenv("CLICKHOUSE_DB", "demo_db")
 
+# Generator settings
+GENERATOR = os.getenv("GENERATOR", "columnar")  # columnar (NumPy) or legacy (row-by-row Faker)
+GENERATOR_SEED = int(os.getenv("GENERATOR_SEED", "42"))
+FAKER_POOL_SIZE = int(os.getenv("FAKER_POOL_SIZE", "1000"))  # distinct Faker values per text column
+
+COUNTRIES = ['US', 'UK', 'DE', 'FR', 'CA', 'AU', 'JP', 'BR', 'IN', 'RU']
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home & Garden', 'Sports',
+              'Beauty', 'Toys', 'Automotive', 'Health', 'Food']
+EVENT_TYPES = ['page_view', 'click', 'search', 'login', 'logout', 'purchase',
+               'add_to_cart', 'remove_from_cart', 'signup', 'download']
+DEVICE_TYPES = ['desktop', 'mobile', 'tablet']
+BROWSERS = ['Chrome', 'Firefox', 'Safari', 'Edge', 'Opera']
+ORDER_STATUSES = ['completed', 'pending', 'cancelled', 'refunded']
+PAYMENT_METHODS = ['credit_card', 'paypal', 'bank_transfer', 'apple_pay', 'google_pay']
+SECONDS_PER_DAY = 86400
+EVENT_WINDOW_DAYS = 183  # events span the last 6 months
+ORDER_WINDOW_DAYS = 366  # orders span the last year
+
+# Streaming pipeline settings
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", "100000"))       # max rows generated and inserted at once
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", "2"))    # generated chunks waiting for insert
+
+# Scale-factor datasets (SF 1 = 10k users, 1k products, 25k orders, ~550k events).
+# These parameters define the dataset: changing any of them invalidates the stored manifests.
+SCALE_MIN, SCALE_MAX = 0.01, 1000
+DATASET_SCALE = os.getenv("DATASET_SCALE")  # default --scale; unset keeps the explicit per-table counts
+SCALE_ANCHOR_DATE = os.getenv("SCALE_ANCHOR_DATE", "2026-01-01")  # last day of data in --scale datasets
+USER_ZIPF_EXPONENT = 0.8       # user activity popularity
+PRODUCT_ZIPF_EXPONENT = 1.0    # product order popularity
+SESSION_PARETO_SHAPE = 1.5     # heavy-tailed events per session (mean ~2.5)
+MAX_SESSION_EVENTS = 500
+SESSION_GAP_SECONDS = 45       # mean gap between events in a session
+ANNUAL_GROWTH = 3.0            # daily volume triples over a year
+
+# Columnar insert settings
+INSERT_FORMAT = os.getenv("INSERT_FORMAT", "native")        # native, parquet or jsoneachrow
+INSERT_COMPRESSION = os.getenv("INSERT_COMPRESSION", "none")  # none, gzip, lz4 or zstd
+
 class ClickHouseClient:
-    def __init__(self, host: str, port: int, user: str, password: str, database: str):
-        self.base_url = f"http://{host}:{port}"
-        self.auth = (user, password)
+    def __init__(self, host: str, port: int, user: str, password: str, database: str,
+                 insert_format: str = INSERT_FORMAT, compression: str = INSERT_COMPRESSION):
         self.database = database
+        self.insert_format = insert_format
+        self.compression = compression
+        # Keep-alive HTTP connections per client (and so per loader process), with retries and query_id tagging
+        config = ClickHouseConfig(host, port, user, password, database, service='init-data')
+        self.transport = HTTPTransport(config, workload='bulk_load')
+        # In the cluster deployment, one transport per shard: rows of the sharded tables go straight to
+        # the owning shard's <table>_local instead of through the Distributed table
+        self.shards = [HTTPTransport(config._replace(host=shard_host, port=shard_port), workload='bulk_load')
+                       for shard_host, shard_port in parse_shards()]
+    
+    def sharded(self, table: str) -> bool:
+        return bool(self.shards) and table in SHARDED_TABLES
     
     def execute(self, query: str) -> requests.Response:
         """Execute a query against ClickHouse"""
-        params = {"database": self.database}
-        response = requests.post(
-            self.base_url,
-            params=params,
-            data=query,
-            auth=self.auth,
-            headers={"Content-Type": "text/plain"}
-        )
-        response.raise_for_status()
-        return response
+        return self.transport.post(query)
     
     def insert_data(self, table: str, data: List[Dict]) -> None:
         """Insert data into a table using JSON format"""
@@ -49,9 +99,16 @@ class ClickHouseClient:
             return
         
         try:
-            json_data = "\n".join([json.dumps(row) for row in data])
-            query = f"INSERT INTO {table} FORMAT JSONEachRow\n{json_data}"
-            response = self.execute(query)
+            if self.sharded(table):
+                parts = split_rows(data, SHARDED_TABLES[table], len(self.shards))
+                on_shards([lambda transport=transport, part=part: transport.post(
+                    f"INSERT INTO {local_table(table)} FORMAT JSONEachRow\n"
+                    + "\n".join(json.dumps(row) for row in part))
+                    for transport, part in zip(self.shards, parts) if part])
+            else:
+                json_data = "\n".join([json.dumps(row) for row in data])
+                query = f"INSERT INTO {table} FORMAT JSONEachRow\n{json_data}"
+                response = self.execute(query)
             print(f"Inserted {len(data)} rows into {table}")
         except Exception as e:
             print(f"Error inserting data into {table}: {e}")
@@ -59,6 +116,157 @@ class ClickHouseClient:
             if data:
                 print(f"Sample data: {json.dumps(data[0], indent=2)}")
             raise
+    
+    def insert_columns(self, table: str, columns: Dict[str, np.ndarray], verbose: bool = True,
+                       target: Optional[str] = None, settings: Optional[Dict] = None) -> Dict:
+        """Insert a columnar chunk in the configured format and compression, returning wire stats"""
+        rows = len(next(iter(columns.values())))
+        if self.sharded(table) and target is None:
+            parts = split_columns(columns, SHARDED_TABLES[table], len(self.shards))
+            requests_by_shard = [(transport, part) for transport, part in zip(self.shards, parts)
+                                 if len(part[SHARDED_TABLES[table]])]
+        else:
+            requests_by_shard = [(self.transport, columns)]
+        # Thread CPU time, so a concurrent generator thread is not counted as encoding cost
+        start = time.thread_time()
+        encoded = [(transport, encode_insert(table, part, self.insert_format, self.compression,
+                                             target or local_table(table)))
+                   for transport, part in requests_by_shard]
+        encode_seconds = time.thread_time() - start
+        size = sum(len(body) for _, (_, body, _) in encoded)
+        try:
+            stats = merge_stats(on_shards([lambda transport=transport, query=query, body=body, headers=headers:
+                                           self.post_insert(query, body, headers, settings, transport)
+                                           for transport, (query, body, headers) in encoded]))
+        except Exception as e:
+            print(f"Error inserting {self.insert_format} data into {table}: {e}")
+            raise
+        if verbose:
+            print(f"Inserted {rows} rows into {table} ({size:,} bytes {self.insert_format}/{self.compression})")
+        return {**stats, 'rows': rows, 'encode_seconds': encode_seconds}
+    
+    def insert_column_blocks(self, table: str, blocks: Iterable[Dict[str, np.ndarray]],
+                             settings: Optional[Dict] = None, verbose: bool = True) -> Dict:
+        """Insert several chunks of one table as a single streamed INSERT; each chunk is
+        encoded while the previous one is on the wire, so memory stays at one chunk"""
+        sent = {'rows': 0, 'bytes': 0}
+        
+        def counted_blocks():
+            for block in blocks:
+                sent['rows'] += len(next(iter(block.values())))
+                yield block
+        
+        def counted_body(body):
+            for piece in body:
+                sent['bytes'] += len(piece)
+                yield piece
+        
+        try:
+            if self.sharded(table):
+                stats = self.insert_shard_streams(table, counted_blocks(), counted_body, settings)
+            else:
+                query, body, headers = encode_insert_stream(table, counted_blocks(), self.insert_format,
+                                                            self.compression)
+                stats = self.post_insert(query, counted_body(body), headers, settings)
+        except Exception as e:
+            print(f"Error inserting {self.insert_format} data into {table}: {e}")
+            raise
+        if verbose:
+            print(f"Inserted {sent['rows']} rows into {table} "
+                  f"({sent['bytes']:,} bytes {self.insert_format}/{self.compression})")
+        return {**stats, **sent}
+    
+    def insert_shard_streams(self, table: str, blocks: Iterable[Dict[str, np.ndarray]], counted_body: Callable,
+                             settings: Optional[Dict]) -> Dict:
+        """One streamed INSERT per shard, all at once: each block is split by the sharding key and the
+        parts are handed to the shards' request threads through short queues"""
+        feeds = [queue.Queue(maxsize=2) for _ in self.shards]
+        
+        def shard_blocks(feed: queue.Queue, state: Dict):
+            while True:
+                block = feed.get()
+                if block is None or isinstance(block, BaseException):
+                    state['ended'] = True
+                    if block is None:
+                        return
+                    raise block  # abort the request so the shard does not commit a partial batch
+                yield block
+        
+        def stream(transport: HTTPTransport, feed: queue.Queue) -> Dict:
+            state = {'ended': False}
+            try:
+                query, body, headers = encode_insert_stream(table, shard_blocks(feed, state), self.insert_format,
+                                                            self.compression, local_table(table))
+                return self.post_insert(query, counted_body(body), headers, settings, transport)
+            finally:
+                # Keep taking blocks so the producer never waits on a shard that has given up
+                while not state['ended']:
+                    block = feed.get()
+                    state['ended'] = block is None or isinstance(block, BaseException)
+        
+        with ThreadPoolExecutor(len(self.shards)) as pool:
+            futures = [pool.submit(stream, transport, feed) for transport, feed in zip(self.shards, feeds)]
+            end = None
+            try:
+                for block in blocks:
+                    for feed, part in zip(feeds, split_columns(block, SHARDED_TABLES[table], len(self.shards))):
+                        feed.put(part)
+            except BaseException as e:
+                end = e
+                raise
+            finally:
+                for feed in feeds:
+                    feed.put(end)
+            return merge_stats([future.result() for future in futures])
+    
+    def insert_parquet(self, table: str, body: bytes, shift_days: int = 0, settings: Optional[Dict] = None,
+                       verbose: bool = True) -> Dict:
+        """Insert a Parquet file as is, optionally moving its dates forward by whole days"""
+        if self.sharded(table):
+            # A snapshot file is not split client side: the Distributed table routes its rows, and
+            # synchronous forwarding keeps the INSERT from returning before every shard has them
+            settings = {**(settings or {}), 'insert_distributed_sync': 1}
+        if shift_days:
+            query = shifted_insert_query(table, shift_days, 'Parquet')
+        else:
+            query = f"INSERT INTO {table} FORMAT Parquet"
+        try:
+            stats = self.post_insert(query, body, settings=settings)
+        except Exception as e:
+            print(f"Error inserting Parquet snapshot into {table}: {e}")
+            raise
+        if verbose:
+            print(f"Inserted {len(body):,} bytes of Parquet into {table}")
+        return stats
+    
+    def post_insert(self, query: str, body: Union[bytes, Iterator[bytes]], headers: Optional[Dict] = None,
+                    settings: Optional[Dict] = None, transport: Optional[HTTPTransport] = None) -> Dict:
+        """POST an INSERT; the statement goes in the URL so the body is the raw (possibly binary) payload"""
+        query_id = make_query_id('init-data', 'bulk_load')
+        response = (transport or self.transport).post(query, body, settings, query_id=query_id, headers=headers)
+        # Recent servers report elapsed_ns in the summary header; otherwise look it up in system.query_log
+        counters = summary(response)
+        server_seconds = counters["elapsed_ns"] / 1e9 if "elapsed_ns" in counters else None
+        return {'query_id': query_id, 'bytes': len(body) if isinstance(body, bytes) else None,
+                'server_seconds': server_seconds}
+
+def on_shards(calls: List[Callable]) -> List:
+    """Run one request per shard at once; a single call simply runs inline"""
+    if len(calls) == 1:
+        return [calls[0]()]
+    with ThreadPoolExecutor(len(calls)) as pool:
+        futures = [pool.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+def merge_stats(results: List[Dict]) -> Dict:
+    """Insert stats of the shards' requests as one: they ran side by side, so the slowest sets the time"""
+    if len(results) == 1:
+        return results[0]
+    sizes = [result['bytes'] for result in results]
+    seconds = [result['server_seconds'] for result in results]
+    return {'query_id': results[0]['query_id'], 'query_ids': [result['query_id'] for result in results],
+            'bytes': None if None in sizes else sum(sizes),
+            'server_seconds': None if None in seconds else max(seconds)}
 
 def generate_users(count: int = 10000) -> List[Dict]:
     """Generate user data"""
@@ -189,6 +397,331 @@ def generate_orders(user_count: int = 10000, product_count: int = 1000, order_co
     
     return orders
 
+# --- Columnar (NumPy) generation -------------------------------------------------
+# Each generator returns a dict of column name -> NumPy array. Dates are datetime64[D],
+# timestamps datetime64[s]; both are naive local time like the legacy generators.
+
+def build_faker_pools(seed: int, size: int = FAKER_POOL_SIZE) -> Dict[str, np.ndarray]:
+    """Pre-sample Faker values once so rows can pick from them by index"""
+    pool_faker = Faker()
+    pool_faker.seed_instance(seed)
+    return {
+        'username': np.array([pool_faker.user_name() for _ in range(size)], dtype=object),
+        'email': np.array([pool_faker.email() for _ in range(size)], dtype=object),
+        'product_name': np.array([pool_faker.catch_phrase() for _ in range(size)], dtype=object),
+    }
+
+def choose(rng: np.random.Generator, values: List, size: int) -> np.ndarray:
+    """Uniformly pick `size` values from a list"""
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+
+def random_uuids(rng: np.random.Generator, size: int) -> np.ndarray:
+    """Random version-4 UUID strings, built without a Python-level loop"""
+    raw = np.frombuffer(rng.bytes(16 * size), dtype=np.uint8).reshape(size, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hexed = np.frombuffer(binascii.hexlify(raw.tobytes()), dtype=np.uint8).reshape(size, 32)
+    out = np.full((size, 36), ord('-'), dtype=np.uint8)
+    out[:, 0:8], out[:, 9:13], out[:, 14:18] = hexed[:, 0:8], hexed[:, 8:12], hexed[:, 12:16]
+    out[:, 19:23], out[:, 24:36] = hexed[:, 16:20], hexed[:, 20:32]
+    return out.view('S36').ravel().astype(str)
+
+def random_money(rng: np.random.Generator, low: float, high: float, size: int) -> np.ndarray:
+    """Uniform amounts rounded to cents"""
+    return np.round(rng.uniform(low, high, size), 2)
+
+def sample_ids(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    """1-based IDs drawn with the probabilities described by a cumulative distribution"""
+    index = np.searchsorted(cdf, rng.random(size), side='right')
+    return np.minimum(index, len(cdf) - 1).astype(np.uint64) + 1
+
+def zipf_cdf(count: int, exponent: float, rng: np.random.Generator) -> np.ndarray:
+    """Zipf popularity over IDs 1..count; ranks are shuffled so hot keys are spread across the ID range"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    weights = weights[rng.permutation(count)]
+    return np.cumsum(weights) / weights.sum()
+
+def growth_weights(days: np.ndarray, day_seconds: np.ndarray) -> np.ndarray:
+    """Daily volume weights for exponential growth of ANNUAL_GROWTH per year"""
+    age = (days - days[0]).astype(np.int64)
+    return day_seconds * np.exp(np.log(ANNUAL_GROWTH) / 365 * age)
+
+def generate_session_events(rng: np.random.Generator, first_id: int, rows: int, user_cdf: np.ndarray,
+                            day_start: np.datetime64, span: int) -> Dict[str, np.ndarray]:
+    """Events grouped into sessions with Pareto-distributed lengths, one user and device per session"""
+    lengths = np.empty(0, dtype=np.int64)
+    while lengths.sum() < rows:
+        draw = np.minimum(1 + rng.pareto(SESSION_PARETO_SHAPE, rows // 2 + 16), MAX_SESSION_EVENTS)
+        lengths = np.concatenate([lengths, draw.astype(np.int64)])
+    ends = np.cumsum(lengths)
+    sessions = int(np.searchsorted(ends, rows)) + 1
+    lengths = lengths[:sessions]
+    lengths[-1] -= ends[sessions - 1] - rows
+    session = np.repeat(np.arange(sessions), lengths)
+    # Events follow the session start with exponential gaps, clipped to the partition day
+    gaps = np.cumsum(rng.exponential(SESSION_GAP_SECONDS, rows).astype(np.int64))
+    first_event = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    offset = gaps - gaps[first_event][session]
+    start = rng.integers(0, span, sessions)
+    event_timestamp = day_start + np.minimum(start[session] + offset, span - 1).astype('timedelta64[s]')
+    columns = event_columns(rng, first_id, sample_ids(rng, user_cdf, sessions)[session], event_timestamp)
+    columns['session_id'] = random_uuids(rng, sessions)[session]
+    columns['device_type'] = choose(rng, DEVICE_TYPES, sessions)[session]
+    columns['browser'] = choose(rng, BROWSERS, sessions)[session]
+    columns['country'] = choose(rng, COUNTRIES, sessions)[session]
+    return columns
+
+def today_np() -> np.datetime64:
+    return np.datetime64(date.today(), 'D')
+
+def now_np() -> np.datetime64:
+    return np.datetime64(datetime.now().replace(microsecond=0), 's')
+
+def generate_users_columnar(count: int, rng: np.random.Generator, pools: Dict[str, np.ndarray],
+                            first_id: int = 1, today: Optional[np.datetime64] = None) -> Dict[str, np.ndarray]:
+    """Generate user data as columns"""
+    today = today_np() if today is None else today
+    registration_date = today - rng.integers(0, 2 * 365 + 1, count).astype('timedelta64[D]')
+    registration_timestamp = (registration_date.astype('datetime64[s]')
+                              + rng.integers(0, SECONDS_PER_DAY, count).astype('timedelta64[s]'))
+    return {
+        'user_id': np.arange(first_id, first_id + count, dtype=np.uint64),
+        'username': pools['username'][rng.integers(0, len(pools['username']), count)],
+        'email': pools['email'][rng.integers(0, len(pools['email']), count)],
+        'age': rng.integers(18, 81, count, dtype=np.uint8),
+        'country': choose(rng, COUNTRIES, count),
+        'registration_date': registration_date,
+        'registration_timestamp': registration_timestamp,
+        'is_premium': (rng.random(count) < 0.2).astype(np.uint8),
+        'total_spent': random_money(rng, 0, 5000, count),
+    }
+
+def generate_products_columnar(count: int, rng: np.random.Generator, pools: Dict[str, np.ndarray],
+                               first_id: int = 1, today: Optional[np.datetime64] = None) -> Dict[str, np.ndarray]:
+    """Generate product data as columns"""
+    today = today_np() if today is None else today
+    return {
+        'product_id': np.arange(first_id, first_id + count, dtype=np.uint64),
+        'product_name': pools['product_name'][rng.integers(0, len(pools['product_name']), count)],
+        'category': choose(rng, CATEGORIES, count),
+        'price': random_money(rng, 5, 500, count),
+        'created_date': today - rng.integers(0, 366, count).astype('timedelta64[D]'),
+        'is_active': (rng.random(count) < 0.9).astype(np.uint8),
+    }
+
+def generate_events_columnar(user_count: int, events_per_user: int, rng: np.random.Generator,
+                             first_id: int = 1) -> Dict[str, np.ndarray]:
+    """Generate event data as columns - every column is drawn in bulk"""
+    per_user = rng.integers(10, events_per_user * 2 + 1, user_count)
+    total = int(per_user.sum())
+    # Event timestamps within the last 6 months
+    event_timestamp = now_np() - rng.integers(0, EVENT_WINDOW_DAYS * SECONDS_PER_DAY, total).astype('timedelta64[s]')
+    user_id = np.repeat(np.arange(1, user_count + 1, dtype=np.uint64), per_user)
+    return event_columns(rng, first_id, user_id, event_timestamp)
+
+def event_columns(rng: np.random.Generator, first_id: int, user_id: np.ndarray,
+                  event_timestamp: np.ndarray) -> Dict[str, np.ndarray]:
+    """Draw the remaining event columns for the given users and timestamps"""
+    total = len(user_id)
+    event_type = choose(rng, EVENT_TYPES, total)
+    revenue = np.zeros(total)
+    purchases = event_type == 'purchase'
+    revenue[purchases] = random_money(rng, 10, 200, int(purchases.sum()))
+    carts = event_type == 'add_to_cart'
+    revenue[carts] = random_money(rng, 0, 50, int(carts.sum()))
+    return {
+        'event_id': np.arange(first_id, first_id + total, dtype=np.uint64),
+        'user_id': user_id,
+        'event_type': event_type,
+        'event_timestamp': event_timestamp,
+        'page_url': np.char.add('/page/', rng.integers(1, 101, total).astype(str)).astype(object),
+        'session_id': random_uuids(rng, total),
+        'device_type': choose(rng, DEVICE_TYPES, total),
+        'browser': choose(rng, BROWSERS, total),
+        'country': choose(rng, COUNTRIES, total),
+        'duration_seconds': rng.integers(5, 601, total, dtype=np.uint32),
+        'revenue': revenue,
+    }
+
+def generate_orders_columnar(user_count: int, product_count: int, order_count: int,
+                             rng: np.random.Generator, first_id: int = 1,
+                             day: Optional[np.datetime64] = None,
+                             user_cdf: Optional[np.ndarray] = None,
+                             product_cdf: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Generate order data as columns, optionally all on one order date and with skewed popularity"""
+    if day is None:
+        order_date = today_np() - rng.integers(0, ORDER_WINDOW_DAYS, order_count).astype('timedelta64[D]')
+    else:
+        order_date = np.full(order_count, day, dtype='datetime64[D]')
+    order_timestamp = (order_date.astype('datetime64[s]')
+                       + rng.integers(0, SECONDS_PER_DAY, order_count).astype('timedelta64[s]'))
+    return {
+        'order_id': np.arange(first_id, first_id + order_count, dtype=np.uint64),
+        'user_id': (rng.integers(1, user_count + 1, order_count, dtype=np.uint64) if user_cdf is None
+                    else sample_ids(rng, user_cdf, order_count)),
+        'product_id': (rng.integers(1, product_count + 1, order_count, dtype=np.uint64) if product_cdf is None
+                       else sample_ids(rng, product_cdf, order_count)),
+        'quantity': rng.integers(1, 6, order_count, dtype=np.uint32),
+        'order_date': order_date,
+        'order_timestamp': order_timestamp,
+        'total_amount': random_money(rng, 10, 1000, order_count),
+        'status': choose(rng, ORDER_STATUSES, order_count),
+        'payment_method': choose(rng, PAYMENT_METHODS, order_count),
+    }
+
+def generate_legacy_dataset(seed: int) -> Dict[str, List[Dict]]:
+    """Generate every table in memory with the row-by-row generators"""
+    random.seed(seed)
+    Faker.seed(seed)
+    return {
+        'users': generate_users(10000),
+        'products': generate_products(1000),
+        'orders': generate_orders(10000, 1000, 25000),
+        'events': generate_events(10000, 50),  # 500K+ events
+    }
+
+# --- Chunked generation ----------------------------------------------------------
+# Tables are split into chunks up front. A chunk's rows depend only on the seed, its
+# table and its index, so chunks can be generated lazily, in any order, in bounded memory.
+
+TABLES = ['users', 'products', 'orders', 'events']
+TABLE_STREAMS = {table: i + 1 for i, table in enumerate(TABLES)}  # seed stream per table
+
+class ChunkSpec(NamedTuple):
+    table: str
+    index: int
+    first_id: int
+    rows: int
+    day: Optional[np.datetime64]  # partition date, or None for unpartitioned tables
+
+def split_ranges(table: str, total: int, chunk_rows: int, first_id: int = 1,
+                 day: Optional[np.datetime64] = None, start_index: int = 0) -> List[ChunkSpec]:
+    """Split an ID range into chunks of at most chunk_rows"""
+    chunks = []
+    for offset in range(0, total, chunk_rows):
+        rows = min(chunk_rows, total - offset)
+        chunks.append(ChunkSpec(table, start_index + len(chunks), first_id + offset, rows, day))
+    return chunks
+
+def split_by_day(table: str, days: np.ndarray, counts: np.ndarray, chunk_rows: int) -> List[ChunkSpec]:
+    """One or more chunks per partition day, with IDs continuing across days"""
+    chunks, next_id = [], 1
+    for day, count in zip(days, counts):
+        chunks.extend(split_ranges(table, int(count), chunk_rows, next_id, day, len(chunks)))
+        next_id += int(count)
+    return chunks
+
+class DatasetPlan:
+    """Row counts, partition layout and chunk boundaries for a reproducible dataset"""
+    
+    def __init__(self, seed: int, users: int = 10000, products: int = 1000, orders: int = 25000,
+                 events_per_user: int = 50, chunk_rows: int = CHUNK_ROWS, skewed: bool = False,
+                 anchor: Optional[np.datetime64] = None, scale: Optional[float] = None,
+                 now: Optional[np.datetime64] = None):
+        self.seed = seed
+        self.users = users
+        self.products = products
+        self.events_per_user = events_per_user
+        self.chunk_rows = chunk_rows
+        self.skewed = skewed
+        self.scale = scale
+        # anchor is the last day of data; the window ends at the following midnight
+        if now is not None:
+            self.now = now
+        elif anchor is not None:
+            self.now = (np.datetime64(anchor, 'D') + 1).astype('datetime64[s]')
+        else:
+            self.now = now_np()
+        last_day = (self.now - 1).astype('datetime64[D]')
+        self.today = last_day
+        rng = np.random.default_rng([seed, 0])
+        
+        if skewed:
+            # Zipf popularity: a few hot users generate most events and orders
+            self.user_event_cdf = zipf_cdf(users, USER_ZIPF_EXPONENT, rng)
+            self.product_cdf = zipf_cdf(products, PRODUCT_ZIPF_EXPONENT, rng)
+            total_events = users * (events_per_user + 5)
+        else:
+            # Every user gets a share of events, as in the per-user legacy generator
+            per_user = rng.integers(10, events_per_user * 2 + 1, users)
+            self.user_event_cdf = np.cumsum(per_user) / per_user.sum()
+            self.product_cdf = None
+            total_events = int(per_user.sum())
+        
+        # Events are uniform over the last EVENT_WINDOW_DAYS; the first and last days are partial
+        window_start = self.now - np.timedelta64(EVENT_WINDOW_DAYS * SECONDS_PER_DAY, 's')
+        self.event_window_start = window_start
+        event_days = np.arange(window_start.astype('datetime64[D]'), last_day + 1)
+        day_starts = np.maximum(event_days.astype('datetime64[s]'), window_start)
+        day_ends = np.minimum(event_days.astype('datetime64[s]') + SECONDS_PER_DAY, self.now)
+        self.event_day_bounds = dict(zip(event_days, zip(day_starts, day_ends)))
+        day_seconds = (day_ends - day_starts).astype(np.int64)
+        event_weights = growth_weights(event_days, day_seconds) if skewed else day_seconds
+        event_counts = rng.multinomial(total_events, event_weights / event_weights.sum())
+        
+        order_days = np.arange(last_day - ORDER_WINDOW_DAYS + 1, last_day + 1)
+        order_weights = (growth_weights(order_days, np.full(len(order_days), SECONDS_PER_DAY)) if skewed
+                         else np.ones(len(order_days)))
+        order_counts = rng.multinomial(orders, order_weights / order_weights.sum())
+        
+        self.chunks = {
+            'users': split_ranges('users', users, chunk_rows),
+            'products': split_ranges('products', products, chunk_rows),
+            'orders': split_by_day('orders', order_days, order_counts, chunk_rows),
+            'events': split_by_day('events', event_days, event_counts, chunk_rows),
+        }
+    
+    @classmethod
+    def for_scale(cls, scale: float, seed: int, chunk_rows: int = CHUNK_ROWS,
+                  anchor: str = SCALE_ANCHOR_DATE) -> 'DatasetPlan':
+        """TPC-style scale factor: every table grows linearly, with realistic skew and a fixed anchor date"""
+        if not SCALE_MIN <= scale <= SCALE_MAX:
+            raise ValueError(f"Scale factor must be between {SCALE_MIN} and {SCALE_MAX}, got {scale}")
+        return cls(seed, users=max(1, round(10000 * scale)), products=max(1, round(1000 * scale)),
+                   orders=max(1, round(25000 * scale)), chunk_rows=chunk_rows, skewed=True,
+                   anchor=np.datetime64(anchor, 'D'), scale=scale)
+    
+    def row_count(self, table: str) -> int:
+        return sum(chunk.rows for chunk in self.chunks[table])
+    
+    def chunk_rng(self, chunk: ChunkSpec) -> np.random.Generator:
+        """Independent random stream for one chunk"""
+        return np.random.default_rng([self.seed, TABLE_STREAMS[chunk.table], chunk.index])
+
+def sort_by_key(table: str, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Order rows by the table's ORDER BY key, so the server gets blocks that are already sorted"""
+    if table == 'events':
+        timestamp = columns['event_timestamp']
+        keys = (timestamp, columns['user_id'], timestamp.astype('datetime64[D]'))
+    elif table == 'orders':
+        keys = (columns['order_timestamp'], columns['user_id'], columns['order_date'])
+    else:
+        return columns  # users and products are generated in ID order
+    order = np.lexsort(keys)
+    return {name: values[order] for name, values in columns.items()}
+
+def generate_chunk(plan: DatasetPlan, chunk: ChunkSpec, pools: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Generate the columns of one chunk, sorted by the table's ORDER BY key"""
+    return sort_by_key(chunk.table, generate_chunk_columns(plan, chunk, pools))
+
+def generate_chunk_columns(plan: DatasetPlan, chunk: ChunkSpec, pools: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    rng = plan.chunk_rng(chunk)
+    if chunk.table == 'users':
+        return generate_users_columnar(chunk.rows, rng, pools, chunk.first_id, plan.today)
+    if chunk.table == 'products':
+        return generate_products_columnar(chunk.rows, rng, pools, chunk.first_id, plan.today)
+    if chunk.table == 'orders':
+        return generate_orders_columnar(plan.users, plan.products, chunk.rows, rng, chunk.first_id, chunk.day,
+                                        plan.user_event_cdf if plan.skewed else None, plan.product_cdf)
+    day_start, day_end = plan.event_day_bounds[chunk.day]
+    span = max(1, int((day_end - day_start).astype(np.int64)))
+    if plan.skewed:
+        return generate_session_events(rng, chunk.first_id, chunk.rows, plan.user_event_cdf, day_start, span)
+    # Events: pick users by their share of events, timestamps within this partition day
+    user_id = sample_ids(rng, plan.user_event_cdf, chunk.rows)
+    event_timestamp = day_start + rng.integers(0, span, chunk.rows).astype('timedelta64[s]')
+    return event_columns(rng, chunk.first_id, user_id, event_timestamp)
+
 def insert_data_in_batches(client: ClickHouseClient, table: str, data: List[Dict], batch_size: int = 1000):
     """Insert data in batches to avoid memory issues"""
     total_batches = len(data) // batch_size + (1 if len(data) % batch_size > 0 else 0)
@@ -197,7 +730,6 @@ def insert_data_in_batches(client: ClickHouseClient, table: str, data: List[Dict
         batch = data[i:i + batch_size]
         client.insert_data(table, batch)
         print(f"Batch {i // batch_size + 1}/{total_batches} completed for {table}")
-        time.sleep(0.1)  # Small delay to avoid overwhelming the server
 
 def insert_data_by_date(client: ClickHouseClient, table: str, data: List[Dict], date_key: str = 'order_date', max_partitions_per_batch: int = 50, extract_date_from_timestamp: bool = False):
     """Insert data grouped by date to avoid too many partitions error"""
@@ -227,17 +759,213 @@ def insert_data_by_date(client: ClickHouseClient, table: str, data: List[Dict],
             client.insert_data(table, batch_data)
             batch_num += 1
             print(f"Inserted {len(batch_data)} rows for dates {date_batch[0]} to {date_batch[-1]} ({batch_num} date batches)")
-            time.sleep(0.1)  # Small delay to avoid overwhelming the server
+
+def load_legacy(client: ClickHouseClient, seed: int):
+    """Generate every table in memory with the legacy generators, then insert"""
+    print(f"\nGenerating data with the legacy generator (seed {seed})...")
+    start = time.time()
+    dataset = generate_legacy_dataset(seed)
+    print(f"Generated {sum(len(rows) for rows in dataset.values()):,} rows in {time.time() - start:.1f}s")
+    
+    print("\n1. Inserting users data...")
+    insert_data_in_batches(client, "users", dataset['users'])
+    
+    print("\n2. Inserting products data...")
+    insert_data_in_batches(client, "products", dataset['products'])
+    
+    print("\n3. Inserting orders data...")
+    # Use date-grouped insertion to avoid "too many partitions" error
+    insert_data_by_date(client, "orders", dataset['orders'], date_key='order_date', max_partitions_per_batch=50)
+    
+    print("\n4. Inserting events data (this will take a while)...")
+    # Use date-grouped insertion to avoid "too many partitions" error
+    # event_date is MATERIALIZED from event_timestamp, so extract date from timestamp
+    insert_data_by_date(client, "events", dataset['events'], date_key='event_timestamp', max_partitions_per_batch=50, extract_date_from_timestamp=True)
+
+def make_client(insert_format: str = INSERT_FORMAT, compression: str = INSERT_COMPRESSION) -> ClickHouseClient:
+    """Create a ClickHouse client from the environment settings"""
+    return ClickHouseClient(
+        CLICKHOUSE_HOST, CLICKHOUSE_PORT,
+        CLICKHOUSE_USER, CLICKHOUSE_PASSWORD, CLICKHOUSE_DB,
+        insert_format, compression
+    )
+
+def top_share(cdf: np.ndarray, fraction: float) -> float:
+    """Share of draws that go to the most popular `fraction` of IDs"""
+    probabilities = np.sort(np.diff(cdf, prepend=0.0))[::-1]
+    return float(probabilities[:max(1, int(len(probabilities) * fraction))].sum())
+
+def make_plan(args, now: Optional[np.datetime64] = None) -> DatasetPlan:
+    """Build the dataset plan described by the command line options, optionally at a fixed clock"""
+    if args.scale is not None:
+        return DatasetPlan.for_scale(args.scale, args.seed, args.chunk_rows, args.anchor_date)
+    return DatasetPlan(args.seed, args.users, args.products, args.orders, args.events_per_user, args.chunk_rows,
+                       now=now)
+
+def load_streaming(client: ClickHouseClient, args):
+    """Generate chunks and insert them as they are produced, in bounded memory"""
+    from dataset_cache import DatasetCache
+    from dataset_manifest import record_manifest
+    from load_checkpoint import LoadCheckpoint, anchor_now, enable_deduplication, loaded_rows, plan_key
+    from load_pipeline import (MemoryTracker, load_cached_chunks, load_chunks, load_parallel,
+                               replay_open_batches, run_scaling_curve)
+    from part_planner import PartPlanner, report_layout, server_now
+    
+    plan = make_plan(args)
+    use_cache = args.cache and not args.scaling_curve
+    if use_cache and pq is None:
+        print("⚠️  pyarrow is not installed; the Parquet dataset cache is disabled")
+        use_cache = False
+    if use_cache and args.refresh_cache:
+        DatasetCache(plan).discard()
+    checkpointing = args.checkpoint and not args.scaling_curve
+    if checkpointing and args.restart:
+        LoadCheckpoint(plan).discard()
+    # Rebuild the plan with the clock of an interrupted run, or else of a saved snapshot:
+    # chunk boundaries depend on it
+    header = LoadCheckpoint.read_header(plan_key(plan)) if checkpointing else None
+    snapshot = DatasetCache.read_info(plan_key(plan)) if use_cache else None
+    clock = (header or snapshot or {}).get('now')
+    if clock is not None and clock != str(plan.now):
+        plan = make_plan(args, anchor_now({'now': clock}))
+    cache = DatasetCache(plan) if use_cache else None
+    if cache is not None and cache.ready:
+        print(f"\n📦 Loading Parquet snapshot {cache.root} instead of generating"
+              + (f" (dates moved forward {cache.shift_days} days)" if cache.shift_days else ""))
+    checkpoint = None
+    if checkpointing:
+        checkpoint = LoadCheckpoint(plan)
+        if checkpoint.load() and loaded_rows(client) == 0:
+            # A fresh ClickHouse volume with an old checkpoint: nothing it records is there any more
+            print(f"\n⚠️  ClickHouse tables are empty; ignoring checkpoint {checkpoint.path}")
+            checkpoint.discard()
+        if checkpoint.completed or checkpoint.finished:
+            if checkpoint.finished:
+                print(f"\n✅ Checkpoint {checkpoint.path} says this dataset is fully loaded; "
+                      f"use --restart to load it again")
+                return
+            print(f"\n♻️  Resuming from {checkpoint.path}: {checkpoint.summary(plan)}")
+        else:
+            checkpoint.start()
+        enable_deduplication(client)
+    if plan.skewed:
+        print(f"\nScale factor {args.scale:g} (anchor date {plan.today}): top 1% of users produce "
+              f"{top_share(plan.user_event_cdf, 0.01):.0%} of activity, top 1% of products "
+              f"{top_share(plan.product_cdf, 0.01):.0%} of orders")
+    print(f"\nStreaming data with the columnar generator (seed {args.seed}, "
+          f"{args.chunk_rows:,} rows per chunk, pipeline depth {args.pipeline_depth}, "
+          f"{args.format} insert format, {args.compression} compression, "
+          + (f"~{args.part_target_rows:,} rows per INSERT)" if args.part_target_rows else "one INSERT per chunk)"))
+    for table in TABLES:
+        print(f"  {table}: {plan.row_count(table):,} rows in {len(plan.chunks[table]):,} chunks")
+    
+    if args.scaling_curve:
+        run_scaling_curve(client, plan, [int(w) for w in args.scaling_curve.split(',')], args.pipeline_depth,
+                          args.format, args.compression, args.part_target_rows)
+        return
+    since = server_now(client)
+    if checkpoint is not None:
+        # Batches were planned adaptively, so an unconfirmed one is re-sent as it was before anything else
+        replay_open_batches(client, plan, checkpoint, cache, args.pipeline_depth, MemoryTracker(), {})
+    if args.workers > 1:
+        checksums = load_parallel(plan, args.workers, args.pipeline_depth, args.format, args.compression,
+                                  checkpoint, cache, args.part_target_rows)['checksums']
+    else:
+        replay = cache is not None and cache.ready
+        pools = None if replay else build_faker_pools(args.seed)
+        memory = MemoryTracker()
+        checksums = {}
+        start = time.time()
+        for step, table in enumerate(TABLES, 1):
+            print(f"\n{step}. Loading {table} data...")
+            chunks = checkpoint.pending(plan.chunks[table]) if checkpoint else plan.chunks[table]
+            planner = PartPlanner(client, table, args.part_target_rows) if args.part_target_rows else None
+            if replay:
+                load_cached_chunks(client, cache, chunks, memory, checksums, checkpoint, planner)
+            else:
+                load_chunks(client, plan, chunks, pools, args.pipeline_depth, memory, checksums, checkpoint, cache,
+                            planner)
+            if planner is not None:
+                print(f"  {planner.summary()}")
+        elapsed = time.time() - start
+        print(f"\nLoaded {memory.rows:,} rows in {elapsed:.1f}s ({memory.rows / elapsed:,.0f} rows/s)")
+        memory.report()
+    report_layout(client, since)
+    if cache is not None and not cache.ready:
+        cache.finalize(plan)
+    if checkpoint is not None:
+        # Workers append to the same file; re-read it so earlier runs' chunks count too
+        checkpoint.load()
+        checksums = checkpoint.completed_checksums()
+        checkpoint.finish()
+    if plan.scale is not None:
+        record_manifest(plan, checksums)
+
+def parse_args():
+    """Parse command line options"""
+    from part_planner import PART_TARGET_ROWS
+    
+    parser = argparse.ArgumentParser(description="Generate and load ClickHouse demo data")
+    parser.add_argument("--generator", choices=["columnar", "legacy"], default=GENERATOR,
+                        help="columnar: vectorized NumPy generation; legacy: row-by-row Faker")
+    parser.add_argument("--seed", type=int, default=GENERATOR_SEED, help="Random seed for reproducible data")
+    parser.add_argument("--users", type=int, default=10000, help="Number of users")
+    parser.add_argument("--products", type=int, default=1000, help="Number of products")
+    parser.add_argument("--orders", type=int, default=25000, help="Number of orders")
+    parser.add_argument("--events-per-user", type=int, default=50, help="Average events per user")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Max rows per generated chunk")
+    parser.add_argument("--pipeline-depth", type=int, default=PIPELINE_DEPTH,
+                        help="Generated chunks allowed to wait for insert")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("LOADER_WORKERS", "1")),
+                        help="Loader processes; each generates and inserts its own shard of every table")
+    parser.add_argument("--scaling-curve", metavar="N,N,...",
+                        help="Benchmark load time for each worker count (truncates the tables between runs)")
+    parser.add_argument("--scale", type=float, default=float(DATASET_SCALE) if DATASET_SCALE else None,
+                        help=f"TPC-style scale factor ({SCALE_MIN:g}-{SCALE_MAX:g}, SF 1 = 10k users) with skewed "
+                             f"popularity, sessions and growth; overrides the per-table counts")
+    parser.add_argument("--anchor-date", default=SCALE_ANCHOR_DATE,
+                        help="Last day of data for --scale datasets; keep it fixed for comparable runs")
+    parser.add_argument("--manifest-only", action="store_true",
+                        help="Generate the --scale dataset without loading it and write/check its manifest")
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the loaded tables against the --scale manifest")
+    parser.add_argument("--no-checkpoint", dest="checkpoint", action="store_false",
+                        default=os.getenv("LOADER_CHECKPOINT", "1") == "1",
+                        help="Do not record loaded chunks (a restarted load then starts from scratch)")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard the checkpoint of this dataset and load it from the beginning")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        default=os.getenv("DATASET_CACHE", "1") == "1",
+                        help="Neither read nor write the Parquet dataset snapshot")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Regenerate the dataset and overwrite its Parquet snapshot")
+    parser.add_argument("--part-target-rows", type=int, default=PART_TARGET_ROWS,
+                        help="Rows to gather per INSERT so each creates few, large parts (0: one INSERT per chunk)")
+    parser.add_argument("--format", choices=FORMATS, default=INSERT_FORMAT,
+                        help="Insert format for the columnar generator")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default=INSERT_COMPRESSION,
+                        help="HTTP body compression (Parquet uses it as its page codec instead)")
+    args = parser.parse_args()
+    if args.scale is not None and not SCALE_MIN <= args.scale <= SCALE_MAX:
+        parser.error(f"--scale must be between {SCALE_MIN:g} and {SCALE_MAX:g}")
+    if (args.manifest_only or args.verify) and args.scale is None:
+        parser.error("--manifest-only and --verify need --scale")
+    if args.scale is not None and args.generator == 'legacy':
+        parser.error("--scale needs the columnar generator")
+    return args
 
 def main():
     """Main function to generate and insert all test data"""
+    args = parse_args()
+    if args.manifest_only:
+        from dataset_manifest import generate_checksums, record_manifest
+        plan = make_plan(args)
+        record_manifest(plan, generate_checksums(plan))
+        return
     print("Starting data generation for ClickHouse demo...")
     
     # Initialize ClickHouse client
-    client = ClickHouseClient(
-        CLICKHOUSE_HOST, CLICKHOUSE_PORT, 
-        CLICKHOUSE_USER, CLICKHOUSE_PASSWORD, CLICKHOUSE_DB
-    )
+    client = make_client(args.format, args.compression)
     
     # Wait for ClickHouse to be ready
     print("Waiting for ClickHouse to be ready...")
@@ -254,25 +982,10 @@ def main():
             print(f"Attempt {attempt + 1}/{max_retries}: ClickHouse not ready yet, waiting...")
             time.sleep(2)
     
-    # Generate data
-    print("\n1. Generating users data...")
-    users = generate_users(10000)
-    insert_data_in_batches(client, "users", users)
-    
-    print("\n2. Generating products data...")
-    products = generate_products(1000)
-    insert_data_in_batches(client, "products", products)
-    
-    print("\n3. Generating orders data...")
-    orders = generate_orders(10000, 1000, 25000)
-    # Use date-grouped insertion to avoid "too many partitions" error
-    insert_data_by_date(client, "orders", orders, date_key='order_date', max_partitions_per_batch=50)
-    
-    print("\n4. Generating events data (this will take a while)...")
-    events = generate_events(10000, 50)  # 500K+ events
-    # Use date-grouped insertion to avoid "too many partitions" error
-    # event_date is MATERIALIZED from event_timestamp, so extract date from timestamp
-    insert_data_by_date(client, "events", events, date_key='event_timestamp', max_partitions_per_batch=50, extract_date_from_timestamp=True)
+    if args.generator == 'legacy':
+        load_legacy(client, args.seed)
+    else:
+        load_streaming(client, args)
     
     print("\nData generation completed!")
     
@@ -286,6 +999,10 @@ def main():
             print(f"{table}: {count} rows")
         except Exception as e:
             print(f"Error getting count for {table}: {e}")
+    
+    if args.verify:
+        from dataset_manifest import verify_manifest
+        verify_manifest(client, args.scale, args.seed, args.chunk_rows)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Insert payload encoders for the init-data loader
+Builds JSONEachRow, Native or Parquet bodies straight from columnar chunks and compresses them
+"""
+
+import gzip
+import io
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet support is optional
+    pa = pq = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ['jsoneachrow', 'native', 'parquet']
+COMPRESSIONS = ['none', 'gzip', 'lz4', 'zstd']
+
+# Column types as declared in services/clickhouse/init-scripts/01-create-tables.sql
+TABLE_TYPES = {
+    'users': {
+        'user_id': 'UInt64', 'username': 'String', 'email': 'String', 'age': 'UInt8', 'country': 'String',
+        'registration_date': 'Date', 'registration_timestamp': 'DateTime', 'is_premium': 'UInt8',
+        'total_spent': 'Decimal(10, 2)',
+    },
+    'products': {
+        'product_id': 'UInt64', 'product_name': 'String', 'category': 'String', 'price': 'Decimal(10, 2)',
+        'created_date': 'Date', 'is_active': 'UInt8',
+    },
+    'events': {
+        'event_id': 'UInt64', 'user_id': 'UInt64', 'event_type': 'String', 'event_timestamp': 'DateTime',
+        'page_url': 'String', 'session_id': 'String', 'device_type': 'String', 'browser': 'String',
+        'country': 'String', 'duration_seconds': 'UInt32', 'revenue': 'Decimal(10, 2)',
+    },
+    'orders': {
+        'order_id': 'UInt64', 'user_id': 'UInt64', 'product_id': 'UInt64', 'quantity': 'UInt32',
+        'order_date': 'Date', 'order_timestamp': 'DateTime', 'total_amount': 'Decimal(10, 2)',
+        'status': 'String', 'payment_method': 'String',
+    },
+}
+
+UINT_DTYPES = {'UInt8': '<u1', 'UInt16': '<u2', 'UInt32': '<u4', 'UInt64': '<u8'}
+EPOCH_DAY = np.datetime64('1970-01-01', 'D')
+EPOCH_SECOND = np.datetime64('1970-01-01T00:00:00', 's')
+
+
+# --- JSONEachRow -------------------------------------------------------------------
+
+def column_to_python(values: np.ndarray) -> List:
+    """Convert a column to JSON-ready Python values"""
+    if np.issubdtype(values.dtype, np.datetime64):
+        unit = np.datetime_data(values.dtype)[0]
+        text = np.datetime_as_string(values, unit=unit)
+        return np.char.replace(text, 'T', ' ').tolist() if unit == 's' else text.tolist()
+    return values.tolist()
+
+
+def columns_to_rows(columns: Dict[str, np.ndarray]) -> List[Dict]:
+    """Materialize columns as row dicts for the JSONEachRow insert path"""
+    names = list(columns)
+    values = [column_to_python(column) for column in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def encode_jsoneachrow(table: str, columns: Dict[str, np.ndarray]) -> bytes:
+    return "\n".join(json.dumps(row) for row in columns_to_rows(columns)).encode()
+
+
+# --- Native ------------------------------------------------------------------------
+# A single Native block: column count, row count, then per column its name, type and
+# the column data laid out contiguously - which maps directly onto NumPy buffers.
+
+def encode_varuint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def encode_native_string(value: str) -> bytes:
+    data = value.encode()
+    return encode_varuint(len(data)) + data
+
+
+def encode_native_strings(values: np.ndarray) -> bytes:
+    """Length-prefixed strings; vectorized when every value is ASCII and shorter than 128 bytes"""
+    if len(values) == 0:
+        return b""
+    try:
+        fixed = np.asarray(values).astype('S')
+    except UnicodeEncodeError:
+        fixed = None
+    if fixed is not None and fixed.dtype.itemsize < 128:
+        width = fixed.dtype.itemsize
+        lengths = np.char.str_len(fixed)
+        matrix = np.empty((len(fixed), width + 1), dtype=np.uint8)
+        matrix[:, 0] = lengths  # single-byte varint
+        matrix[:, 1:] = fixed.view(np.uint8).reshape(len(fixed), width)
+        return matrix[np.arange(width + 1) <= lengths[:, None]].tobytes()
+    # Encode each distinct value once; categorical columns have very few
+    uniques, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    encoded = np.array([encode_native_string(value) for value in uniques], dtype=object)
+    return b"".join(encoded[inverse.ravel()])
+
+
+def encode_native_column(column_type: str, values: np.ndarray) -> bytes:
+    if column_type in UINT_DTYPES:
+        return np.asarray(values).astype(UINT_DTYPES[column_type]).tobytes()
+    if column_type == 'String':
+        return encode_native_strings(values)
+    if column_type == 'Date':
+        return (values.astype('datetime64[D]') - EPOCH_DAY).astype('<u2').tobytes()
+    if column_type == 'DateTime':
+        # Generated timestamps are naive; they are sent as UTC, the server default timezone in the image
+        return (values.astype('datetime64[s]') - EPOCH_SECOND).astype('<u4').tobytes()
+    if column_type.startswith('Decimal('):
+        scale = int(column_type.rstrip(')').split(',')[1])
+        # Decimal(P<=18, S) is stored as Int64 scaled by 10^S
+        return np.round(np.asarray(values, dtype=np.float64) * 10 ** scale).astype('<i8').tobytes()
+    raise ValueError(f"Native encoding not implemented for {column_type}")
+
+
+def encode_native(table: str, columns: Dict[str, np.ndarray]) -> bytes:
+    types = TABLE_TYPES[table]
+    rows = len(next(iter(columns.values())))
+    parts = [encode_varuint(len(columns)), encode_varuint(rows)]
+    for name, values in columns.items():
+        parts.append(encode_native_string(name))
+        parts.append(encode_native_string(types[name]))
+        parts.append(encode_native_column(types[name], values))
+    return b"".join(parts)
+
+
+# --- Parquet -----------------------------------------------------------------------
+
+def arrow_array(column_type: str, values: np.ndarray):
+    if column_type in UINT_DTYPES:
+        return pa.array(np.asarray(values).astype(UINT_DTYPES[column_type][1:]))
+    if column_type == 'String':
+        return pa.array(np.asarray(values, dtype=object), type=pa.string())
+    if column_type == 'Date':
+        return pa.array(values.astype('datetime64[D]'), type=pa.date32())
+    if column_type == 'DateTime':
+        return pa.array(values.astype('datetime64[s]'), type=pa.timestamp('s'))
+    if column_type.startswith('Decimal('):
+        # ClickHouse casts Float64 to the Decimal column on insert
+        return pa.array(np.asarray(values, dtype=np.float64))
+    raise ValueError(f"Parquet encoding not implemented for {column_type}")
+
+
+def to_arrow_table(table: str, columns: Dict[str, np.ndarray]):
+    if pa is None:
+        raise RuntimeError("Parquet support requires pyarrow (pip install pyarrow)")
+    types = TABLE_TYPES[table]
+    return pa.table({name: arrow_array(types[name], values) for name, values in columns.items()})
+
+
+def encode_parquet(table: str, columns: Dict[str, np.ndarray], compression: str = 'zstd') -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(to_arrow_table(table, columns), buffer, compression=compression)
+    return buffer.getvalue()
+
+
+class ParquetSink(io.RawIOBase):
+    """Write-only file for ParquetWriter that hands over what has been written so far"""
+
+    def __init__(self):
+        super().__init__()
+        self.pieces: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.pieces.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.pieces = b"".join(self.pieces), []
+        return data
+
+
+def encode_parquet_stream(table: str, blocks: Iterable[Dict[str, np.ndarray]], compression: str = 'zstd') -> Iterator[bytes]:
+    """One Parquet file written a row group per block, yielding each row group as soon as it is
+    encoded; only the footer waits for the last block"""
+    sink, writer = ParquetSink(), None
+    for block in blocks:
+        arrow_table = to_arrow_table(table, ordered_columns(table, block))
+        if writer is None:
+            writer = pq.ParquetWriter(sink, arrow_table.schema, compression=compression)
+        writer.write_table(arrow_table, row_group_size=max(arrow_table.num_rows, 1))
+        data = sink.drain()
+        if data:
+            yield data
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+# --- HTTP body compression ---------------------------------------------------------
+
+def compress_body(body: bytes, compression: str) -> Tuple[bytes, Dict[str, str]]:
+    """Compress an HTTP body and return it with the matching Content-Encoding header"""
+    if compression == 'none':
+        return body, {}
+    if compression == 'gzip':
+        return gzip.compress(body, compresslevel=1), {'Content-Encoding': 'gzip'}
+    if compression == 'lz4':
+        if lz4_frame is None:
+            raise RuntimeError("LZ4 compression requires the lz4 package (pip install lz4)")
+        return lz4_frame.compress(body), {'Content-Encoding': 'lz4'}
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("ZSTD compression requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=1).compress(body), {'Content-Encoding': 'zstd'}
+    raise ValueError(f"Unknown compression '{compression}' (expected one of {', '.join(COMPRESSIONS)})")
+
+
+class StreamCompressor:
+    """Incremental counterpart of compress_body for bodies sent in pieces"""
+
+    def __init__(self, compression: str):
+        self.compression = compression
+        if compression == 'gzip':
+            self.compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif compression == 'lz4':
+            if lz4_frame is None:
+                raise RuntimeError("LZ4 compression requires the lz4 package (pip install lz4)")
+            self.compressor = lz4_frame.LZ4FrameCompressor()
+            self.header = self.compressor.begin()
+        elif compression == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("ZSTD compression requires the zstandard package (pip install zstandard)")
+            self.compressor = zstandard.ZstdCompressor(level=1).compressobj()
+        elif compression != 'none':
+            raise ValueError(f"Unknown compression '{compression}' (expected one of {', '.join(COMPRESSIONS)})")
+
+    def headers(self) -> Dict[str, str]:
+        return {} if self.compression == 'none' else {'Content-Encoding': self.compression}
+
+    def compress(self, data: bytes) -> bytes:
+        if self.compression == 'none':
+            return data
+        if self.compression == 'lz4' and self.header:
+            data, self.header = self.header + self.compressor.compress(data), b""
+            return data
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.compression == 'none':
+            return b""
+        if self.compression == 'lz4':
+            return self.header + self.compressor.flush()
+        return self.compressor.flush()
+
+
+def ordered_columns(table: str, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Columns in schema order, so every block of a streamed INSERT has the same header"""
+    return {name: columns[name] for name in TABLE_TYPES[table]}
+
+
+def encode_insert_stream(table: str, blocks: Iterable[Dict[str, np.ndarray]], insert_format: str, compression: str,
+                         target: Optional[str] = None) -> Tuple[str, Iterator[bytes], Dict[str, str]]:
+    """Build (INSERT query, body iterator, headers) sending several chunks as one INSERT, optionally
+    into another target. Native and JSONEachRow bodies can simply be concatenated; Parquet cannot,
+    so its chunks become the row groups of one file that is written out as it goes."""
+    column_list = ", ".join(TABLE_TYPES[table])
+    if insert_format == 'parquet':
+        if pq is None:
+            raise RuntimeError("Parquet support requires pyarrow (pip install pyarrow)")
+        # Parquet pages are compressed internally, as in encode_insert
+        parquet_codec = compression if compression in ('lz4', 'zstd', 'gzip') else 'none'
+        return (f"INSERT INTO {target or table} ({column_list}) FORMAT Parquet",
+                encode_parquet_stream(table, blocks, parquet_codec), {})
+    if insert_format == 'native':
+        encode, clickhouse_format = encode_native, 'Native'
+    elif insert_format == 'jsoneachrow':
+        encode, clickhouse_format = (lambda t, c: encode_jsoneachrow(t, c) + b"\n"), 'JSONEachRow'
+    else:
+        raise ValueError(f"Unknown insert format '{insert_format}' (expected one of {', '.join(FORMATS)})")
+    compressor = StreamCompressor(compression)
+
+    def body() -> Iterator[bytes]:
+        for block in blocks:
+            data = compressor.compress(encode(table, ordered_columns(table, block)))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    return f"INSERT INTO {target or table} ({column_list}) FORMAT {clickhouse_format}", body(), compressor.headers()
+
+
+def encode_insert(table: str, columns: Dict[str, np.ndarray], insert_format: str,
+                  compression: str, target: Optional[str] = None) -> Tuple[str, bytes, Dict[str, str]]:
+    """Build (INSERT query, body, headers) for a columnar chunk of `table`, optionally into another target"""
+    column_list = ", ".join(columns)
+    if insert_format == 'jsoneachrow':
+        body, clickhouse_format = encode_jsoneachrow(table, columns), 'JSONEachRow'
+    elif insert_format == 'native':
+        body, clickhouse_format = encode_native(table, columns), 'Native'
+    elif insert_format == 'parquet':
+        # Parquet pages are compressed internally; HTTP compression on top gains little
+        parquet_codec = compression if compression in ('lz4', 'zstd', 'gzip') else 'none'
+        body, clickhouse_format = encode_parquet(table, columns, parquet_codec), 'Parquet'
+        compression = 'none'
+    else:
+        raise ValueError(f"Unknown insert format '{insert_format}' (expected one of {', '.join(FORMATS)})")
+    body, headers = compress_body(body, compression)
+    return f"INSERT INTO {target or table} ({column_list}) FORMAT {clickhouse_format}", body, headers
+
+
+def shifted_insert_query(table: str, days: int, clickhouse_format: str) -> str:
+    """INSERT that moves every Date/DateTime column forward by whole days while reading the payload"""
+    types = TABLE_TYPES[table]
+    structure = ", ".join(f"{name} {column_type}" for name, column_type in types.items())
+    values = [f"{name} + INTERVAL {days} DAY" if column_type in ('Date', 'DateTime') else name
+              for name, column_type in types.items()]
+    return (f"INSERT INTO {table} ({', '.join(types)}) SELECT {', '.join(values)} "
+            f"FROM input('{structure}') FORMAT {clickhouse_format}")
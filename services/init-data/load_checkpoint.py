@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Checkpoints for resumable bulk loads
+Every acknowledged chunk INSERT is appended to a JSON-lines file; a restarted load rebuilds the same
+plan, skips the recorded chunks and regenerates only the missing ones from their seeds
+"""
+
+import json
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from clickhouse_common import is_clustered
+
+from dataset_manifest import add_checksums
+from generate_data import TABLES, ChunkSpec, DatasetPlan
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints"))
+DEDUPLICATION_WINDOW = 1000  # recent insert blocks remembered per table for insert_deduplication_token
+
+
+def plan_key(plan: DatasetPlan) -> str:
+    """Stable name for a dataset definition; chunk boundaries and contents depend on every part of it
+    (a scale factor fixes all the other sizes)"""
+    if plan.scale is not None:
+        size = f"sf{plan.scale:g}"
+    else:
+        size = "-".join(f"{table}{plan.row_count(table)}" for table in ('users', 'products', 'orders'))
+        size += f"-epu{plan.events_per_user}" + ("-skewed" if plan.skewed else "")
+    return f"{size}-seed{plan.seed}-chunk{plan.chunk_rows}"
+
+
+class LoadCheckpoint:
+    """Append-only record of the chunks ClickHouse has acknowledged for one dataset"""
+
+    def __init__(self, plan: DatasetPlan, directory: str = CHECKPOINT_DIR):
+        self.key = plan_key(plan)
+        self.path = os.path.join(directory, f"{self.key}.jsonl")
+        self.header = {'key': self.key, 'now': str(plan.now)}
+        self.completed: Dict[Tuple[str, int], Dict] = {}
+        self.batches: List[Tuple[str, List[int]]] = []  # INSERTs that were started
+        self.finished = False
+
+    @staticmethod
+    def read_header(plan_key_name: str, directory: str = CHECKPOINT_DIR) -> Optional[Dict]:
+        """Header of an existing checkpoint, used to rebuild the plan with the same clock"""
+        path = os.path.join(directory, f"{plan_key_name}.jsonl")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.loads(f.readline())
+
+    def load(self) -> bool:
+        """Read completed chunks from an existing checkpoint; returns False if there is none"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            text = f.read()
+        lines = text.splitlines()
+        header = json.loads(lines[0])
+        if header != self.header:
+            raise ValueError(f"Checkpoint {self.path} was written for a different plan ({header}); "
+                             f"rerun with --restart to discard it")
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn line from a crash; that chunk is simply loaded again
+            if entry.get('finished'):
+                self.finished = True
+            elif 'batch' in entry:
+                self.batches.append((entry['table'], entry['batch']))
+            else:
+                self.completed[(entry['table'], entry['index'])] = entry['checksums']
+        if not text.endswith("\n"):
+            # Terminate a torn last line so the next record starts on its own line
+            with open(self.path, 'a') as f:
+                f.write("\n")
+        return True
+
+    def start(self):
+        """Create a new checkpoint file for this plan"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(self.header) + "\n")
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.completed.clear()
+        self.batches.clear()
+        self.finished = False
+
+    def pending(self, chunks: List[ChunkSpec]) -> List[ChunkSpec]:
+        return [chunk for chunk in chunks if (chunk.table, chunk.index) not in self.completed]
+
+    def open_batches(self, plan: DatasetPlan) -> List[List[ChunkSpec]]:
+        """Started INSERTs whose chunks were not all recorded; they may or may not have been committed"""
+        batches = []
+        for table, indices in self.batches:
+            if any((table, index) not in self.completed for index in indices):
+                batches.append([plan.chunks[table][index] for index in indices])
+        return batches
+
+    def token(self, batch: List[ChunkSpec]) -> str:
+        """Deterministic insert_deduplication_token: a retried batch has the same token and the same rows"""
+        first, last = batch[0], batch[-1]
+        if len(batch) == 1:
+            return f"{self.key}/{first.table}/{first.index}"
+        digest = zlib.crc32(",".join(str(chunk.index) for chunk in batch).encode())
+        return f"{self.key}/{first.table}/{first.index}-{last.index}/{digest:08x}"
+
+    def begin(self, batch: List[ChunkSpec]):
+        """Record an INSERT before sending it, so a resumed load can replay exactly the same batch"""
+        entry = {'table': batch[0].table, 'batch': [chunk.index for chunk in batch]}
+        self.append(entry)
+        self.batches.append((entry['table'], entry['batch']))
+
+    def append(self, entry: Dict):
+        # One short line per write with O_APPEND, so concurrent workers never interleave lines
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, chunk: ChunkSpec, checksums: Dict[str, int]):
+        """Mark a chunk as committed once ClickHouse has acknowledged its INSERT"""
+        self.append({'table': chunk.table, 'index': chunk.index, 'checksums': checksums})
+        self.completed[(chunk.table, chunk.index)] = checksums
+
+    def finish(self):
+        self.append({'finished': True})
+        self.finished = True
+
+    def completed_checksums(self) -> Dict[str, Dict[str, int]]:
+        """Manifest checksums of the chunks loaded by earlier runs"""
+        totals = {}
+        for (table, _), checksums in self.completed.items():
+            add_checksums(totals, table, checksums)
+        return totals
+
+    def summary(self, plan: DatasetPlan) -> str:
+        total = sum(len(plan.chunks[table]) for table in TABLES)
+        rows = sum(checksums['rows'] for checksums in self.completed.values())
+        return f"{len(self.completed):,}/{total:,} chunks ({rows:,} rows) already loaded"
+
+
+def enable_deduplication(client):
+    """Make sure the tables keep a deduplication window, also for tables created before it was in the schema"""
+    if is_clustered():
+        return  # the cluster's tables are Replicated, which deduplicate by default
+    for table in TABLES:
+        client.execute(f"ALTER TABLE {table} MODIFY SETTING "
+                       f"non_replicated_deduplication_window = {DEDUPLICATION_WINDOW}")
+
+
+def loaded_rows(client) -> int:
+    """Rows currently in the demo tables"""
+    return sum(int(client.execute(f"SELECT count() FROM {table}").text.strip()) for table in TABLES)
+
+
+def anchor_now(header: Optional[Dict]) -> Optional[np.datetime64]:
+    return None if header is None else np.datetime64(header['now'], 's')
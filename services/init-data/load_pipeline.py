@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Bounded generation-to-insert pipeline for the init-data loader
+A generator thread produces chunks into a small queue while the main thread inserts them,
+so at most PIPELINE_DEPTH + 2 chunks are ever held in memory
+"""
+
+import os
+import queue
+import resource
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from clickhouse_common import local_table, on_cluster
+
+from dataset_cache import DatasetCache
+from dataset_manifest import add_checksums, chunk_checksums, merge_checksums
+from generate_data import (INSERT_COMPRESSION, INSERT_FORMAT, TABLES, ChunkSpec, DatasetPlan,
+                           build_faker_pools, generate_chunk, make_client)
+from load_checkpoint import LoadCheckpoint
+from part_planner import PART_TARGET_ROWS, FixedBatch, PartPlanner
+
+_DONE = object()
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MiB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        # ru_maxrss is the peak, not the current value, but is the best portable fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MemoryTracker:
+    """Samples RSS as rows are loaded to show whether memory stays flat"""
+
+    def __init__(self):
+        self.baseline = current_rss_mb()
+        self.samples = []  # (rows_loaded, rss_mb)
+        self.rows = 0
+
+    def sample(self, rows: int):
+        self.rows += rows
+        self.samples.append((self.rows, current_rss_mb()))
+
+    def report(self):
+        if not self.samples:
+            return
+        peak = max(rss for _, rss in self.samples)
+        peak_rusage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print("\n=== Memory ===")
+        print(f"Baseline RSS: {self.baseline:.1f} MiB")
+        print(f"Peak RSS while loading: {peak:.1f} MiB (process max {peak_rusage:.1f} MiB)")
+        # RSS at fixed fractions of the load; a flat profile means memory is independent of row count
+        for fraction in (0.1, 0.25, 0.5, 0.75, 1.0):
+            target = self.rows * fraction
+            rows, rss = next((r, m) for r, m in self.samples if r >= target)
+            print(f"  after {rows:>12,} rows ({fraction:>4.0%}): {rss:8.1f} MiB")
+        first_quarter = [m for r, m in self.samples if r <= self.rows * 0.25] or [self.samples[0][1]]
+        last_quarter = [m for r, m in self.samples if r >= self.rows * 0.75]
+        print(f"Growth from first to last quarter of the load: {max(last_quarter) - max(first_quarter):+.1f} MiB")
+
+
+def produce_chunks(plan: DatasetPlan, chunks: List[ChunkSpec], pools: Dict[str, np.ndarray],
+                   out: queue.Queue, stop: threading.Event):
+    """Generate chunks in order; put() blocks while the queue is full"""
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                return
+            out.put((chunk, generate_chunk(plan, chunk, pools)))
+        out.put(_DONE)
+    except BaseException as e:
+        out.put(e)
+
+
+def stream_chunks(plan: DatasetPlan, chunks: List[ChunkSpec], pools: Dict[str, np.ndarray],
+                  depth: int) -> Iterator[Tuple[ChunkSpec, Dict[str, np.ndarray]]]:
+    """Yield generated chunks from a background generator thread through a bounded queue"""
+    out = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    producer = threading.Thread(target=produce_chunks, args=(plan, chunks, pools, out, stop), daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue
+        while producer.is_alive():
+            try:
+                out.get_nowait()
+            except queue.Empty:
+                time.sleep(0.01)
+
+
+def dedup_settings(checkpoint: Optional[LoadCheckpoint], batch: List[ChunkSpec]) -> Optional[Dict]:
+    """A batch retried after a crash carries the same token, so ClickHouse drops the duplicate"""
+    return {'insert_deduplication_token': checkpoint.token(batch)} if checkpoint else None
+
+
+def record_batch(done: List[Tuple[ChunkSpec, Dict[str, int]]], memory: MemoryTracker,
+                 checksums: Optional[Dict], checkpoint: Optional[LoadCheckpoint]):
+    """Account for the chunks of an acknowledged INSERT"""
+    for chunk, sums in done:
+        if checksums is not None:
+            add_checksums(checksums, chunk.table, sums)
+        if checkpoint is not None:
+            checkpoint.record(chunk, sums)
+        memory.sample(sums['rows'])
+
+
+def load_chunks(client, plan: DatasetPlan, chunks: List[ChunkSpec], pools: Dict[str, np.ndarray],
+                depth: int, memory: MemoryTracker, checksums: Optional[Dict] = None,
+                checkpoint: Optional[LoadCheckpoint] = None, cache: Optional[DatasetCache] = None,
+                planner=None):
+    """Generate chunks and insert them in planned batches; each batch is one streamed INSERT"""
+    stream = stream_chunks(plan, chunks, pools, depth)
+    batches = planner.batches(chunks) if planner else ([chunk] for chunk in chunks)
+    try:
+        for batch in batches:
+            done = []
+
+            def blocks(batch=batch, done=done):
+                for _ in batch:
+                    chunk, columns = next(stream)
+                    sums = chunk_checksums(chunk.table, columns)
+                    if cache is not None:
+                        # Written before the INSERT, so every chunk the checkpoint records is also in the snapshot
+                        cache.write(chunk, columns, sums)
+                    done.append((chunk, sums))
+                    yield columns
+
+            if checkpoint is not None:
+                checkpoint.begin(batch)
+            client.insert_column_blocks(batch[0].table, blocks(), dedup_settings(checkpoint, batch))
+            record_batch(done, memory, checksums, checkpoint)
+    finally:
+        stream.close()
+
+
+def load_cached_chunks(client, cache: DatasetCache, chunks: List[ChunkSpec], memory: MemoryTracker,
+                       checksums: Optional[Dict] = None, checkpoint: Optional[LoadCheckpoint] = None,
+                       planner=None):
+    """Send snapshot files to ClickHouse - no generation, and no re-encoding for single-chunk batches"""
+    batches = planner.batches(chunks) if planner else ([chunk] for chunk in chunks)
+    for batch in batches:
+        body, sums = cache.read_batch(batch)
+        if checkpoint is not None:
+            checkpoint.begin(batch)
+        client.insert_parquet(batch[0].table, body, cache.shift_days, dedup_settings(checkpoint, batch))
+        record_batch(list(zip(batch, sums)), memory, checksums, checkpoint)
+
+
+def replay_open_batches(client, plan: DatasetPlan, checkpoint: LoadCheckpoint, cache: Optional[DatasetCache],
+                        depth: int, memory: MemoryTracker, checksums: Dict):
+    """Re-send INSERTs an interrupted run started but did not record, with their original chunks and token"""
+    batches = checkpoint.open_batches(plan)
+    if not batches:
+        return
+    print(f"\n♻️  Replaying {len(batches)} unconfirmed INSERTs from the interrupted run")
+    pools = None if cache is not None and cache.ready else build_faker_pools(plan.seed)
+    for batch in batches:
+        if pools is None:
+            load_cached_chunks(client, cache, batch, memory, checksums, checkpoint, FixedBatch())
+        else:
+            load_chunks(client, plan, batch, pools, depth, memory, checksums, checkpoint, cache, FixedBatch())
+
+
+# --- Parallel loading -------------------------------------------------------------
+# Chunk contents depend only on (seed, table, chunk index), so sharding the chunk list
+# across processes changes who generates a chunk but never what it contains.
+
+def shard_chunks(chunks: List[ChunkSpec], workers: int, shard: int) -> List[ChunkSpec]:
+    """Contiguous ID range of chunks assigned to one shard"""
+    return chunks[len(chunks) * shard // workers:len(chunks) * (shard + 1) // workers]
+
+
+def load_shard(plan: DatasetPlan, workers: int, shard: int, depth: int,
+               insert_format: str = INSERT_FORMAT, compression: str = INSERT_COMPRESSION,
+               checkpoint: Optional[LoadCheckpoint] = None, cache: Optional[DatasetCache] = None,
+               target_rows: int = PART_TARGET_ROWS) -> Dict:
+    """Worker entry point: generate (or read from the snapshot) and insert one shard of every table"""
+    client = make_client(insert_format, compression)
+    replay = cache is not None and cache.ready
+    pools = None if replay else build_faker_pools(plan.seed)
+    memory = MemoryTracker()
+    checksums = {}
+    start = time.time()
+    for table in TABLES:
+        # Shard only what is still missing so a resumed load stays balanced
+        chunks = checkpoint.pending(plan.chunks[table]) if checkpoint else plan.chunks[table]
+        chunks = shard_chunks(chunks, workers, shard)
+        planner = PartPlanner(client, table, target_rows) if target_rows else None
+        if replay:
+            load_cached_chunks(client, cache, chunks, memory, checksums, checkpoint, planner)
+        else:
+            load_chunks(client, plan, chunks, pools, depth, memory, checksums, checkpoint, cache, planner)
+        if planner is not None and planner.batch_count:
+            print(f"  [shard {shard}] {planner.summary()}")
+    return {
+        'shard': shard,
+        'checksums': checksums,
+        'rows': memory.rows,
+        'seconds': time.time() - start,
+        'peak_rss_mb': max((rss for _, rss in memory.samples), default=memory.baseline),
+    }
+
+
+def load_parallel(plan: DatasetPlan, workers: int, depth: int,
+                  insert_format: str = INSERT_FORMAT, compression: str = INSERT_COMPRESSION,
+                  checkpoint: Optional[LoadCheckpoint] = None, cache: Optional[DatasetCache] = None,
+                  target_rows: int = PART_TARGET_ROWS) -> Dict:
+    """Load the whole plan with `workers` processes and report per-shard results"""
+    print(f"\nLoading with {workers} worker processes...")
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(load_shard, plan, workers, shard, depth, insert_format, compression, checkpoint,
+                               cache, target_rows)
+                   for shard in range(workers)]
+        shards = [future.result() for future in futures]
+    elapsed = time.time() - start
+    rows = sum(shard['rows'] for shard in shards)
+    print(f"\n=== Parallel load ({workers} workers) ===")
+    for shard in shards:
+        print(f"  shard {shard['shard']:>2}: {shard['rows']:>12,} rows in {shard['seconds']:7.1f}s, "
+              f"peak RSS {shard['peak_rss_mb']:.1f} MiB")
+    print(f"Loaded {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    return {'workers': workers, 'rows': rows, 'seconds': elapsed,
+            'checksums': merge_checksums(shard['checksums'] for shard in shards)}
+
+
+def truncate_tables(client):
+    """Empty the demo tables (and the rollup fed by events) between benchmark runs"""
+    for table in TABLES + ['daily_user_activity']:
+        client.execute(f"TRUNCATE TABLE IF EXISTS {local_table(table)}{on_cluster()}")
+
+
+def run_scaling_curve(client, plan: DatasetPlan, worker_counts: List[int], depth: int,
+                      insert_format: str = INSERT_FORMAT, compression: str = INSERT_COMPRESSION,
+                      target_rows: int = PART_TARGET_ROWS):
+    """Load the same dataset at several worker counts and report the speedup curve"""
+    print(f"\n⚠️  Scaling benchmark: tables are truncated before each of {len(worker_counts)} runs")
+    results = []
+    for workers in worker_counts:
+        truncate_tables(client)
+        results.append(load_parallel(plan, workers, depth, insert_format, compression,
+                                     target_rows=target_rows))
+    base = next((r for r in results if r['workers'] == 1), results[0])
+    base_rate = base['rows'] / base['seconds'] / base['workers']
+    print("\n=== Scaling curve ===")
+    print(f"{'workers':>7} {'seconds':>9} {'rows/s':>12} {'speedup':>8} {'efficiency':>10}")
+    for r in results:
+        rate = r['rows'] / r['seconds']
+        speedup = rate / base_rate
+        print(f"{r['workers']:>7} {r['seconds']:>9.1f} {rate:>12,.0f} {speedup:>7.2f}x {speedup / r['workers']:>9.0%}")
+    print(f"(CPU cores available: {os.cpu_count()}; efficiency falling well below 100% before that "
+          f"point means ClickHouse, not generation, is the bottleneck)")
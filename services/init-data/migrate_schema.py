@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Online schema migration to the storage layout of the schema file (LowCardinality columns and codecs)
+Each table is rebuilt while the streamer keeps writing: a shadow table is created from its CREATE
+statement in 01-create-tables.sql, filled partition by partition up to an ID watermark, caught up on
+the rows written meanwhile, then swapped in with EXCHANGE TABLES. Compressed column sizes and the
+latency of the dashboard's queries are measured before and after.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import generate_data as gd
+from clickhouse_common import HTTPTransport, is_clustered, local_table, on_cluster, summary
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The image carries the schema under schema/; in a checkout it is services/clickhouse
+SCHEMA_DIR = os.getenv("SCHEMA_DIR") or next(
+    (path for path in (os.path.join(HERE, 'schema'), os.path.join(HERE, '..', 'clickhouse')) if os.path.isdir(path)),
+    os.path.join(HERE, 'schema'))
+SHADOW_SUFFIX = "__shadow"
+RECONCILE_ATTEMPTS = 3  # rounds of reconcile + verify before giving up on the swap
+# Rows written while a table is copied are found by ID: every writer takes the next IDs after the current max.
+# Rows that break this (written below the copied IDs) and rows deleted meanwhile are reconciled by key before the swap.
+ID_COLUMNS = {'users': 'user_id', 'products': 'product_id', 'events': 'event_id', 'orders': 'order_id'}
+TABLES = list(ID_COLUMNS)
+
+# The dashboard's queries (services/app/app.py), plus full scans grouped by each categorical column
+DASHBOARD_QUERIES = {
+    'table_counts': "SELECT (SELECT count() FROM users), (SELECT count() FROM events), "
+                    "(SELECT count() FROM products), (SELECT count() FROM orders)",
+    'active_users_30d': "SELECT uniq(user_id) FROM events WHERE event_timestamp >= now() - INTERVAL 30 DAY",
+    'completed_revenue': "SELECT sum(total_amount), avg(total_amount) FROM orders WHERE status = 'completed'",
+    'daily_events': "SELECT toDate(event_timestamp) AS date, count(), uniq(user_id) FROM events "
+                    "WHERE event_timestamp >= now() - INTERVAL 30 DAY GROUP BY date ORDER BY date",
+    'event_types': "SELECT event_type, count() AS count FROM events "
+                   "WHERE event_timestamp >= now() - INTERVAL 7 DAY GROUP BY event_type ORDER BY count DESC",
+    'top_countries': "SELECT country, count() AS user_count, avg(age), sum(total_spent) FROM users "
+                     "GROUP BY country ORDER BY user_count DESC LIMIT 10",
+    'revenue_by_month': "SELECT toYYYYMM(order_date) AS month, sum(total_amount), count() FROM orders "
+                        "WHERE status = 'completed' AND order_date >= today() - INTERVAL 12 MONTH "
+                        "GROUP BY month ORDER BY month",
+    'top_products': "SELECT p.product_name, p.category, p.price, sum(o.quantity) AS total_sold, sum(o.total_amount) "
+                    "FROM orders o JOIN products p ON o.product_id = p.product_id WHERE o.status = 'completed' "
+                    "GROUP BY p.product_id, p.product_name, p.category, p.price ORDER BY total_sold DESC LIMIT 20",
+    'user_segments': "SELECT multiIf(total_spent >= 1000, 'High Value', total_spent >= 500, 'Medium Value', "
+                     "total_spent >= 100, 'Low Value', 'New Customer') AS segment, count(), avg(total_spent) AS "
+                     "avg_spent, avg(age) FROM users GROUP BY segment ORDER BY avg_spent DESC",
+    'devices_browsers': "SELECT device_type, browser, count() FROM events GROUP BY device_type, browser",
+    'events_by_country': "SELECT country, count(), sum(revenue) FROM events GROUP BY country",
+    'orders_by_payment': "SELECT payment_method, status, count() FROM orders GROUP BY payment_method, status",
+}
+
+
+def schema_statements(path: Optional[str] = None) -> List[str]:
+    """Statements of the schema file for this deployment, comments removed"""
+    path = path or os.path.join(SCHEMA_DIR, 'cluster' if is_clustered() else '', 'init-scripts', '01-create-tables.sql')
+    with open(path) as f:
+        text = "\n".join(line for line in f.read().splitlines() if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in text.split(';') if statement.strip()]
+
+
+def table_statement(statements: List[str], name: str) -> str:
+    for statement in statements:
+        if re.match(rf"CREATE TABLE IF NOT EXISTS (\w+\.)?{name}\b", statement):
+            return statement
+    raise ValueError(f"No CREATE TABLE for {name} in the schema file")
+
+
+def shadow_statement(statement: str, name: str, shadow: str, generation: str) -> str:
+    """The table's CREATE statement for its shadow; replicated tables get a fresh Keeper path, since the
+    shadow keeps its path when it takes over the table's name and a later migration needs a new one"""
+    statement = re.sub(rf"/{name}'", f"/{name}_{generation}'", statement)
+    return re.sub(rf"^(CREATE TABLE IF NOT EXISTS (\w+\.)?){name}\b", rf"\g<1>{shadow}", statement, count=1)
+
+
+def views_reading(statements: List[str], name: str) -> Dict[str, str]:
+    """Materialized views that read the table -> their SELECT"""
+    views = {}
+    for statement in statements:
+        match = re.match(r"CREATE MATERIALIZED VIEW IF NOT EXISTS (?:\w+\.)?(\w+)", statement)
+        if match and re.search(rf"\bFROM (\w+\.)?{name}\b", statement):
+            views[match.group(1)] = statement[re.search(r"\bAS\s+SELECT\b", statement).start() + 2:].strip()
+    return views
+
+
+def restricted(select: str, condition: str) -> str:
+    """A view's SELECT limited to the source rows matching the condition"""
+    query, count = re.subn(r"(\bFROM\s+\S+)(\s+GROUP BY\b)", rf"\1 WHERE {condition}\2", select, count=1)
+    if not count:
+        raise ValueError(f"Cannot add a WHERE clause to: {select}")
+    return query
+
+
+class TableMigration:
+    """Copy one table into its shadow on every node that holds its rows, then swap the two"""
+
+    def __init__(self, client: gd.ClickHouseClient, table: str, statements: List[str], generation: str,
+                 catchup_rows: int, catchup_rounds: int):
+        self.client = client
+        self.table = table
+        self.name = local_table(table)
+        self.shadow = self.name + SHADOW_SUFFIX
+        self.id_column = ID_COLUMNS[table]
+        self.create_shadow = shadow_statement(table_statement(statements, self.name), self.name, self.shadow, generation)
+        self.views = views_reading(statements, self.name)
+        self.catchup_rows = catchup_rows
+        self.catchup_rounds = catchup_rounds
+        # Sharded tables are copied on each shard; replicated ones on the first node and replicate from there
+        self.nodes: List[HTTPTransport] = client.shards if client.sharded(table) else [client.transport]
+        self.copied = [0] * len(self.nodes)  # per node, rows up to this ID are in the shadow
+
+    def value(self, node: HTTPTransport, query: str) -> int:
+        return int(node.text(query) or 0)
+
+    def layout(self, table: str) -> List[tuple]:
+        rows = self.client.transport.text(f"SELECT name, type, compression_codec FROM system.columns "
+                                          f"WHERE database = '{self.client.database}' AND table = '{table}' "
+                                          f"ORDER BY position")
+        return [tuple(line.split('\t')) for line in rows.splitlines()]
+
+    def insert_columns(self) -> str:
+        """Columns written by the copy: MATERIALIZED ones are computed again by the target"""
+        return ", ".join(self.client.transport.text(
+            f"SELECT name FROM system.columns WHERE database = '{self.client.database}' AND table = '{self.name}' "
+            f"AND default_kind NOT IN ('MATERIALIZED', 'ALIAS') ORDER BY position").splitlines())
+
+    def copy(self, node: HTTPTransport, source: str, target: str, condition: str) -> int:
+        columns = self.insert_columns()
+        # Copied blocks may repeat ones already inserted; they must not be dropped as duplicates
+        response = node.post(f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {source} WHERE {condition}",
+                             settings={'insert_deduplicate': 0})
+        return summary(response).get('written_rows', 0)
+
+    def bulk_copy(self):
+        """Everything up to the current max ID, one partition at a time"""
+        for index, node in enumerate(self.nodes):
+            watermark = self.value(node, f"SELECT max({self.id_column}) FROM {self.name}")
+            partitions = node.text(f"SELECT DISTINCT partition_id FROM system.parts WHERE database = "
+                                   f"'{self.client.database}' AND table = '{self.name}' AND active "
+                                   f"ORDER BY partition_id").splitlines()
+            rows = 0
+            for number, partition in enumerate(partitions, 1):
+                rows += self.copy(node, self.name, self.shadow,
+                                  f"_partition_id = '{partition}' AND {self.id_column} <= {watermark}")
+                print(f"\r   {self.name}: partition {number}/{len(partitions)}, {rows:,} rows", end="", flush=True)
+            print()
+            self.copied[index] = watermark
+
+    def catch_up(self, source: str, target: str) -> int:
+        """Copy the rows written to source since the last copy; returns how many there were"""
+        rows = 0
+        for index, node in enumerate(self.nodes):
+            watermark = self.value(node, f"SELECT max({self.id_column}) FROM {source}")
+            if watermark > self.copied[index]:
+                rows += self.copy(node, source, target,
+                                  f"{self.id_column} > {self.copied[index]} AND {self.id_column} <= {watermark}")
+                self.copied[index] = watermark
+        return rows
+
+    def reconcile(self, source: str, target: str, removable: List[int]) -> Tuple[int, int]:
+        """Make target hold the same IDs as source up to the copied ones: the streamer's cleanup deletes rows
+        after they were copied, and a row written with an ID below the watermark is never caught up.
+        Only rows up to the removable IDs (per node) were copied into target and may be deleted from it.
+        Returns the rows added and removed"""
+        added = removed = 0
+        for index, node in enumerate(self.nodes):
+            below = f"{self.id_column} <= {self.copied[index]}"
+            added += self.copy(node, source, target, f"{below} AND {self.id_column} NOT IN "
+                                                     f"(SELECT {self.id_column} FROM {target} WHERE {below})")
+            below = f"{self.id_column} <= {removable[index]}"
+            gone = f"{below} AND {self.id_column} NOT IN (SELECT {self.id_column} FROM {source} WHERE {below})"
+            count = self.value(node, f"SELECT count() FROM {target} WHERE {gone}")
+            if count:
+                node.post(f"DELETE FROM {target} WHERE {gone}", settings={'mutations_sync': 2})
+                removed += count
+        return added, removed
+
+    def verify(self, source: str, target: str) -> List[str]:
+        """Nodes on which target and source hold different row counts up to the copied IDs"""
+        problems = []
+        for index, node in enumerate(self.nodes):
+            below = f"{self.id_column} <= {self.copied[index]}"
+            expected = self.value(node, f"SELECT count() FROM {source} WHERE {below}")
+            copied = self.value(node, f"SELECT count() FROM {target} WHERE {below}")
+            if copied != expected:
+                problems.append(f"{target} has {copied:,} rows up to ID {self.copied[index]}, {source} {expected:,}")
+        return problems
+
+    def run(self, keep_old: bool):
+        execute = self.client.execute
+        execute(f"DROP TABLE IF EXISTS {self.shadow}{on_cluster()} SYNC")
+        execute(self.create_shadow)
+        if self.layout(self.shadow) == self.layout(self.name):
+            execute(f"DROP TABLE {self.shadow}{on_cluster()} SYNC")
+            print(f"✅ {self.name} already has the target layout")
+            return
+
+        print(f"📋 Copying {self.name} into {self.shadow}...")
+        self.bulk_copy()
+        for round_number in range(1, self.catchup_rounds + 1):
+            rows = self.catch_up(self.name, self.shadow)
+            print(f"   catch-up {round_number}: {rows:,} rows")
+            if rows <= self.catchup_rows:
+                break
+        for attempt in range(1, RECONCILE_ATTEMPTS + 1):
+            added, removed = self.reconcile(self.name, self.shadow, self.copied)
+            print(f"   reconcile {attempt}: {added:,} rows written below the copied IDs added, "
+                  f"{removed:,} deleted rows removed")
+            problems = self.verify(self.name, self.shadow)
+            if not problems:
+                break
+        else:
+            raise RuntimeError(f"{'; '.join(problems)}; not swapping")
+        if is_clustered() and not self.client.sharded(self.table):
+            # Every replica must have the copy before it becomes the table
+            execute(f"SYSTEM SYNC REPLICA{on_cluster()} {self.shadow}")
+
+        # The views are detached across the swap so they attach to the new table by name; the rows
+        # written in between are added to them afterwards by ID (an INSERT in flight at that very moment
+        # can be missed or counted twice)
+        detached = {}
+        try:
+            for view in self.views:
+                execute(f"DETACH TABLE {view}{on_cluster()}")
+                detached[view] = [self.value(node, f"SELECT max({self.id_column}) FROM {self.name}")
+                                  for node in self.nodes]
+            swapped_at = list(self.copied)
+            execute(f"EXCHANGE TABLES {self.name} AND {self.shadow}{on_cluster()}")
+            # The previous table is now called {shadow}: bring over what was written to it before the swap
+            print(f"🔀 Swapped; {self.catch_up(self.shadow, self.name):,} rows written during the swap copied")
+            attached = [self.value(node, f"SELECT max({self.id_column}) FROM {self.name}") for node in self.nodes]
+        finally:
+            for view in detached:
+                execute(f"ATTACH TABLE {view}{on_cluster()}")
+        for view, since in detached.items():
+            rows = 0
+            for node, low, high in zip(self.nodes, since, attached):
+                if high > low:
+                    select = restricted(self.views[view], f"{self.id_column} > {low} AND {self.id_column} <= {high}")
+                    rows += summary(node.post(f"INSERT INTO {view} {select}")).get('written_rows', 0)
+            print(f"   {view}: {rows:,} rows from the swap added")
+
+        # Deletes and late writes that reached the previous table between the last reconcile and the swap;
+        # rows above the IDs copied before the swap may have been written to the new table directly
+        added, removed = self.reconcile(self.shadow, self.name, swapped_at)
+        print(f"   after the swap: {added:,} rows added, {removed:,} deleted rows removed")
+        problems = self.verify(self.shadow, self.name)
+        if problems:
+            print(f"⚠️  {'; '.join(problems)}")
+            keep_old = True
+        if self.name != self.table:
+            self.align_distributed()
+        if keep_old:
+            print(f"   previous table kept as {self.shadow}")
+        else:
+            execute(f"DROP TABLE {self.shadow}{on_cluster()} SYNC")
+        print(f"✅ {self.table} migrated")
+
+    def align_distributed(self):
+        """Give the Distributed table the new column types; it only stores metadata"""
+        current = {name: column_type for name, column_type, _ in self.layout(self.table)}
+        for name, column_type, _ in self.layout(self.name):
+            if current.get(name) != column_type:
+                self.client.execute(f"ALTER TABLE {self.table}{on_cluster()} MODIFY COLUMN {name} {column_type}")
+
+
+def column_sizes(client: gd.ClickHouseClient, tables: List[str]) -> Dict[str, Dict[str, Dict]]:
+    """table -> column -> compressed and uncompressed bytes, over all shards of the sharded tables"""
+    sizes = {}
+    for table in tables:
+        nodes = client.shards if client.sharded(table) else [client.transport]
+        columns = {}
+        for node in nodes:
+            rows = node.text(f"SELECT name, type, data_compressed_bytes, data_uncompressed_bytes FROM system.columns "
+                             f"WHERE database = '{client.database}' AND table = '{local_table(table)}' ORDER BY position")
+            for line in rows.splitlines():
+                name, column_type, compressed, uncompressed = line.split('\t')
+                column = columns.setdefault(name, {'type': column_type, 'compressed': 0, 'uncompressed': 0})
+                column['compressed'] += int(compressed)
+                column['uncompressed'] += int(uncompressed)
+        sizes[table] = columns
+    return sizes
+
+
+def query_latency(client: gd.ClickHouseClient, runs: int) -> Dict[str, float]:
+    """Median milliseconds of each dashboard query over `runs` runs after one warm-up"""
+    latency = {}
+    for name, sql in DASHBOARD_QUERIES.items():
+        client.transport.post(sql, workload='dashboard')
+        seconds = []
+        for _ in range(runs):
+            start = time.time()
+            client.transport.post(sql, workload='dashboard')
+            seconds.append(time.time() - start)
+        latency[name] = statistics.median(seconds) * 1000
+    return latency
+
+
+def measure(client: gd.ClickHouseClient, tables: List[str], runs: int) -> Dict:
+    return {'sizes': column_sizes(client, tables), 'latency_ms': query_latency(client, runs)}
+
+
+def mib(value: int) -> str:
+    return f"{value / 2 ** 20:,.1f}"
+
+
+def print_report(before: Dict, after: Optional[Dict]):
+    after = after or before
+    print(f"\n=== Compressed size (MiB) ===")
+    print(f"{'column':<34} {'type':<24} {'before':>9} {'after':>9} {'ratio':>7}")
+    for table, columns in after['sizes'].items():
+        old_columns = before['sizes'].get(table, {})
+        total_before = sum(column['compressed'] for column in old_columns.values())
+        total_after = sum(column['compressed'] for column in columns.values())
+        for name, column in columns.items():
+            old = old_columns.get(name, column)['compressed']
+            print(f"{f'{table}.{name}':<34} {column['type'][:24]:<24} {mib(old):>9} {mib(column['compressed']):>9} "
+                  f"{old / max(column['compressed'], 1):>6.1f}x")
+        print(f"{table + ' total':<34} {'':<24} {mib(total_before):>9} {mib(total_after):>9} "
+              f"{total_before / max(total_after, 1):>6.1f}x\n")
+
+    print(f"=== Dashboard query latency (median ms) ===")
+    print(f"{'query':<20} {'before':>9} {'after':>9} {'speedup':>8}")
+    for name, old in before['latency_ms'].items():
+        new = after['latency_ms'][name]
+        print(f"{name:<20} {old:>9.1f} {new:>9.1f} {old / max(new, 1e-3):>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move tables to the schema file's column types and codecs online")
+    parser.add_argument("--tables", default=",".join(TABLES), help="Comma-separated tables to migrate")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs of every dashboard query")
+    parser.add_argument("--catchup-rows", type=int, default=10000,
+                        help="Swap once a catch-up round copies at most this many rows")
+    parser.add_argument("--catchup-rounds", type=int, default=10, help="Catch-up rounds before swapping regardless")
+    parser.add_argument("--keep-old", action="store_true", help="Keep each previous table as <table>__shadow")
+    parser.add_argument("--dry-run", action="store_true", help="Print the shadow tables' DDL and stop")
+    parser.add_argument("--report-only", action="store_true", help="Measure sizes and latency without migrating")
+    parser.add_argument("--output", help="Write the measurements as JSON")
+    args = parser.parse_args()
+
+    tables = [table.strip() for table in args.tables.split(',') if table.strip()]
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        print(f"❌ Unknown tables: {', '.join(sorted(unknown))} (choose from {', '.join(TABLES)})")
+        sys.exit(1)
+
+    client = gd.make_client()
+    statements = schema_statements()
+    generation = time.strftime('%Y%m%d%H%M%S')
+    migrations = [TableMigration(client, table, statements, generation, args.catchup_rows, args.catchup_rounds)
+                  for table in tables]
+    if args.dry_run:
+        for migration in migrations:
+            views = f" (then re-attaches {', '.join(migration.views)})" if migration.views else ""
+            print(f"-- {migration.name} -> {migration.shadow}{views}\n{migration.create_shadow};\n")
+        return
+
+    print(f"📏 Measuring {', '.join(tables)} before the migration...")
+    before = measure(client, tables, args.runs)
+    after = None
+    if not args.report_only:
+        for migration in migrations:
+            migration.run(args.keep_old)
+        print("📏 Measuring after the migration...")
+        after = measure(client, tables, args.runs)
+    print_report(before, after)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'before': before, 'after': after}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Part-aware insert planning for the init-data loader
+Every INSERT creates at least one part per partition it touches. The planner groups consecutive
+chunks into INSERTs sized toward a target part, and grows that target (or waits) when the
+table's active part count shows merges falling behind.
+"""
+
+import os
+import time
+from typing import Iterable, Iterator, List, Tuple
+
+import requests
+from clickhouse_common import cluster_source, local_table, on_cluster
+
+from generate_data import TABLES, ChunkSpec
+
+PART_TARGET_ROWS = int(os.getenv("PART_TARGET_ROWS", "1000000"))  # ~ the server's min_insert_block_size_rows
+MAX_PARTITIONS_PER_INSERT = int(os.getenv("MAX_PARTITIONS_PER_INSERT", "50"))  # server limit is 100
+MAX_ACTIVE_PARTS = int(os.getenv("MAX_ACTIVE_PARTS", "1000"))  # per table, before inserts wait for merges
+PARTS_PER_PARTITION_SOFT = 8   # above this many active parts per partition, batches grow
+MAX_TARGET_FACTOR = 4
+MERGE_WAIT_TIMEOUT = 120       # seconds to wait for merges before inserting anyway
+REFRESH_INTERVAL = 2.0         # seconds between system.parts checks
+
+
+class PartPlanner:
+    """Turns a table's chunk list into INSERT batches"""
+
+    def __init__(self, client, table: str, target_rows: int = PART_TARGET_ROWS,
+                 max_partitions: int = MAX_PARTITIONS_PER_INSERT, max_active_parts: int = MAX_ACTIVE_PARTS):
+        self.client = client
+        self.table = table
+        self.base_rows = target_rows
+        self.target_rows = target_rows
+        self.max_partitions = max_partitions
+        self.max_active_parts = max_active_parts
+        self.last_refresh = 0.0
+        self.batch_count = 0
+        self.chunk_count = 0
+        self.merge_waits = 0
+
+    def active_parts(self) -> Tuple[int, int]:
+        """(active parts, partitions) of the table, on its busiest node when it is sharded"""
+        response = self.client.execute(
+            f"SELECT max(parts), max(partitions) FROM (SELECT hostName() AS host, count() AS parts, "
+            f"uniqExact(partition) AS partitions FROM {cluster_source('system.parts')} "
+            f"WHERE database = '{self.client.database}' AND table = '{local_table(self.table)}' AND active "
+            f"GROUP BY host) FORMAT TabSeparated")
+        parts, partitions = response.text.split()
+        return int(parts), int(partitions)
+
+    def refresh(self):
+        """Adapt the batch target to the current part count, waiting if there are far too many parts"""
+        if time.time() - self.last_refresh < REFRESH_INTERVAL:
+            return
+        parts, partitions = self.active_parts()
+        if parts >= self.max_active_parts:
+            self.merge_waits += 1
+            print(f"⏳ {self.table} has {parts:,} active parts; waiting for merges to catch up")
+            deadline = time.time() + MERGE_WAIT_TIMEOUT
+            while parts >= self.max_active_parts and time.time() < deadline:
+                time.sleep(1)
+                parts, partitions = self.active_parts()
+        # Merges are behind: create fewer, larger parts
+        factor = min(MAX_TARGET_FACTOR, max(1.0, parts / max(1, partitions) / PARTS_PER_PARTITION_SOFT))
+        self.target_rows = int(self.base_rows * factor)
+        self.last_refresh = time.time()
+
+    def fits(self, rows: int, partitions: set, chunk: ChunkSpec) -> bool:
+        if rows + chunk.rows > self.target_rows:
+            return False
+        return chunk.day in partitions or len(partitions) < self.max_partitions
+
+    def batches(self, chunks: Iterable[ChunkSpec]) -> Iterator[List[ChunkSpec]]:
+        """Consecutive chunks grouped up to the target rows and partition limit; a chunk larger
+        than the target forms its own batch. The target is re-evaluated after each batch."""
+        batch, rows, partitions = [], 0, set()
+        for chunk in chunks:
+            if batch and not self.fits(rows, partitions, chunk):
+                yield self.emit(batch)
+                self.refresh()
+                batch, rows, partitions = [], 0, set()
+            batch.append(chunk)
+            rows += chunk.rows
+            partitions.add(chunk.day)
+        if batch:
+            yield self.emit(batch)
+
+    def emit(self, batch: List[ChunkSpec]) -> List[ChunkSpec]:
+        self.batch_count += 1
+        self.chunk_count += len(batch)
+        return batch
+
+    def summary(self) -> str:
+        return (f"{self.table}: {self.chunk_count:,} chunks in {self.batch_count:,} INSERTs "
+                f"(target {self.base_rows:,} rows per part, last {self.target_rows:,}; "
+                f"waited for merges {self.merge_waits} times)")
+
+
+class FixedBatch:
+    """Planner stand-in that inserts the given chunks as exactly one batch (to replay a recorded one)"""
+
+    def batches(self, chunks: Iterable[ChunkSpec]) -> Iterator[List[ChunkSpec]]:
+        yield list(chunks)
+
+
+def server_now(client) -> str:
+    return client.execute("SELECT now() FORMAT TabSeparated").text.strip()
+
+
+def report_layout(client, since: str):
+    """Final part layout of the demo tables and the merge activity since `since`"""
+    # Sharded tables keep their rows in <table>_local on every node; their parts are summed over the nodes
+    tables = ", ".join(f"'{local_table(table)}'" for table in TABLES)
+    response = client.execute(
+        f"SELECT table, uniqExact(partition), count(), sum(rows), max(level), sum(bytes_on_disk) "
+        f"FROM {cluster_source('system.parts')} WHERE database = '{client.database}' AND active "
+        f"AND table IN ({tables}) GROUP BY table ORDER BY table FORMAT TabSeparated")
+    print("\n=== Part layout ===")
+    print(f"{'table':<14} {'partitions':>10} {'parts':>7} {'rows':>14} {'rows/part':>11} {'max level':>9} {'MiB':>9}")
+    for line in response.text.strip().splitlines():
+        table, partitions, parts, rows, level, size = line.split('\t')
+        print(f"{table:<14} {int(partitions):>10,} {int(parts):>7,} {int(rows):>14,} "
+              f"{int(rows) / max(1, int(parts)):>11,.0f} {int(level):>9} {int(size) / 2 ** 20:>9,.1f}")
+    merging = client.execute(f"SELECT count() FROM {cluster_source('system.merges')} "
+                             f"WHERE database = '{client.database}'").text.strip()
+    print(f"Merges still running: {merging}")
+    try:
+        client.execute(f"SYSTEM FLUSH LOGS{on_cluster()}")
+        response = client.execute(
+            f"SELECT table, countIf(event_type = 'NewPart'), countIf(event_type = 'MergeParts'), "
+            f"sumIf(duration_ms, event_type = 'MergeParts') FROM {cluster_source('system.part_log')} "
+            f"WHERE database = '{client.database}' AND table IN ({tables}) AND event_time >= '{since}' "
+            f"GROUP BY table ORDER BY table FORMAT TabSeparated")
+    except requests.HTTPError:
+        print("(system.part_log is not enabled; merge activity is not available)")
+        return
+    print(f"{'table':<14} {'new parts':>10} {'merges':>8} {'merge time':>11}")
+    for line in response.text.strip().splitlines():
+        table, new_parts, merges, merge_ms = line.split('\t')
+        print(f"{table:<14} {int(new_parts):>10,} {int(merges):>8,} {int(merge_ms) / 1000:>10.1f}s")
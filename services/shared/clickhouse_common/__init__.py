@@ -0,0 +1,29 @@
+"""
+Shared ClickHouse access for the demo services
+Pooled native and HTTP transports with retries, compression, per-workload settings, query_id
+tagging and timing hooks, so a connection or performance fix is made in one place
+"""
+
+from .config import ClickHouseConfig
+from .hooks import QueryStats, add_query_hook, remove_query_hook
+from .retry import backoff, error_code, is_retryable, with_retries
+from .sharding import (CLICKHOUSE_CLUSTER, LOCAL_SUFFIX, SHARDED_TABLES, cluster_source, is_clustered, local_table,
+                       on_cluster, parse_shards, split_columns, split_rows)
+from .workloads import WORKLOAD_SETTINGS, make_query_id, workload_settings
+
+try:
+    from .http_transport import HTTPTransport, summary
+except ImportError:  # requests is only installed in the HTTP services
+    HTTPTransport = summary = None
+
+try:
+    from .native_pool import NativePool
+except ImportError:  # clickhouse-driver is only installed in the native services
+    NativePool = None
+
+__all__ = [
+    'ClickHouseConfig', 'QueryStats', 'add_query_hook', 'remove_query_hook', 'backoff', 'error_code', 'is_retryable',
+    'with_retries', 'CLICKHOUSE_CLUSTER', 'LOCAL_SUFFIX', 'SHARDED_TABLES', 'cluster_source', 'is_clustered',
+    'local_table', 'on_cluster', 'parse_shards', 'split_columns', 'split_rows', 'WORKLOAD_SETTINGS', 'make_query_id',
+    'workload_settings', 'HTTPTransport', 'summary', 'NativePool',
+]
@@ -0,0 +1,35 @@
+"""
+Connection settings shared by the services, read from the environment
+Each service keeps its own CLICKHOUSE_* connection settings (HTTP services talk to 8123, native ones
+to 9000) and builds a ClickHouseConfig from them; the pool and retry knobs below are the same everywhere
+"""
+
+import os
+from typing import NamedTuple
+
+CLICKHOUSE_POOL_SIZE = int(os.getenv('CLICKHOUSE_POOL_SIZE', '8'))  # idle connections kept per process
+CLICKHOUSE_CONNECT_TIMEOUT = float(os.getenv('CLICKHOUSE_CONNECT_TIMEOUT', '5'))
+CLICKHOUSE_TIMEOUT = float(os.getenv('CLICKHOUSE_TIMEOUT', '300'))  # seconds to wait for a response
+CLICKHOUSE_RETRIES = int(os.getenv('CLICKHOUSE_RETRIES', '3'))  # attempts after the first one
+CLICKHOUSE_RETRY_BASE = float(os.getenv('CLICKHOUSE_RETRY_BASE', '0.2'))  # seconds, doubled per attempt
+CLICKHOUSE_RETRY_MAX = float(os.getenv('CLICKHOUSE_RETRY_MAX', '5'))  # cap on a single backoff
+# lz4 (or zstd) on the native protocol when the codec packages are installed, none to turn off
+CLICKHOUSE_COMPRESSION = os.getenv('CLICKHOUSE_COMPRESSION', 'lz4')
+# Ask for gzip HTTP responses and gzip request bodies larger than this many bytes (0 turns both off)
+CLICKHOUSE_HTTP_COMPRESS_BYTES = int(os.getenv('CLICKHOUSE_HTTP_COMPRESS_BYTES', str(64 * 1024)))
+
+
+class ClickHouseConfig(NamedTuple):
+    host: str
+    port: int
+    user: str
+    password: str
+    database: str
+    service: str = 'demo'  # first part of every query_id, to find a service's queries in system.query_log
+    pool_size: int = CLICKHOUSE_POOL_SIZE
+    connect_timeout: float = CLICKHOUSE_CONNECT_TIMEOUT
+    timeout: float = CLICKHOUSE_TIMEOUT
+    retries: int = CLICKHOUSE_RETRIES
+    compression: str = CLICKHOUSE_COMPRESSION
+    http_compress_bytes: int = CLICKHOUSE_HTTP_COMPRESS_BYTES
+
@@ -0,0 +1,50 @@
+"""
+Timing hooks: every query sent through a transport is reported to the registered callbacks
+"""
+
+import logging
+import threading
+from typing import Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats(NamedTuple):
+    service: str
+    workload: str
+    query_id: str
+    transport: str                          # http or native
+    is_insert: bool
+    seconds: float                          # client wall time, all attempts and backoff included
+    attempts: int
+    error: Optional[str] = None             # the last error's type and message when the query failed
+    server_seconds: Optional[float] = None  # as reported by the server, when it reports it
+    read_rows: Optional[int] = None
+    written_rows: Optional[int] = None
+
+
+_hooks: List[Callable[[QueryStats], None]] = []
+_lock = threading.Lock()
+
+
+def add_query_hook(hook: Callable[[QueryStats], None]):
+    """Call hook(stats) after every query, from the thread that ran it; keep it cheap"""
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_query_hook(hook: Callable[[QueryStats], None]):
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def notify(stats: QueryStats):
+    """A failing hook is logged and never fails the query"""
+    with _lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(stats)
+        except Exception as e:
+            logger.warning("ClickHouse query hook %r failed: %s", hook, e)
@@ -0,0 +1,105 @@
+"""
+HTTP transport: one keep-alive connection pool per process, shared by its threads
+"""
+
+import gzip
+import json
+import time
+from typing import Dict, Iterator, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import ClickHouseConfig
+from .hooks import QueryStats, notify
+from .retry import with_retries
+from .workloads import make_query_id, workload_settings
+
+Body = Union[bytes, str, Iterator[bytes]]
+
+
+def summary(response: requests.Response) -> Dict:
+    """X-ClickHouse-Summary as numbers: read_rows, written_rows, elapsed_ns (recent servers) and so on"""
+    values = json.loads(response.headers.get('X-ClickHouse-Summary', '{}'))
+    return {key: int(value) for key, value in values.items() if str(value).isdigit()}
+
+
+def is_insert(query: str) -> bool:
+    return query.lstrip()[:6].upper() == 'INSERT'
+
+
+class HTTPTransport:
+    """Queries over the HTTP interface with pooled connections, retries, compression and query_id tagging"""
+
+    def __init__(self, config: ClickHouseConfig, workload: str = 'default'):
+        self.config = config
+        self.workload = workload
+        self.base_url = f"http://{config.host}:{config.port}"
+        self.session = requests.Session()
+        self.session.auth = (config.user, config.password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size)
+        self.session.mount('http://', adapter)
+
+    def post(self, query: str, body: Optional[Body] = None, settings: Optional[Dict] = None,
+             workload: Optional[str] = None, query_id: Optional[str] = None, headers: Optional[Dict] = None,
+             idempotent: Optional[bool] = None, timeout: Optional[float] = None) -> requests.Response:
+        """Run a statement, raising requests.HTTPError on a server error
+
+        Without a body the statement is the request body (gzipped when large); with one, the statement
+        goes in the URL and the body is sent as is, so INSERT payloads can be binary, pre-compressed
+        (say so in headers) or a generator that is streamed. INSERTs are only retried on errors that
+        prove they did not run, unless they carry an insert_deduplication_token or idempotent=True;
+        streamed bodies are never retried because they cannot be replayed.
+        """
+        workload = workload or self.workload
+        query_id = query_id or make_query_id(self.config.service, workload)
+        params = {'database': self.config.database, 'query_id': query_id, **workload_settings(workload, settings)}
+        headers = dict(headers or {})
+        if body is None:
+            data = query.encode()
+            headers.setdefault('Content-Type', 'text/plain; charset=utf-8')
+            if self.config.http_compress_bytes and len(data) >= self.config.http_compress_bytes:
+                data = gzip.compress(data, compresslevel=1)
+                headers['Content-Encoding'] = 'gzip'
+        else:
+            params['query'] = query
+            data = body
+            headers.setdefault('Content-Type', 'application/octet-stream')
+        if self.config.http_compress_bytes:
+            params['enable_http_compression'] = 1  # gzip responses; requests decodes them
+        insert = is_insert(query)
+        if idempotent is None:
+            idempotent = not insert or 'insert_deduplication_token' in params
+        replayable = isinstance(data, (bytes, str))
+
+        attempts = 1
+        def count_retry(attempt: int, error: Exception, delay: float):
+            nonlocal attempts
+            attempts = attempt + 1
+
+        def send() -> requests.Response:
+            response = self.session.post(self.base_url, params=params, data=data, headers=headers,
+                                         timeout=(self.config.connect_timeout, timeout or self.config.timeout))
+            response.raise_for_status()
+            return response
+
+        start = time.time()
+        response, error = None, None
+        try:
+            response = with_retries(send, self.config.retries if replayable else 0, idempotent, count_retry)
+            return response
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            counters = summary(response) if response is not None else {}
+            notify(QueryStats(self.config.service, workload, query_id, 'http', insert, time.time() - start,
+                              attempts, error, counters['elapsed_ns'] / 1e9 if 'elapsed_ns' in counters else None,
+                              counters.get('read_rows'), counters.get('written_rows')))
+
+    def text(self, query: str, settings: Optional[Dict] = None, workload: Optional[str] = None) -> str:
+        """Result of a query as stripped text (TabSeparated unless the query says otherwise)"""
+        return self.post(query, settings=settings, workload=workload).text.strip()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,139 @@
+"""
+Native protocol transport: a pool of clickhouse-driver clients shared by a process's threads
+A Client holds one connection and is not thread safe, so each query checks one out and returns it
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from clickhouse_driver import Client
+
+from .config import ClickHouseConfig
+from .hooks import QueryStats, notify
+from .retry import with_retries
+from .workloads import make_query_id, workload_settings
+
+logger = logging.getLogger(__name__)
+
+
+def native_compression(name: str):
+    """Compression argument for Client: the codec if its packages are installed, else False"""
+    if not name or name.lower() in ('none', 'false', '0'):
+        return False
+    try:
+        import clickhouse_cityhash.cityhash  # noqa: F401  checksums of compressed blocks
+        if name == 'lz4':
+            import lz4  # noqa: F401
+        elif name == 'zstd':
+            import zstd  # noqa: F401
+        else:
+            raise ValueError(f"Unknown native compression {name!r} (expected lz4, zstd or none)")
+    except ImportError as e:
+        logger.warning("Native %s compression unavailable (%s); sending uncompressed blocks", name, e)
+        return False
+    return name
+
+
+class NativePool:
+    """Up to pool_size idle connections, most recently used first; a checkout never waits, so how many
+    queries run at once is up to the caller"""
+
+    def __init__(self, config: ClickHouseConfig, workload: str = 'default'):
+        self.config = config
+        self.workload = workload
+        self.compression = native_compression(config.compression)
+        self.lock = threading.Lock()
+        self.idle: List[Client] = []
+        self.created = 0
+        self.checkouts = 0
+        self.reuses = 0
+
+    def connect(self) -> Client:
+        return Client(host=self.config.host, port=self.config.port, user=self.config.user,
+                      password=self.config.password, database=self.config.database,
+                      compression=self.compression, connect_timeout=self.config.connect_timeout,
+                      send_receive_timeout=self.config.timeout, sync_request_timeout=self.config.connect_timeout)
+
+    def acquire(self) -> Client:
+        """A client for this thread alone; give it back with release()"""
+        with self.lock:
+            self.checkouts += 1
+            if self.idle:
+                self.reuses += 1
+                return self.idle.pop()
+            self.created += 1
+        return self.connect()
+
+    def release(self, client: Client, reset: bool = False):
+        """Return a client; reset disconnects it first (a query may still be streaming on it)"""
+        if reset:
+            client.disconnect()
+        with self.lock:
+            if len(self.idle) < self.config.pool_size:
+                self.idle.append(client)
+                return
+        client.disconnect()
+
+    @contextmanager
+    def connection(self) -> Iterator[Client]:
+        client = self.acquire()
+        try:
+            yield client
+        except BaseException:
+            self.release(client, reset=True)
+            raise
+        self.release(client)
+
+    def execute(self, query: str, params: Any = None, settings: Optional[Dict] = None,
+                workload: Optional[str] = None, query_id: Optional[str] = None, idempotent: Optional[bool] = None,
+                **kwargs) -> Any:
+        """Client.execute on a pooled connection, with workload settings, a query_id and retries;
+        INSERTs are only retried when the server rejected them, unless idempotent=True"""
+        workload = workload or self.workload
+        query_id = query_id or make_query_id(self.config.service, workload)
+        settings = workload_settings(workload, settings)
+        insert = query.lstrip()[:6].upper() == 'INSERT'
+        if idempotent is None:
+            idempotent = not insert or 'insert_deduplication_token' in settings
+
+        attempts = 1
+        def count_retry(attempt: int, error: Exception, delay: float):
+            nonlocal attempts
+            attempts = attempt + 1
+
+        last_query = None
+        def run():
+            nonlocal last_query
+            with self.connection() as client:
+                result = client.execute(query, params, settings=settings, query_id=query_id, **kwargs)
+                last_query = client.last_query
+                return result
+
+        start = time.time()
+        error = None
+        try:
+            return with_retries(run, self.config.retries, idempotent, count_retry)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            progress = last_query.progress if last_query is not None else None
+            notify(QueryStats(self.config.service, workload, query_id, 'native', insert, time.time() - start,
+                              attempts, error, last_query.elapsed if last_query is not None else None,
+                              progress.rows if progress else None,
+                              progress.written_rows if progress else None))
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'idle': len(self.idle), 'max_idle': self.config.pool_size, 'created': self.created,
+                    'checkouts': self.checkouts, 'reuses': self.reuses,
+                    'compression': self.compression or 'none'}
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for client in idle:
+            client.disconnect()
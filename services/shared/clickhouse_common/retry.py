@@ -0,0 +1,91 @@
+"""
+Retries with full-jitter exponential backoff
+A query is retried when the server turned it away without running it, or, for statements that are
+safe to run twice, when the connection failed; anything else is raised at once
+"""
+
+import random
+import time
+from typing import Callable, Optional, TypeVar
+
+from .config import CLICKHOUSE_RETRIES, CLICKHOUSE_RETRY_BASE, CLICKHOUSE_RETRY_MAX
+
+try:
+    import requests
+except ImportError:  # only the HTTP services install requests
+    requests = None
+
+try:
+    from clickhouse_driver import errors as driver_errors
+except ImportError:  # only the native services install clickhouse-driver
+    driver_errors = None
+
+T = TypeVar('T')
+
+# Server error codes meaning the query was rejected before it ran: retrying cannot duplicate anything
+REJECTED_CODES = {
+    202,  # TOO_MANY_SIMULTANEOUS_QUERIES
+    203,  # NO_FREE_CONNECTION
+    252,  # TOO_MANY_PARTS
+    439,  # CANNOT_SCHEDULE_TASK
+}
+# Server error codes worth retrying when running the statement twice is harmless
+TRANSIENT_CODES = REJECTED_CODES | {
+    3,    # UNEXPECTED_END_OF_FILE
+    209,  # SOCKET_TIMEOUT
+    210,  # NETWORK_ERROR
+    242,  # TABLE_IS_READ_ONLY
+    319,  # UNKNOWN_STATUS_OF_INSERT
+    425,  # SYSTEM_ERROR
+    999,  # KEEPER_EXCEPTION
+}
+RETRYABLE_HTTP_STATUSES = {502, 503, 504}
+
+
+def error_code(exc: Exception) -> Optional[int]:
+    """ClickHouse error code carried by a driver or HTTP error, if any"""
+    if driver_errors is not None and isinstance(exc, driver_errors.Error):
+        return getattr(exc, 'code', None)
+    response = getattr(exc, 'response', None)
+    code = response.headers.get('X-ClickHouse-Exception-Code') if response is not None else None
+    return int(code) if code and code.isdigit() else None
+
+
+def is_retryable(exc: Exception, idempotent: bool = True) -> bool:
+    """Driver network errors carry codes 209/210, so the code check covers both transports"""
+    code = error_code(exc)
+    if code is not None:
+        return code in (TRANSIENT_CODES if idempotent else REJECTED_CODES)
+    if requests is not None:
+        if isinstance(exc, requests.exceptions.ConnectTimeout):
+            return True  # never reached the server
+        if isinstance(exc, requests.HTTPError):
+            return idempotent and exc.response is not None \
+                and exc.response.status_code in RETRYABLE_HTTP_STATUSES
+        if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+            return idempotent
+    return idempotent and isinstance(exc, (ConnectionError, EOFError))
+
+
+def backoff(attempt: int, base: float = CLICKHOUSE_RETRY_BASE, cap: float = CLICKHOUSE_RETRY_MAX) -> float:
+    """Full jitter: uniform in [0, min(cap, base * 2^attempt)], so retrying clients spread out"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def with_retries(call: Callable[[], T], retries: int = CLICKHOUSE_RETRIES, idempotent: bool = True,
+                 on_retry: Optional[Callable[[int, Exception, float], None]] = None,
+                 sleep: Callable[[float], None] = time.sleep) -> T:
+    """call() until it succeeds, raises something not retryable, or retries run out;
+    on_retry(attempt, error, delay) is told about every retry before its backoff"""
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e, idempotent):
+                raise
+            delay = backoff(attempt)
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, e, delay)
+            sleep(delay)
@@ -0,0 +1,68 @@
+"""
+Shard-aware inserts for the cluster deployment (docker-compose.cluster.yml)
+With CLICKHOUSE_SHARDS set, rows of the sharded tables are sent straight to the <table>_local table
+of the shard that owns them instead of through the Distributed table, which would otherwise buffer
+and forward them. The owner is computed exactly like the Distributed tables do: the sharding key is
+the plain user_id, and with equal shard weights the shard is user_id modulo the shard count, in
+remote_servers order.
+"""
+
+import os
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # only the bulk loader splits columnar chunks
+    np = None
+
+CLICKHOUSE_SHARDS = os.getenv('CLICKHOUSE_SHARDS', '')  # host:port per shard, in remote_servers order
+CLICKHOUSE_CLUSTER = os.getenv('CLICKHOUSE_CLUSTER', 'demo_cluster')
+# Distributed table -> its sharding key column (the rollup is filled on each shard by its own view)
+SHARDED_TABLES = {'events': 'user_id', 'orders': 'user_id', 'daily_user_activity': 'user_id'}
+LOCAL_SUFFIX = '_local'
+
+
+def parse_shards(value: str = CLICKHOUSE_SHARDS, default_port: int = 8123) -> List[Tuple[str, int]]:
+    """'clickhouse:8123,clickhouse-2:8123' -> [('clickhouse', 8123), ('clickhouse-2', 8123)]"""
+    shards = []
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        host, _, port = entry.partition(':')
+        shards.append((host, int(port) if port else default_port))
+    return shards
+
+
+def is_clustered() -> bool:
+    return bool(CLICKHOUSE_SHARDS.strip())
+
+
+def local_table(table: str) -> str:
+    """Table that holds a shard's rows: <table>_local for sharded tables, the table itself otherwise"""
+    return table + LOCAL_SUFFIX if is_clustered() and table in SHARDED_TABLES else table
+
+
+def on_cluster() -> str:
+    """ON CLUSTER clause for DDL and mutations that must reach every node"""
+    return f" ON CLUSTER {CLICKHOUSE_CLUSTER}" if is_clustered() else ""
+
+
+def cluster_source(system_table: str) -> str:
+    """A system table (system.parts, system.part_log, ...) as seen from every node"""
+    return f"clusterAllReplicas('{CLICKHOUSE_CLUSTER}', {system_table})" if is_clustered() else system_table
+
+
+def shard_of(key: int, shard_count: int) -> int:
+    return key % shard_count
+
+
+def split_rows(rows: List[Dict], column: str, shard_count: int) -> List[List[Dict]]:
+    """Row dicts grouped by owning shard"""
+    shards = [[] for _ in range(shard_count)]
+    for row in rows:
+        shards[shard_of(int(row[column]), shard_count)].append(row)
+    return shards
+
+
+def split_columns(columns: Dict, column: str, shard_count: int) -> List[Dict]:
+    """A columnar chunk (name -> NumPy array) cut into one chunk per shard, rows kept in order"""
+    owners = columns[column].astype(np.uint64) % np.uint64(shard_count)
+    return [{name: values[owners == shard] for name, values in columns.items()} for shard in range(shard_count)]
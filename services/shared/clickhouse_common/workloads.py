@@ -0,0 +1,41 @@
+"""
+Per-workload query settings and query_id tagging
+Settings a caller passes win over the workload's; the query_id names the service and workload so
+system.query_log can be grouped by who sent a query
+"""
+
+import uuid
+from typing import Dict, Optional
+
+# Reads of Distributed tables (no effect on a single node): shards aggregate locally and the initiator
+# merges their two-level states bucket by bucket; GROUP BY including user_id, the sharding key, skips
+# the merge, and a filter on user_id only asks the shards that can hold it
+DISTRIBUTED_READ_SETTINGS = {
+    'distributed_aggregation_memory_efficient': 1,
+    'optimize_distributed_group_by_sharding_key': 1,
+    'optimize_skip_unused_shards': 1,
+}
+
+WORKLOAD_SETTINGS: Dict[str, Dict] = {
+    # Dashboard panels: short aggregates a person is waiting for
+    'dashboard': {'max_execution_time': 30, **DISTRIBUTED_READ_SETTINGS},
+    # Chat questions; sql_guard adds its read budget and result limits on top
+    'interactive': {'max_execution_time': 30, **DISTRIBUTED_READ_SETTINGS},
+    # Streaming inserts and their bookkeeping queries; the streamer stops waiting after 10s as well
+    'ingest': {'max_execution_time': 10},
+    # Initial data load: large streamed INSERTs that may take as long as they need
+    'bulk_load': {'max_execution_time': 0},
+    'default': {},
+}
+
+
+def workload_settings(workload: str, settings: Optional[Dict] = None) -> Dict:
+    """The workload's settings overlaid with the caller's"""
+    if workload not in WORKLOAD_SETTINGS:
+        raise ValueError(f"Unknown workload {workload!r} (expected one of {', '.join(WORKLOAD_SETTINGS)})")
+    return {**WORKLOAD_SETTINGS[workload], **(settings or {})}
+
+
+def make_query_id(service: str, workload: str) -> str:
+    """<service>-<workload>-<random hex>, unique per query"""
+    return f"{service}-{workload}-{uuid.uuid4().hex}"
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Load generator for the ingest gateway
+Posts generated events from many concurrent clients and reports throughput, backpressure and flush latency
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+import requests
+
+from benchmark_insert_modes import BENCH_SESSION_PREFIX, cleanup, percentile
+from stream_data import ClickHouseStreamer
+
+# Benchmark events get IDs of their own, far above the streamer's, since the same payloads are posted many times
+BENCH_FIRST_EVENT_ID = 10 ** 15
+
+
+def run_client(url: str, payloads: List[bytes], stop: threading.Event, results: Dict, lock: threading.Lock):
+    """Post prepared NDJSON payloads in a loop until stopped"""
+    session = requests.Session()
+    index = 0
+    while not stop.is_set():
+        body = payloads[index % len(payloads)]
+        index += 1
+        start = time.time()
+        try:
+            response = session.post(url, data=body, headers={'Content-Type': 'application/x-ndjson'}, timeout=30)
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        latency = time.time() - start
+        with lock:
+            results['latencies'].append(latency)
+            results['status'][status] = results['status'].get(status, 0) + 1
+            if status == 202:
+                results['rows'] += response.json()['accepted']
+        if status == 429:
+            stop.wait(float(response.headers.get('Retry-After', 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ingest gateway")
+    parser.add_argument("--url", default="http://localhost:8090", help="Gateway base URL")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--rows-per-request", type=int, default=100, help="Events per POST")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--keep-data", action="store_true", help="Do not delete benchmark events afterwards")
+    args = parser.parse_args()
+
+    # Pre-generate payloads so the clients measure the gateway, not Faker. They are tagged with the
+    # benchmark session prefix and deleted afterwards
+    generator = ClickHouseStreamer(verbose=False)
+    generator.next_ids['events'] = BENCH_FIRST_EVENT_ID
+    payloads = []
+    for _ in range(50):
+        events = generator.generate_new_events(args.rows_per_request)
+        for event in events:
+            event['session_id'] = f"{BENCH_SESSION_PREFIX}{uuid.uuid4().hex[:12]}"
+        payloads.append("\n".join(json.dumps(event) for event in events).encode())
+
+    url = f"{args.url}/ingest?table=events"
+    metrics_before = requests.get(f"{args.url}/metrics.json", timeout=5).json()
+    results = {'latencies': [], 'status': {}, 'rows': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    threads = [threading.Thread(target=run_client, args=(url, payloads, stop, results, lock))
+               for _ in range(args.clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    # Let the last flushes finish before reading server-side metrics
+    time.sleep(2)
+    metrics = requests.get(f"{args.url}/metrics.json", timeout=5).json()
+    inserted = metrics['rows_total'].get('events', 0) - metrics_before['rows_total'].get('events', 0)
+    histogram = metrics['insert_latency_seconds'].get('events', {'buckets': {}, 'sum': 0})
+    flushes = metrics['inserts_total'].get('events', 0) - metrics_before['inserts_total'].get('events', 0)
+
+    requests_total = sum(results['status'].values())
+    print(f"\n📊 Ingest gateway load test ({args.clients} clients, {args.rows_per_request} rows/request)")
+    print(f"  Requests:         {requests_total:,} ({requests_total / elapsed:,.1f}/s)")
+    print(f"  Status codes:     {dict(sorted(results['status'].items()))}")
+    print(f"  Accepted rows:    {results['rows']:,} ({results['rows'] / elapsed:,.0f}/s)")
+    print(f"  Inserted rows:    {inserted:,} in {flushes:,} flushes "
+          f"(avg {inserted / max(1, flushes):,.0f} rows/flush)")
+    print(f"  Request latency:  p50 {percentile(results['latencies'], 50) * 1000:.1f}ms, "
+          f"p99 {percentile(results['latencies'], 99) * 1000:.1f}ms")
+    print(f"  Flush latency:    avg {histogram['sum'] / max(1, sum(histogram['buckets'].values())) * 1000:.1f}ms "
+          f"(histogram: {histogram['buckets']})")
+
+    if not args.keep_data:
+        cleanup(generator)
+        print(f"🧹 Deleted the benchmark events (session_id '{BENCH_SESSION_PREFIX}...')")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Insert strategy benchmark for the ClickHouse streamer
+Compares client-side batching with server-side async_insert at several producer counts
+"""
+
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+from clickhouse_common import cluster_source, local_table, on_cluster
+from stream_data import CLICKHOUSE_DB, ClickHouseStreamer
+
+BENCH_SESSION_PREFIX = "bench-"
+
+
+class BenchmarkStreamer(ClickHouseStreamer):
+    """Streamer that records insert counts and visibility probes instead of printing"""
+
+    def __init__(self, stats: Dict, lock: threading.Lock, **kwargs):
+        super().__init__(verbose=False, **kwargs)
+        self.stats = stats
+        self.lock = lock
+
+    def flush_rows(self, table: str, rows: List[Dict]) -> bool:
+        ok = super().flush_rows(table, rows)
+        with self.lock:
+            if ok:
+                self.stats['inserts'] += 1
+                self.stats['rows'] += len(rows)
+            else:
+                self.stats['failures'] += 1
+        return ok
+
+
+def run_producer(streamer: BenchmarkStreamer, stop: threading.Event, rows_per_insert: int,
+                 insert_interval: float, probe_interval: float, probes: Dict, lock: threading.Lock):
+    """Generate events at a fixed pace, tagging one event per probe interval for visibility tracking"""
+    next_probe = time.time()
+    while not stop.is_set():
+        events = streamer.generate_new_events(rows_per_insert)
+        for event in events:
+            event['session_id'] = f"{BENCH_SESSION_PREFIX}{uuid.uuid4().hex[:12]}"
+        if events and time.time() >= next_probe:
+            with lock:
+                probes[events[0]['session_id']] = time.time()
+            next_probe = time.time() + probe_interval
+        streamer.write_rows('events', events)
+        stop.wait(insert_interval)
+    streamer.flush_pending(force=True)
+
+
+def run_visibility_checker(client: ClickHouseStreamer, stop: threading.Event, probes: Dict,
+                           latencies: List[float], lock: threading.Lock):
+    """Poll for probe events until they become visible to SELECT"""
+    while not stop.is_set() or probes:
+        with lock:
+            waiting = dict(probes)
+        if waiting:
+            id_list = ", ".join(f"'{session_id}'" for session_id in waiting)
+            result = client.execute_query(
+                f"SELECT session_id FROM events WHERE session_id IN ({id_list}) FORMAT TabSeparated"
+            )
+            seen_at = time.time()
+            with lock:
+                for session_id in filter(None, result.split("\n")):
+                    if session_id in probes:
+                        latencies.append(seen_at - probes.pop(session_id))
+        if stop.is_set() and time.time() - stop.stopped_at > 30:
+            break  # give up on probes that never became visible
+        time.sleep(0.1)
+
+
+def sample_merge_pressure(client: ClickHouseStreamer, stop: threading.Event, samples: List[Dict]):
+    """Sample running merges and active part count once per second (summed over the shards of a cluster)"""
+    events = local_table('events')
+    while not stop.is_set():
+        result = client.execute_query(f"""
+            SELECT
+                (SELECT count() FROM {cluster_source('system.merges')}
+                 WHERE database = '{CLICKHOUSE_DB}' AND table = '{events}'),
+                (SELECT count() FROM {cluster_source('system.parts')}
+                 WHERE database = '{CLICKHOUSE_DB}' AND table = '{events}' AND active)
+            FORMAT TabSeparated
+        """)
+        if result:
+            merges, active_parts = result.split("\t")
+            samples.append({'merges': int(merges), 'active_parts': int(active_parts)})
+        stop.wait(1)
+
+
+def count_new_parts(client: ClickHouseStreamer, since: str) -> Dict:
+    """Count parts written since the given time, split into insert parts (level 0) and merge results"""
+    result = client.execute_query(f"""
+        SELECT countIf(level = 0), countIf(level > 0)
+        FROM {cluster_source('system.parts')}
+        WHERE database = '{CLICKHOUSE_DB}' AND table = '{local_table('events')}'
+        AND modification_time >= '{since}'
+        FORMAT TabSeparated
+    """)
+    inserted, merged = result.split("\t") if result else (0, 0)
+    return {'insert_parts': int(inserted), 'merged_parts': int(merged)}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_case(strategy: str, producers: int, args) -> Dict:
+    """Run one strategy/producer-count combination and collect its metrics"""
+    lock = threading.Lock()
+    stats = {'inserts': 0, 'rows': 0, 'failures': 0}
+    probes, latencies, merge_samples = {}, [], []
+    streamers = [
+        BenchmarkStreamer(stats, lock, insert_mode=strategy, flush_max_rows=args.flush_max_rows,
+                          flush_interval=args.flush_interval, async_insert_wait=not args.no_wait)
+        for _ in range(producers)
+    ]
+    # Keep event IDs disjoint between producers
+    for index, streamer in enumerate(streamers):
+        streamer.next_ids['events'] = (index + 1) * 10 ** 12
+    checker = ClickHouseStreamer(verbose=False)
+
+    started = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    stop = threading.Event()
+    stop.stopped_at = None
+    threads = [
+        threading.Thread(target=run_producer, args=(streamer, stop, args.rows_per_insert,
+                                                    args.insert_interval, args.probe_interval, probes, lock))
+        for streamer in streamers
+    ]
+    threads.append(threading.Thread(target=run_visibility_checker, args=(checker, stop, probes, latencies, lock)))
+    threads.append(threading.Thread(target=sample_merge_pressure, args=(checker, stop, merge_samples)))
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.stopped_at = time.time()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    parts = count_new_parts(checker, started)
+    return {
+        'strategy': strategy,
+        'producers': producers,
+        'inserts_per_sec': stats['inserts'] / elapsed,
+        'rows_per_sec': stats['rows'] / elapsed,
+        'failures': stats['failures'],
+        'parts_per_min': parts['insert_parts'] / (elapsed / 60),
+        'merged_parts': parts['merged_parts'],
+        'avg_merges': sum(s['merges'] for s in merge_samples) / max(1, len(merge_samples)),
+        'max_active_parts': max((s['active_parts'] for s in merge_samples), default=0),
+        'visibility_p50': percentile(latencies, 50),
+        'visibility_p99': percentile(latencies, 99),
+    }
+
+
+def cleanup(client: ClickHouseStreamer):
+    """Remove benchmark events"""
+    client.execute_query(f"DELETE FROM {local_table('events')}{on_cluster()} "
+                         f"WHERE startsWith(session_id, '{BENCH_SESSION_PREFIX}')")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare client-side batching with async_insert")
+    parser.add_argument("--producers", default="1,4,16", help="Comma-separated producer counts")
+    parser.add_argument("--strategies", default="batch,async", help="Comma-separated insert modes")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per case")
+    parser.add_argument("--rows-per-insert", type=int, default=10, help="Events generated per producer tick")
+    parser.add_argument("--insert-interval", type=float, default=0.2, help="Seconds between producer ticks")
+    parser.add_argument("--flush-max-rows", type=int, default=1000, help="Client-side flush threshold (batch)")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="Client-side flush age in seconds (batch)")
+    parser.add_argument("--probe-interval", type=float, default=1.0, help="Seconds between visibility probes")
+    parser.add_argument("--no-wait", action="store_true", help="Use wait_for_async_insert=0 in async mode")
+    parser.add_argument("--keep-data", action="store_true", help="Do not delete benchmark events afterwards")
+    args = parser.parse_args()
+
+    results = []
+    for strategy in args.strategies.split(","):
+        for producers in (int(p) for p in args.producers.split(",")):
+            print(f"⏱️  {strategy} with {producers} producer(s) for {args.duration:.0f}s...")
+            results.append(run_case(strategy, producers, args))
+
+    print()
+    header = (f"{'strategy':<8} {'prod':>4} {'ins/s':>8} {'rows/s':>9} {'parts/min':>10} "
+              f"{'merged':>7} {'merges':>7} {'max parts':>10} {'vis p50':>8} {'vis p99':>8} {'fail':>5}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['strategy']:<8} {r['producers']:>4} {r['inserts_per_sec']:>8.1f} {r['rows_per_sec']:>9.1f} "
+              f"{r['parts_per_min']:>10.1f} {r['merged_parts']:>7} {r['avg_merges']:>7.2f} "
+              f"{r['max_active_parts']:>10} {r['visibility_p50']:>7.2f}s {r['visibility_p99']:>7.2f}s "
+              f"{r['failures']:>5}")
+
+    if not args.keep_data:
+        cleanup(ClickHouseStreamer(verbose=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+HTTP ingest gateway for ClickHouse demo
+Accepts events and orders from many clients and coalesces them into large batched inserts
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from stream_data import ClickHouseWriter, TABLE_COLUMNS
+
+# Gateway settings (can be overridden by environment variables)
+INGEST_PORT = int(os.getenv("INGEST_PORT", "8090"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "50000"))        # flush a table at this many rows
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1"))  # or when its oldest row is this old
+INGEST_MAX_BUFFER_ROWS = int(os.getenv("INGEST_MAX_BUFFER_ROWS", "500000"))  # buffered + in-flight rows
+INGEST_MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+INGEST_FLUSH_WORKERS = int(os.getenv("INGEST_FLUSH_WORKERS", "2"))
+INGEST_FLUSH_RETRIES = int(os.getenv("INGEST_FLUSH_RETRIES", "3"))
+MAX_REPORTED_ERRORS = 20
+
+# Column types as declared in services/clickhouse/init-scripts/01-create-tables.sql
+TABLE_SCHEMAS = {
+    'events': {
+        'event_id': 'UInt64', 'user_id': 'UInt64', 'event_type': 'String', 'event_timestamp': 'DateTime',
+        'page_url': 'String', 'session_id': 'String', 'device_type': 'String', 'browser': 'String',
+        'country': 'String', 'duration_seconds': 'UInt32', 'revenue': 'Decimal(10,2)',
+    },
+    'orders': {
+        'order_id': 'UInt64', 'user_id': 'UInt64', 'product_id': 'UInt64', 'quantity': 'UInt32',
+        'order_date': 'Date', 'order_timestamp': 'DateTime', 'total_amount': 'Decimal(10,2)',
+        'status': 'String', 'payment_method': 'String',
+    },
+}
+# Columns that may be omitted by clients, with the value ClickHouse would use
+COLUMN_DEFAULTS = {'events': {'revenue': 0}, 'orders': {}}
+
+UINT_BITS = {'UInt8': 8, 'UInt32': 32, 'UInt64': 64}
+MAX_STRING_LENGTH = 4096
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def convert_value(column_type: str, value):
+    """Validate a JSON value against a ClickHouse column type and return the value to insert"""
+    if column_type in UINT_BITS:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValidationError(f"expected integer, got {type(value).__name__}")
+        if not 0 <= value < 2 ** UINT_BITS[column_type]:
+            raise ValidationError(f"{value} is out of range for {column_type}")
+        return value
+    if column_type == 'String':
+        if not isinstance(value, str):
+            raise ValidationError(f"expected string, got {type(value).__name__}")
+        if len(value) > MAX_STRING_LENGTH:
+            raise ValidationError(f"string longer than {MAX_STRING_LENGTH} characters")
+        return value
+    if column_type == 'DateTime':
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            try:
+                return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+            except (OverflowError, OSError, ValueError):
+                raise ValidationError(f"{value} is not a valid unix time")
+        try:
+            return datetime.strptime(str(value).replace('T', ' ')[:19], '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValidationError(f"invalid DateTime '{value}' (expected 'YYYY-MM-DD HH:MM:SS' or unix time)")
+    if column_type == 'Date':
+        try:
+            return datetime.strptime(str(value), '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            raise ValidationError(f"invalid Date '{value}' (expected 'YYYY-MM-DD')")
+    if column_type == 'Decimal(10,2)':
+        if isinstance(value, bool):
+            raise ValidationError("expected number, got bool")
+        try:
+            number = Decimal(str(value)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValidationError(f"invalid Decimal '{value}'")
+        if not number.is_finite():
+            raise ValidationError(f"invalid Decimal '{value}'")
+        if abs(number) >= Decimal('1e8'):
+            raise ValidationError(f"{value} is out of range for Decimal(10,2)")
+        return float(number)
+    raise ValidationError(f"unsupported column type {column_type}")
+
+
+def validate_row(table: str, row) -> Dict:
+    """Validate one row against the table schema and return it in insert order"""
+    if not isinstance(row, dict):
+        raise ValidationError("row must be a JSON object")
+    schema = TABLE_SCHEMAS[table]
+    unknown = set(row) - set(schema)
+    if unknown:
+        raise ValidationError(f"unknown columns: {', '.join(sorted(unknown))}")
+    values = dict(COLUMN_DEFAULTS[table])
+    if table == 'orders' and 'order_date' not in row and 'order_timestamp' in row:
+        values['order_date'] = str(row['order_timestamp'])[:10]
+    values.update(row)
+    missing = [column for column in schema if column not in values]
+    if missing:
+        raise ValidationError(f"missing columns: {', '.join(missing)}")
+    validated = {}
+    for column in TABLE_COLUMNS[table]:
+        try:
+            validated[column] = convert_value(schema[column], values[column])
+        except ValidationError as e:
+            raise ValidationError(f"{column}: {e}")
+        except (OverflowError, OSError, ValueError, InvalidOperation):
+            # Anything else a conversion trips over is still the client's value, not a server error
+            raise ValidationError(f"{column}: invalid value {values[column]!r}")
+    return validated
+
+
+def parse_body(body: bytes) -> List:
+    """Parse a JSON array, a single JSON object or NDJSON"""
+    text = body.decode('utf-8').strip()
+    if not text:
+        return []
+    if text[0] == '[':
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("expected a JSON array")
+        return rows
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class IngestBuffer:
+    """Bounded per-table row buffer; full buffers push back on clients instead of growing"""
+
+    def __init__(self, max_rows: int, flush_rows: int, flush_interval: float):
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.cond = threading.Condition()
+        self.rows = {table: [] for table in TABLE_SCHEMAS}
+        self.since = {table: None for table in TABLE_SCHEMAS}
+        self.in_flight = 0
+        self.closed = False
+
+    def size(self) -> int:
+        return sum(len(rows) for rows in self.rows.values()) + self.in_flight
+
+    def offer(self, table: str, rows: List[Dict]) -> bool:
+        """Append rows unless that would exceed the buffer limit"""
+        with self.cond:
+            if self.closed or self.size() + len(rows) > self.max_rows:
+                return False
+            if not self.rows[table]:
+                self.since[table] = time.time()
+            self.rows[table].extend(rows)
+            if len(self.rows[table]) >= self.flush_rows:
+                self.cond.notify()
+            return True
+
+    def _ready_table(self) -> Tuple[Optional[str], float]:
+        """Table that should be flushed now, or the seconds until the next one is due"""
+        now = time.time()
+        wait = self.flush_interval
+        for table, rows in self.rows.items():
+            if not rows:
+                continue
+            age = now - self.since[table]
+            if self.closed or len(rows) >= self.flush_rows or age >= self.flush_interval:
+                return table, 0
+            wait = min(wait, self.flush_interval - age)
+        return None, wait
+
+    def take(self) -> Tuple[Optional[str], List[Dict]]:
+        """Block until a table is due and take up to flush_rows of its rows"""
+        with self.cond:
+            while True:
+                table, wait = self._ready_table()
+                if table:
+                    batch = self.rows[table][:self.flush_rows]
+                    del self.rows[table][:self.flush_rows]
+                    self.since[table] = time.time() if self.rows[table] else None
+                    self.in_flight += len(batch)
+                    return table, batch
+                if self.closed:
+                    return None, []
+                self.cond.wait(wait)
+
+    def done(self, count: int):
+        with self.cond:
+            self.in_flight -= count
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class IngestGateway:
+    def __init__(self, writer: ClickHouseWriter, buffer: IngestBuffer, flush_workers: int = INGEST_FLUSH_WORKERS):
+        self.writer = writer
+        self.buffer = buffer
+        self.metrics = writer.metrics
+        self.counter_lock = threading.Lock()
+        self.counters = {'accepted_rows': 0, 'rejected_requests': 0, 'invalid_requests': 0, 'dropped_rows': 0}
+        self.workers = [threading.Thread(target=self.flush_loop, daemon=True) for _ in range(flush_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def count(self, name: str, value: int = 1):
+        with self.counter_lock:
+            self.counters[name] += value
+            self.metrics.set_gauge(name, self.counters[name])
+
+    def flush_loop(self):
+        """Flush due batches, retrying failed inserts before dropping them"""
+        while True:
+            table, batch = self.buffer.take()
+            if table is None:
+                return
+            for attempt in range(INGEST_FLUSH_RETRIES):
+                if self.writer.flush_rows(table, batch):
+                    break
+                time.sleep(0.5 * 2 ** attempt)
+            else:
+                self.count('dropped_rows', len(batch))
+            self.buffer.done(len(batch))
+            self.metrics.set_gauge('buffer_rows', self.buffer.size())
+
+    def ingest(self, table: str, body: bytes) -> Tuple[int, Dict]:
+        """Validate and buffer one request; returns (HTTP status, response body)"""
+        if table not in TABLE_SCHEMAS:
+            return 400, {'error': f"unknown table '{table}' (expected one of {', '.join(TABLE_SCHEMAS)})"}
+        try:
+            rows = parse_body(body)
+        except (ValueError, UnicodeDecodeError) as e:
+            self.count('invalid_requests')
+            return 400, {'error': f"invalid JSON: {e}"}
+        validated, errors = [], []
+        for index, row in enumerate(rows):
+            try:
+                validated.append(validate_row(table, row))
+            except ValidationError as e:
+                errors.append({'row': index, 'error': str(e)})
+                if len(errors) >= MAX_REPORTED_ERRORS:
+                    break
+        if errors:
+            self.count('invalid_requests')
+            return 400, {'error': 'validation failed', 'errors': errors}
+        if not self.buffer.offer(table, validated):
+            self.count('rejected_requests')
+            return 429, {'error': 'ingest buffer is full, retry later'}
+        self.count('accepted_rows', len(validated))
+        self.metrics.set_gauge('buffer_rows', self.buffer.size())
+        return 202, {'accepted': len(validated)}
+
+    def shutdown(self):
+        """Stop accepting rows and flush everything that is buffered"""
+        self.buffer.close()
+        for worker in self.workers:
+            worker.join()
+
+
+def make_handler(gateway: IngestGateway):
+    class IngestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status: int, payload: Dict, headers: Dict = None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/ingest':
+                self.send_json(404, {'error': 'not found'})
+                return
+            if self.headers.get('Content-Length') is None:
+                self.send_json(411, {'error': 'Content-Length is required'}, {'Connection': 'close'})
+                self.close_connection = True
+                return
+            try:
+                length = int(self.headers['Content-Length'])
+            except ValueError:
+                length = -1
+            if length < 0:
+                # The body cannot be skipped without a valid length, so the connection is closed
+                self.send_json(400, {'error': 'invalid Content-Length'}, {'Connection': 'close'})
+                self.close_connection = True
+                return
+            if length > INGEST_MAX_BODY_BYTES:
+                self.send_json(413, {'error': f'request body exceeds {INGEST_MAX_BODY_BYTES} bytes'},
+                               {'Connection': 'close'})
+                self.close_connection = True
+                return
+            table = parse_qs(url.query).get('table', ['events'])[0]
+            status, payload = gateway.ingest(table, self.rfile.read(length))
+            headers = {'Retry-After': '1'} if status == 429 else None
+            self.send_json(status, payload, headers)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = gateway.metrics.render_prometheus('ingest').encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == '/metrics.json':
+                self.send_json(200, gateway.metrics.snapshot())
+            elif self.path == '/health':
+                self.send_json(200, {'status': 'healthy', 'buffer_rows': gateway.buffer.size()})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            pass  # per-request logs would dominate the output under load
+
+    return IngestHandler
+
+
+def main():
+    """Main function"""
+    writer = ClickHouseWriter(verbose=False)
+    if writer.execute_query("SELECT 1") != "1":
+        print("❌ Unable to connect to ClickHouse")
+        raise SystemExit(1)
+
+    buffer = IngestBuffer(INGEST_MAX_BUFFER_ROWS, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL)
+    gateway = IngestGateway(writer, buffer)
+    server = ThreadingHTTPServer(('0.0.0.0', INGEST_PORT), make_handler(gateway))
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        print(f"\n🛑 Received signal {signum}, flushing buffered rows...")
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print("🚀 ClickHouse Ingest Gateway")
+    print(f"📥 POST http://0.0.0.0:{INGEST_PORT}/ingest?table=events|orders (NDJSON or JSON array)")
+    print(f"📦 Flush at {INGEST_FLUSH_ROWS} rows or {INGEST_FLUSH_INTERVAL}s, "
+          f"buffer limit {INGEST_MAX_BUFFER_ROWS} rows, insert mode {writer.describe_insert_mode()}")
+    print(f"📈 Metrics at http://0.0.0.0:{INGEST_PORT}/metrics\n")
+    server.serve_forever()
+    gateway.shutdown()
+    print("✅ Ingest gateway stopped gracefully")
+
+
+if __name__ == "__main__":
+    main()
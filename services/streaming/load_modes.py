@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Load-profile and replay modes for the ClickHouse streamer
+Drives inserts at a target rate and reports whether the node kept up
+"""
+
+import inspect
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet replay is optional
+    pq = None
+
+# A tick counts as "held" when at least this share of its target rows was inserted
+HOLD_TOLERANCE = 0.95
+# Upper bound on rows generated and sent in a single write
+MAX_ROWS_PER_WRITE = 10000
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class LoadProfile(ABC):
+    """Target event rate (events/second) as a function of elapsed seconds"""
+
+    @abstractmethod
+    def rate(self, elapsed: float) -> float:
+        ...
+
+
+class ConstantProfile(LoadProfile):
+    def __init__(self, rate: float = 100):
+        self.value = float(rate)
+
+    def rate(self, elapsed: float) -> float:
+        return self.value
+
+
+class DiurnalProfile(LoadProfile):
+    """Sinusoidal day/night curve between base and peak, starting at the trough"""
+
+    def __init__(self, base: float = 50, peak: float = 500, period: float = 3600):
+        self.base, self.peak, self.period = float(base), float(peak), float(period)
+
+    def rate(self, elapsed: float) -> float:
+        phase = (1 - math.cos(2 * math.pi * elapsed / self.period)) / 2
+        return self.base + (self.peak - self.base) * phase
+
+
+class BurstProfile(LoadProfile):
+    """Steady base rate with a burst of `duration` seconds every `every` seconds"""
+
+    def __init__(self, base: float = 50, burst: float = 1000, every: float = 60, duration: float = 5):
+        self.base, self.burst = float(base), float(burst)
+        self.every, self.duration = float(every), float(duration)
+
+    def rate(self, elapsed: float) -> float:
+        return self.burst if elapsed % self.every < self.duration else self.base
+
+
+class StepProfile(LoadProfile):
+    """Rate ramps up by `step` every `every` seconds until `max`"""
+
+    def __init__(self, start: float = 50, step: float = 50, every: float = 30, max: float = 5000):
+        self.start, self.step, self.every, self.max = float(start), float(step), float(every), float(max)
+
+    def rate(self, elapsed: float) -> float:
+        return min(self.max, self.start + self.step * int(elapsed // self.every))
+
+
+PROFILES = {
+    'constant': ConstantProfile,
+    'diurnal': DiurnalProfile,
+    'burst': BurstProfile,
+    'step': StepProfile,
+}
+
+
+def parse_profile(spec: str) -> LoadProfile:
+    """Parse a profile spec such as 'diurnal:base=50,peak=500,period=3600'"""
+    name, _, params = spec.partition(':')
+    if name not in PROFILES:
+        raise ValueError(f"Unknown load profile '{name}' (expected one of {', '.join(PROFILES)})")
+    allowed = list(inspect.signature(PROFILES[name]).parameters)
+    kwargs = {}
+    for item in filter(None, params.split(',')):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in allowed:
+            raise ValueError(f"Unknown parameter '{key}' for load profile '{name}' "
+                             f"(expected {', '.join(allowed)})")
+        try:
+            kwargs[key] = float(value)
+        except ValueError:
+            raise ValueError(f"Load profile parameter '{key}' must be a number, got '{value}'") from None
+    return PROFILES[name](**kwargs)
+
+
+class RateReport:
+    """Per-second target vs achieved insert rates"""
+
+    def __init__(self):
+        self.ticks = []  # (second, target_rows, achieved_rows)
+
+    def add(self, second: int, target: float, achieved: int):
+        self.ticks.append((second, target, achieved))
+
+    def held(self, target: float, achieved: int) -> bool:
+        return achieved >= target * HOLD_TOLERANCE
+
+    def summary(self) -> Dict:
+        if not self.ticks:
+            return {'ticks': 0}
+        held_ticks = [t for t in self.ticks if self.held(t[1], t[2])]
+        missed = [t for t in self.ticks if not self.held(t[1], t[2])]
+        return {
+            'ticks': len(self.ticks),
+            'target_rows': sum(t[1] for t in self.ticks),
+            'achieved_rows': sum(t[2] for t in self.ticks),
+            'held_ratio': len(held_ticks) / len(self.ticks),
+            'max_held_rate': max((t[1] for t in held_ticks), default=0.0),
+            'first_missed_rate': min((t[1] for t in missed), default=None),
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        if not s['ticks']:
+            print("⚠️ No load was generated")
+            return
+        print("\n📊 Load report")
+        print(f"  Target rows:   {s['target_rows']:,.0f}")
+        print(f"  Achieved rows: {s['achieved_rows']:,}")
+        print(f"  Seconds held:  {s['held_ratio']:.1%} (>= {HOLD_TOLERANCE:.0%} of target)")
+        print(f"  Highest held rate: {s['max_held_rate']:,.0f} events/s")
+        if s['first_missed_rate'] is not None:
+            print(f"  Lowest missed rate: {s['first_missed_rate']:,.0f} events/s (ingestion ceiling is below this)")
+        else:
+            print("  Target rate was held for the whole run")
+
+
+class RateTracker:
+    """Closes one-second ticks and records how many rows actually reached ClickHouse"""
+
+    def __init__(self, streamer, report: RateReport, table: str = 'events'):
+        self.streamer = streamer
+        self.report = report
+        self.table = table
+        self.second = 0
+        self.target = 0.0
+        self.baseline = self._inserted()
+
+    def _inserted(self) -> int:
+        return self.streamer.metrics.snapshot()['rows_total'].get(self.table, 0)
+
+    def add_target(self, rows: float):
+        self.target += rows
+
+    def maybe_close(self, elapsed: float):
+        while elapsed >= self.second + 1:
+            inserted = self._inserted()
+            self.report.add(self.second, self.target, inserted - self.baseline)
+            self.baseline = inserted
+            self.target = 0.0
+            self.second += 1
+
+
+def run_profile(streamer, profile: LoadProfile, duration: float) -> RateReport:
+    """Emit generated events following the load profile for `duration` seconds"""
+    report = RateReport()
+    tracker = RateTracker(streamer, report)
+    start = time.time()
+    emitted_target = 0.0  # cumulative rows the profile asked for
+    emitted = 0
+    last = start
+    while streamer.running:
+        now = time.time()
+        elapsed = now - start
+        if elapsed >= duration:
+            break
+        # Integrate the rate over the time since the last iteration
+        due = profile.rate(elapsed) * (now - last)
+        last = now
+        emitted_target += due
+        tracker.add_target(due)
+        count = min(int(emitted_target) - emitted, MAX_ROWS_PER_WRITE)
+        if count > 0:
+            streamer.insert_events(streamer.generate_new_events(count))
+            emitted += count
+        tracker.maybe_close(time.time() - start)
+        time.sleep(0.01 if count < MAX_ROWS_PER_WRITE else 0)
+    streamer.flush_pending(force=True)
+    tracker.maybe_close(time.time() - start)
+    return report
+
+
+def read_events(path: str) -> List[Dict]:
+    """Load recorded events from an NDJSON or Parquet file"""
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise RuntimeError("Parquet replay requires pyarrow (pip install pyarrow)")
+        return pq.read_table(path).to_pylist()
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    return datetime.strptime(str(value)[:19].replace('T', ' '), TIMESTAMP_FORMAT)
+
+
+def normalize_event(event: Dict, columns: List[str]) -> Dict:
+    """Coerce a recorded event to the generate_new_events schema"""
+    row = {column: event.get(column) for column in columns}
+    row['revenue'] = row['revenue'] or 0
+    missing = [column for column, value in row.items() if value is None and column != 'event_id']
+    if missing:
+        raise ValueError(f"Recorded event is missing columns: {', '.join(missing)}")
+    return row
+
+
+def replay_schedule(events: List[Dict], speed: float, loop: bool) -> Iterator[tuple]:
+    """Yield (offset_seconds, event) pairs in recorded order, compressed by `speed`"""
+    ordered = sorted(events, key=lambda e: e['_ts'])
+    first = ordered[0]['_ts']
+    span = (ordered[-1]['_ts'] - first).total_seconds() / speed
+    cycle = 0
+    while True:
+        for event in ordered:
+            # Keep looped cycles one second apart so they don't collide
+            yield cycle * (span + 1) + (event['_ts'] - first).total_seconds() / speed, event
+        if not loop:
+            return
+        cycle += 1
+
+
+def run_replay(streamer, path: str, columns: List[str], speed: float = 1.0, loop: bool = False,
+               duration: Optional[float] = None) -> RateReport:
+    """Replay a recorded event file at `speed`× real time with rewritten IDs and timestamps"""
+    events = []
+    for event in read_events(path):
+        row = normalize_event(event, columns)
+        row['_ts'] = parse_timestamp(row['event_timestamp'])
+        events.append(row)
+    if not events:
+        print(f"⚠️ No events found in {path}")
+        return RateReport()
+    print(f"▶️  Replaying {len(events):,} events from {path} at {speed}x")
+
+    report = RateReport()
+    tracker = RateTracker(streamer, report)
+    start = time.time()
+    start_wall = datetime.now().replace(microsecond=0)
+    batch = []
+    for offset, event in replay_schedule(events, speed, loop):
+        if not streamer.running or (duration is not None and offset >= duration):
+            break
+        # Send what is due before waiting for the next event
+        if batch and (offset > time.time() - start or len(batch) >= MAX_ROWS_PER_WRITE):
+            streamer.insert_events(batch)
+            batch = []
+        wait = offset - (time.time() - start)
+        if wait > 0:
+            time.sleep(wait)
+        tracker.maybe_close(time.time() - start)
+        row = {column: event[column] for column in columns}
+        row['event_id'] = streamer.reserve_ids('events', 'event_id', 1)
+        row['event_timestamp'] = (start_wall + timedelta(seconds=offset)).strftime(TIMESTAMP_FORMAT)
+        batch.append(row)
+        tracker.add_target(1)
+    streamer.insert_events(batch)
+    streamer.flush_pending(force=True)
+    tracker.maybe_close(time.time() - start + 1)
+    return report
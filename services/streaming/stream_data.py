@@ -4,6 +4,7 @@ Real-time data streaming script for ClickHouse demo
 Generates new data every 30 seconds while maintaining database size limits
 """
 
+import argparse
 import random
 import time
 import signal
@@ -12,8 +13,13 @@ from datetime import datetime, timedelta
 from typing import List, Dict
 import requests
 from faker import Faker
+from clickhouse_common import (SHARDED_TABLES, ClickHouseConfig, HTTPTransport, cluster_source, local_table,
+                               on_cluster, parse_shards, split_rows)
 import uuid
 
+from load_modes import parse_profile, run_profile, run_replay
+from stream_metrics import StreamMetrics, start_metrics_server
+
 fake = Faker()
 
 # Configuration
@@ -25,50 +31,237 @@ BATCH_SIZE_ORDERS = 3     # Orders to add per batch
 
 # ClickHouse connection settings (can be overridden by environment variables)
 import os
+
+# Insert strategy:
+#   batch - buffer rows client-side and flush them as one INSERT per table
+#   async - send every insert immediately and let the server buffer it (async_insert=1)
+INSERT_MODE = os.getenv("STREAM_INSERT_MODE", "batch")
+# Client-side flush thresholds (batch mode). 0 seconds flushes after every cycle.
+FLUSH_MAX_ROWS = int(os.getenv("STREAM_FLUSH_MAX_ROWS", "1000"))
+FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0"))
+# Server-side flush thresholds (async mode)
+ASYNC_INSERT_WAIT = os.getenv("STREAM_ASYNC_INSERT_WAIT", "1") == "1"
+ASYNC_INSERT_MAX_DATA_SIZE = int(os.getenv("STREAM_ASYNC_INSERT_MAX_DATA_SIZE", "1048576"))
+ASYNC_INSERT_BUSY_TIMEOUT_MS = int(os.getenv("STREAM_ASYNC_INSERT_BUSY_TIMEOUT_MS", "1000"))
+# Local HTTP port for /metrics (0 disables the endpoint)
+METRICS_PORT = int(os.getenv("STREAM_METRICS_PORT", "9102"))
+
 CLICKHOUSE_HOST = os.getenv("CLICKHOUSE_HOST", "localhost")
 CLICKHOUSE_PORT = int(os.getenv("CLICKHOUSE_PORT", "8123"))
 CLICKHOUSE_USER = os.getenv("CLICKHOUSE_USER", "demo_user")
 CLICKHOUSE_PASSWORD = os.getenv("CLICKHOUSE_PASSWORD", "demo_password")
 CLICKHOUSE_DB = os.getenv("CLICKHOUSE_DB", "demo_db")
 
-class ClickHouseStreamer:
-    def __init__(self):
-        self.base_url = f"http://{CLICKHOUSE_HOST}:{CLICKHOUSE_PORT}"
-        self.auth = (CLICKHOUSE_USER, CLICKHOUSE_PASSWORD)
-        self.params = {"database": CLICKHOUSE_DB}
+EVENT_COLUMNS = ['event_id', 'user_id', 'event_type', 'event_timestamp', 'page_url', 'session_id',
+                 'device_type', 'browser', 'country', 'duration_seconds', 'revenue']
+ORDER_COLUMNS = ['order_id', 'user_id', 'product_id', 'quantity', 'order_date', 'order_timestamp',
+                 'total_amount', 'status', 'payment_method']
+TABLE_COLUMNS = {'events': EVENT_COLUMNS, 'orders': ORDER_COLUMNS}
+
+
+def format_value(value) -> str:
+    """Format a Python value as a ClickHouse SQL literal"""
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    return str(value)
+
+
+class ClickHouseWriter:
+    """HTTP connection, insert strategy and throughput metrics shared by the streaming services"""
+    
+    def __init__(self, insert_mode: str = INSERT_MODE, flush_max_rows: int = FLUSH_MAX_ROWS,
+                 flush_interval: float = FLUSH_INTERVAL, async_insert_wait: bool = ASYNC_INSERT_WAIT,
+                 verbose: bool = True):
+        # Keep-alive connections, retries and query_id tagging; a stuck insert gives up after 10s
+        config = ClickHouseConfig(CLICKHOUSE_HOST, CLICKHOUSE_PORT, CLICKHOUSE_USER, CLICKHOUSE_PASSWORD,
+                                  CLICKHOUSE_DB, service='streaming', timeout=10)
+        self.transport = HTTPTransport(config, workload='ingest')
+        # Cluster deployment: rows go straight to the owning shard's <table>_local
+        self.shards = [HTTPTransport(config._replace(host=host, port=port), workload='ingest')
+                       for host, port in parse_shards()]
+        
+        if insert_mode not in ('batch', 'async'):
+            raise ValueError(f"Unknown insert mode: {insert_mode} (expected 'batch' or 'async')")
+        self.insert_mode = insert_mode
+        self.flush_max_rows = flush_max_rows
+        self.flush_interval = flush_interval
+        self.async_insert_wait = async_insert_wait
+        # Client-side buffers used in batch mode
+        self.pending = {table: [] for table in TABLE_COLUMNS}
+        self.pending_since = {table: None for table in TABLE_COLUMNS}
+        # Next free ID per table; looked up with max() once, then advanced locally
+        self.next_ids = {}
+        # Row count column of system.parts, looked up on first use
+        self.parts_rows = None
+        self.verbose = verbose
+        self.metrics = StreamMetrics()
+    
+    def describe_insert_mode(self) -> str:
+        """Human-readable summary of the insert strategy"""
+        if self.insert_mode == 'async':
+            return f"async (server-side buffering, wait={int(self.async_insert_wait)})"
+        return f"batch (flush at {self.flush_max_rows} rows or {self.flush_interval}s)"
+    
+    def post_query(self, query: str, settings: Dict = None) -> requests.Response:
+        """Send a query to ClickHouse, raising on HTTP errors"""
+        return self.transport.post(query, settings=settings)
+    
+    def execute_query(self, query: str, settings: Dict = None) -> str:
+        """Execute a ClickHouse query"""
+        try:
+            return self.post_query(query, settings).text.strip()
+        except Exception as e:
+            print(f"❌ Query failed: {e}")
+            return ""
+    
+    def reserve_ids(self, table: str, id_column: str, count: int) -> int:
+        """Reserve a contiguous block of IDs and return the first one"""
+        if table not in self.next_ids:
+            # Raises when the query fails: starting from a guess would hand out IDs that are already taken
+            max_id_result = self.post_query(f"SELECT max({id_column}) FROM {table}").text.strip()
+            self.next_ids[table] = int(max_id_result or 0) + 1
+        first_id = self.next_ids[table]
+        self.next_ids[table] += count
+        return first_id
+    
+    def insert_settings(self) -> Dict:
+        """ClickHouse settings attached to every INSERT for the current insert mode"""
+        if self.insert_mode != 'async':
+            return {}
+        return {
+            'async_insert': 1,
+            'wait_for_async_insert': int(self.async_insert_wait),
+            'async_insert_max_data_size': ASYNC_INSERT_MAX_DATA_SIZE,
+            'async_insert_busy_timeout_ms': ASYNC_INSERT_BUSY_TIMEOUT_MS,
+        }
+    
+    def build_insert_query(self, table: str, rows: List[Dict], target: str = None) -> str:
+        """Build an INSERT ... VALUES statement for the given rows, optionally into another target"""
+        columns = TABLE_COLUMNS[table]
+        values = [
+            "(" + ", ".join(format_value(row[column]) for column in columns) + ")"
+            for row in rows
+        ]
+        return f"INSERT INTO {target or table} ({', '.join(columns)}) VALUES " + ", ".join(values)
+    
+    def flush_rows(self, table: str, rows: List[Dict]) -> bool:
+        """Send rows to ClickHouse as a single INSERT (one per shard in the cluster deployment)"""
+        if not rows:
+            return True
+        start = time.time()
+        sent = 0
+        try:
+            if self.shards and table in SHARDED_TABLES:
+                # If one shard fails the caller re-sends every row; the shards that already have theirs
+                # drop the identical block again, as Replicated tables deduplicate inserts
+                parts = split_rows(rows, SHARDED_TABLES[table], len(self.shards))
+                for transport, part in zip(self.shards, parts):
+                    if part:
+                        query = self.build_insert_query(table, part, local_table(table))
+                        transport.post(query, settings=self.insert_settings())
+                        sent += len(query.encode())
+            else:
+                query = self.build_insert_query(table, rows)
+                self.post_query(query, self.insert_settings())
+                sent = len(query.encode())
+            self.metrics.record_insert(table, len(rows), sent, time.time() - start)
+            if self.verbose:
+                print(f"✅ Added {len(rows)} new {table}")
+            return True
+        except Exception as e:
+            self.metrics.record_failure(table)
+            print(f"❌ Failed to add {table}: {e}")
+            return False
+    
+    def flush_pending(self, force: bool = False):
+        """Flush client-side buffers that reached their row or age threshold"""
+        now = time.time()
+        for table, rows in self.pending.items():
+            if not rows:
+                continue
+            age = now - self.pending_since[table]
+            if force or len(rows) >= self.flush_max_rows or age >= self.flush_interval:
+                self.pending[table] = []
+                self.pending_since[table] = None
+                self.flush_rows(table, rows)
+    
+    def write_rows(self, table: str, rows: List[Dict]):
+        """Insert rows using the configured insert mode"""
+        if not rows:
+            return
+        if self.insert_mode == 'async':
+            # The server coalesces small inserts into parts on its own
+            self.flush_rows(table, rows)
+            return
+        if not self.pending[table]:
+            self.pending_since[table] = time.time()
+        self.pending[table].extend(rows)
+        self.flush_pending()
+    
+    def parts_rows_column(self) -> str:
+        """existing_rows_count leaves out rows removed by lightweight DELETE before their parts merge;
+        servers that do not have it only offer rows"""
+        if self.parts_rows is None:
+            found = self.execute_query("SELECT count() FROM system.columns WHERE database = 'system' "
+                                       "AND table = 'parts' AND name = 'existing_rows_count'")
+            if not found:
+                return "rows"  # lookup failed: ask again next time
+            self.parts_rows = "ifNull(existing_rows_count, rows)" if found == "1" else "rows"
+        return self.parts_rows
+    
+    def get_table_counts(self, tables: List[str]) -> Dict[str, int]:
+        """Get approximate row counts from system.parts metadata instead of scanning the tables (on servers
+        without existing_rows_count, rows removed by lightweight DELETE count until their parts merge). In the cluster
+        deployment a sharded table's rows are summed over every node's local table, while a replicated
+        one is a full copy on each node and is read from the node this client is connected to"""
+        names = {local_table(table): table for table in tables}
+        row_column = self.parts_rows_column()
+        queries = []
+        for source, group in ((cluster_source('system.parts'), [t for t in tables if t in SHARDED_TABLES]),
+                              ('system.parts', [t for t in tables if t not in SHARDED_TABLES])):
+            if group:
+                table_list = ", ".join(f"'{local_table(table)}'" for table in group)
+                queries.append(f"""
+            SELECT table, sum({row_column})
+            FROM {source}
+            WHERE database = '{CLICKHOUSE_DB}' AND active AND table IN ({table_list})
+            GROUP BY table""")
+        if not queries:
+            return {}
+        result = self.execute_query(" UNION ALL ".join(queries) + "\nFORMAT TabSeparated")
+        counts = {table: 0 for table in tables}
+        for line in filter(None, result.split("\n")):
+            table, rows = line.split("\t")
+            counts[names[table]] = int(rows)
+        return counts
+
+
+class ClickHouseStreamer(ClickHouseWriter):
+    def __init__(self, verbose: bool = True, **kwargs):
+        super().__init__(verbose=verbose, **kwargs)
         self.running = True
         self.session_counter = 1000
+        self.count_cache = {}
         
-        # Setup signal handlers for graceful shutdown
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
-        
+        if not verbose:
+            return
         print("🚀 ClickHouse Real-time Data Streamer")
         print(f"📊 Adding {BATCH_SIZE_EVENTS} events and {BATCH_SIZE_ORDERS} orders every {STREAM_INTERVAL} seconds")
         print(f"🔄 Maintaining max {MAX_EVENTS_TOTAL} events and {MAX_ORDERS_TOTAL} orders")
+        print(f"📥 Insert mode: {self.describe_insert_mode()}")
         print("🛑 Press Ctrl+C to stop gracefully\n")
     
+    def install_signal_handlers(self):
+        """Stop the streaming loop gracefully on Ctrl+C / SIGTERM; only for the streamer that is the process's
+        main loop, so scripts that borrow a streamer (the benchmarks) keep the default Ctrl+C"""
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+    
     def signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         print(f"\n🛑 Received signal {signum}, shutting down gracefully...")
         self.running = False
     
-    def execute_query(self, query: str) -> str:
-        """Execute a ClickHouse query"""
-        try:
-            response = requests.post(
-                self.base_url,
-                params=self.params,
-                data=query,
-                auth=self.auth,
-                timeout=10
-            )
-            response.raise_for_status()
-            return response.text.strip()
-        except Exception as e:
-            print(f"❌ Query failed: {e}")
-            return ""
-    
     def get_table_count(self, table: str) -> int:
         """Get current row count for a table"""
         try:
@@ -77,22 +270,30 @@ class ClickHouseStreamer:
         except:
             return 0
     
+    def get_cached_count(self, table: str) -> int:
+        """Get a row count that is refreshed at most once per stream interval"""
+        count, fetched_at = self.count_cache.get(table, (0, 0.0))
+        if not count or time.time() - fetched_at >= STREAM_INTERVAL:
+            count = self.get_table_count(table)
+            self.count_cache[table] = (count, time.time())
+        return count
+    
     def get_user_count(self) -> int:
         """Get total number of users for ID range"""
-        return self.get_table_count("users")
+        return self.get_cached_count("users")
     
     def get_product_count(self) -> int:
         """Get total number of products for ID range"""
-        return self.get_table_count("products")
+        return self.get_cached_count("products")
     
     def cleanup_old_data(self):
-        """Remove old data to maintain size limits"""
+        """Remove old data to maintain size limits (on every shard; the subquery reads the whole table)"""
         # Clean up old events
         events_count = self.get_table_count("events")
         if events_count > MAX_EVENTS_TOTAL:
             excess = events_count - MAX_EVENTS_TOTAL + BATCH_SIZE_EVENTS
             cleanup_query = f"""
-            DELETE FROM events 
+            DELETE FROM {local_table('events')}{on_cluster()}
             WHERE event_id IN (
                 SELECT event_id FROM events 
                 ORDER BY event_timestamp ASC 
@@ -107,7 +308,7 @@ class ClickHouseStreamer:
         if orders_count > MAX_ORDERS_TOTAL:
             excess = orders_count - MAX_ORDERS_TOTAL + BATCH_SIZE_ORDERS
             cleanup_query = f"""
-            DELETE FROM orders 
+            DELETE FROM {local_table('orders')}{on_cluster()}
             WHERE order_id IN (
                 SELECT order_id FROM orders 
                 ORDER BY order_timestamp ASC 
@@ -117,7 +318,7 @@ class ClickHouseStreamer:
             self.execute_query(cleanup_query)
             print(f"🧹 Cleaned up {excess} old orders")
     
-    def generate_new_events(self) -> List[Dict]:
+    def generate_new_events(self, count: int = BATCH_SIZE_EVENTS) -> List[Dict]:
         """Generate new realistic events"""
         events = []
         user_count = self.get_user_count()
@@ -126,12 +327,8 @@ class ClickHouseStreamer:
             print("⚠️ No users found, skipping event generation")
             return events
         
-        # Get the highest event_id to continue sequence
-        try:
-            max_id_result = self.execute_query("SELECT max(event_id) FROM events")
-            max_event_id = int(max_id_result) if max_id_result and max_id_result != '0' else 0
-        except:
-            max_event_id = 0
+        # Continue the event_id sequence
+        first_event_id = self.reserve_ids('events', 'event_id', count)
         
         event_types = ['page_view', 'click', 'search', 'login', 'logout', 'purchase', 
                       'add_to_cart', 'remove_from_cart', 'download', 'signup']
@@ -139,8 +336,8 @@ class ClickHouseStreamer:
         browsers = ['Chrome', 'Firefox', 'Safari', 'Edge', 'Opera']
         countries = ['US', 'UK', 'DE', 'FR', 'CA', 'AU', 'JP', 'BR', 'IN', 'RU']
         
-        for i in range(BATCH_SIZE_EVENTS):
-            event_id = max_event_id + i + 1
+        for i in range(count):
+            event_id = first_event_id + i
             user_id = random.randint(1, user_count)
             event_type = random.choice(event_types)
             
@@ -177,7 +374,7 @@ class ClickHouseStreamer:
         self.session_counter += 1
         return events
     
-    def generate_new_orders(self) -> List[Dict]:
+    def generate_new_orders(self, count: int = BATCH_SIZE_ORDERS) -> List[Dict]:
         """Generate new realistic orders"""
         orders = []
         user_count = self.get_user_count()
@@ -187,18 +384,14 @@ class ClickHouseStreamer:
             print("⚠️ No users or products found, skipping order generation")
             return orders
         
-        # Get the highest order_id to continue sequence
-        try:
-            max_id_result = self.execute_query("SELECT max(order_id) FROM orders")
-            max_order_id = int(max_id_result) if max_id_result and max_id_result != '0' else 0
-        except:
-            max_order_id = 0
+        # Continue the order_id sequence
+        first_order_id = self.reserve_ids('orders', 'order_id', count)
         
         statuses = ['completed', 'pending', 'cancelled', 'refunded']
         payment_methods = ['credit_card', 'paypal', 'bank_transfer', 'apple_pay', 'google_pay']
         
-        for i in range(BATCH_SIZE_ORDERS):
-            order_id = max_order_id + i + 1
+        for i in range(count):
+            order_id = first_order_id + i
             user_id = random.randint(1, user_count)
             product_id = random.randint(1, product_count)
             quantity = random.randint(1, 3)
@@ -229,70 +422,22 @@ class ClickHouseStreamer:
         return orders
     
     def insert_events(self, events: List[Dict]):
-        """Insert events using SQL VALUES"""
-        if not events:
-            return
-        
-        sql = "INSERT INTO events (event_id, user_id, event_type, event_timestamp, page_url, session_id, device_type, browser, country, duration_seconds, revenue) VALUES "
-        
-        values = []
-        for event in events:
-            values.append(
-                f"({event['event_id']}, {event['user_id']}, '{event['event_type']}', "
-                f"'{event['event_timestamp']}', '{event['page_url']}', '{event['session_id']}', "
-                f"'{event['device_type']}', '{event['browser']}', '{event['country']}', "
-                f"{event['duration_seconds']}, {event['revenue']})"
-            )
-        
-        query = sql + ", ".join(values)
-        result = self.execute_query(query)
-        if result == "":
-            print(f"✅ Added {len(events)} new events")
-        else:
-            print(f"❌ Failed to add events: {result}")
+        """Insert events using the configured insert mode"""
+        self.write_rows('events', events)
     
     def insert_orders(self, orders: List[Dict]):
-        """Insert orders using SQL VALUES"""
-        if not orders:
-            return
-        
-        sql = "INSERT INTO orders (order_id, user_id, product_id, quantity, order_date, order_timestamp, total_amount, status, payment_method) VALUES "
-        
-        values = []
-        for order in orders:
-            values.append(
-                f"({order['order_id']}, {order['user_id']}, {order['product_id']}, "
-                f"{order['quantity']}, '{order['order_date']}', '{order['order_timestamp']}', "
-                f"{order['total_amount']}, '{order['status']}', '{order['payment_method']}')"
-            )
-        
-        query = sql + ", ".join(values)
-        result = self.execute_query(query)
-        if result == "":
-            print(f"✅ Added {len(orders)} new orders")
-        else:
-            print(f"❌ Failed to add orders: {result}")
+        """Insert orders using the configured insert mode"""
+        self.write_rows('orders', orders)
     
     def show_stats(self):
-        """Display current database statistics"""
-        tables = ['users', 'products', 'orders', 'events']
-        print("\n📊 Current database stats:")
-        for table in tables:
-            count = self.get_table_count(table)
-            print(f"  {table}: {count:,} rows")
-        
-        # Show recent activity
-        try:
-            recent_events = self.execute_query(
-                "SELECT count() FROM events WHERE event_timestamp >= now() - INTERVAL 5 MINUTE"
-            )
-            recent_orders = self.execute_query(
-                "SELECT count() FROM orders WHERE order_timestamp >= now() - INTERVAL 5 MINUTE"
-            )
-            print(f"  📈 Recent activity (5 min): {recent_events} events, {recent_orders} orders")
-        except:
-            pass
-        print()
+        """Refresh table row counts and log a one-line throughput summary"""
+        counts = self.get_table_counts(['users', 'products', 'orders', 'events'])
+        self.metrics.set_table_rows(counts)
+        snapshot = self.metrics.snapshot()
+        tables = " ".join(f"{table}={count:,}" for table, count in counts.items())
+        failures = sum(snapshot['failures_total'].values())
+        print(f"[stats] {tables} | {snapshot['rows_per_second']:.2f} rows/s, "
+              f"{snapshot['bytes_per_second']:.0f} B/s, {failures} failed inserts")
     
     def run(self):
         """Main streaming loop"""
@@ -309,8 +454,12 @@ class ClickHouseStreamer:
                 # Generate and insert new data
                 print(f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Generating new data...")
                 
-                events = self.generate_new_events()
-                orders = self.generate_new_orders()
+                try:
+                    events = self.generate_new_events()
+                    orders = self.generate_new_orders()
+                except requests.RequestException as e:
+                    print(f"❌ Could not read the current IDs, skipping this batch: {e}")
+                    events, orders = [], []
                 
                 self.insert_events(events)
                 self.insert_orders(orders)
@@ -332,13 +481,37 @@ class ClickHouseStreamer:
         except Exception as e:
             print(f"❌ Unexpected error: {e}")
         finally:
+            self.flush_pending(force=True)
             print("✅ Data streaming stopped gracefully")
-            print("📊 Final database state:")
             self.show_stats()
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="ClickHouse real-time data streamer")
+    parser.add_argument("--mode", choices=["constant", "profile", "replay"],
+                        default=os.getenv("STREAM_MODE", "constant"),
+                        help="constant: fixed batches every interval; profile: follow a load profile; "
+                             "replay: replay a recorded event file")
+    parser.add_argument("--profile", default=os.getenv("STREAM_PROFILE", "step:start=100,step=100,every=30"),
+                        help="Load profile spec, e.g. 'diurnal:base=50,peak=500,period=3600', "
+                             "'burst:base=50,burst=1000,every=60,duration=5', 'step:start=50,step=50,every=30'")
+    parser.add_argument("--duration", type=float, default=float(os.getenv("STREAM_DURATION", "600")),
+                        help="Seconds to run in profile or replay mode")
+    parser.add_argument("--replay-file", default=os.getenv("STREAM_REPLAY_FILE"),
+                        help="NDJSON or Parquet file of recorded events")
+    parser.add_argument("--speed", type=float, default=float(os.getenv("STREAM_REPLAY_SPEED", "1")),
+                        help="Replay speed multiplier (N x real time)")
+    parser.add_argument("--loop", action="store_true", help="Loop the replay file until the duration ends")
+    return parser.parse_args()
+
 def main():
     """Main function"""
+    args = parse_args()
+    if args.mode == 'replay' and not args.replay_file:
+        print("❌ --replay-file is required in replay mode")
+        sys.exit(1)
     streamer = ClickHouseStreamer()
+    streamer.install_signal_handlers()
     
     # Test connection first
     try:
@@ -351,7 +524,17 @@ def main():
         sys.exit(1)
     
     print("✅ Connected to ClickHouse successfully\n")
-    streamer.run()
+    if METRICS_PORT:
+        start_metrics_server(streamer.metrics, METRICS_PORT)
+        print(f"📈 Metrics available at http://localhost:{METRICS_PORT}/metrics\n")
+    
+    if args.mode == 'profile':
+        print(f"📈 Following load profile '{args.profile}' for {args.duration:.0f}s")
+        run_profile(streamer, parse_profile(args.profile), args.duration).print_summary()
+    elif args.mode == 'replay':
+        run_replay(streamer, args.replay_file, EVENT_COLUMNS, args.speed, args.loop, args.duration).print_summary()
+    else:
+        streamer.run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+In-memory throughput telemetry for the streaming services
+Tracks rows, bytes, insert latency and failures, and serves them over HTTP
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+# Insert latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Window used for the rows/s and bytes/s rates
+RATE_WINDOW_SECONDS = 60
+
+
+class StreamMetrics:
+    """Thread-safe counters, rates and latency histograms for inserts"""
+
+    def __init__(self, rate_window: float = RATE_WINDOW_SECONDS):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.rate_window = rate_window
+        self.rows = {}
+        self.bytes = {}
+        self.inserts = {}
+        self.failures = {}
+        self.latency_buckets = {}
+        self.latency_sum = {}
+        self.table_rows = {}
+        self.gauges = {}
+        self.recent = deque()  # (timestamp, rows, bytes)
+
+    def record_insert(self, table: str, rows: int, size: int, seconds: float):
+        """Record a successful insert"""
+        now = time.time()
+        with self.lock:
+            self.rows[table] = self.rows.get(table, 0) + rows
+            self.bytes[table] = self.bytes.get(table, 0) + size
+            self.inserts[table] = self.inserts.get(table, 0) + 1
+            buckets = self.latency_buckets.setdefault(table, [0] * (len(LATENCY_BUCKETS) + 1))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.latency_sum[table] = self.latency_sum.get(table, 0.0) + seconds
+            self.recent.append((now, rows, size))
+            self._trim(now)
+
+    def record_failure(self, table: str):
+        """Record a failed insert"""
+        with self.lock:
+            self.failures[table] = self.failures.get(table, 0) + 1
+
+    def set_table_rows(self, counts: Dict[str, int]):
+        """Store the latest row counts read from table metadata"""
+        with self.lock:
+            self.table_rows = dict(counts)
+
+    def set_gauge(self, name: str, value: float):
+        """Store an arbitrary named gauge"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def _trim(self, now: float):
+        while self.recent and now - self.recent[0][0] > self.rate_window:
+            self.recent.popleft()
+
+    def rates(self) -> Dict[str, float]:
+        """Rows/s and bytes/s over the rate window"""
+        now = time.time()
+        with self.lock:
+            self._trim(now)
+            window = min(self.rate_window, max(now - self.started_at, 1e-9))
+            rows = sum(r for _, r, _ in self.recent)
+            size = sum(b for _, _, b in self.recent)
+        return {'rows_per_second': rows / window, 'bytes_per_second': size / window}
+
+    def snapshot(self) -> Dict:
+        """All metrics as a JSON-serializable dict"""
+        rates = self.rates()
+        with self.lock:
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'rows_per_second': rates['rows_per_second'],
+                'bytes_per_second': rates['bytes_per_second'],
+                'rows_total': dict(self.rows),
+                'bytes_total': dict(self.bytes),
+                'inserts_total': dict(self.inserts),
+                'failures_total': dict(self.failures),
+                'insert_latency_seconds': {
+                    table: {
+                        'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], buckets)),
+                        'sum': self.latency_sum.get(table, 0.0),
+                    }
+                    for table, buckets in self.latency_buckets.items()
+                },
+                'table_rows': dict(self.table_rows),
+                'gauges': dict(self.gauges),
+            }
+
+    def render_prometheus(self, prefix: str = "streamer") -> str:
+        """All metrics in the Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_rows_per_second gauge",
+            f"{prefix}_rows_per_second {snap['rows_per_second']:.3f}",
+            f"# TYPE {prefix}_bytes_per_second gauge",
+            f"{prefix}_bytes_per_second {snap['bytes_per_second']:.3f}",
+        ]
+        for name, key in (('rows_total', 'rows_total'), ('bytes_total', 'bytes_total'),
+                          ('inserts_total', 'inserts_total'), ('insert_failures_total', 'failures_total')):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for table, value in sorted(snap[key].items()):
+                lines.append(f'{prefix}_{name}{{table="{table}"}} {value}')
+        lines.append(f"# TYPE {prefix}_insert_latency_seconds histogram")
+        for table, histogram in sorted(snap['insert_latency_seconds'].items()):
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                lines.append(f'{prefix}_insert_latency_seconds_bucket{{table="{table}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_insert_latency_seconds_sum{{table="{table}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{prefix}_insert_latency_seconds_count{{table="{table}"}} {cumulative}')
+        lines.append(f"# TYPE {prefix}_table_rows gauge")
+        for table, value in sorted(snap['table_rows'].items()):
+            lines.append(f'{prefix}_table_rows{{table="{table}"}} {value}')
+        for name, value in sorted(snap['gauges'].items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(metrics: StreamMetrics, port: int, prefix: str = "streamer") -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = metrics.render_prometheus(prefix).encode()
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body = json.dumps(metrics.snapshot()).encode()
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep scrapes out of the service log
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server